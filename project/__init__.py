@@ -10,12 +10,48 @@ from project.commands import *
 import project.regex_utils
 from project.regex_utils import *
 
+import project.bit_matrix
+from project.bit_matrix import *
+
+import project.set_matrix
+from project.set_matrix import *
+
+import project.matrix_backends
+from project.matrix_backends import *
+
+import project.vertex_ordering
+from project.vertex_ordering import *
+
+import project.graph_statistics
+from project.graph_statistics import *
+
+import project.lazy_kronecker
+from project.lazy_kronecker import *
+
+import project.scc_closure
+from project.scc_closure import *
+
+import project.semirings
+from project.semirings import *
+
 import project.boolean_matrices
 from project.boolean_matrices import *
 
+import project.query_cache
+from project.query_cache import *
+
+import project.graph_index
+from project.graph_index import *
+
+import project.shared_matrices
+from project.shared_matrices import *
+
 import project.rpq
 from project.rpq import *
 
+import project.rpq_paths
+from project.rpq_paths import *
+
 import project.cfg_utils
 from project.cfg_utils import *
 
@@ -0,0 +1,368 @@
+from typing import Tuple
+
+import numpy as np
+from scipy import sparse
+
+__all__ = ["BitMatrix", "WORD_BITS"]
+
+WORD_BITS = 64
+
+_CHUNK_WORDS = 1 << 18
+
+_RUSSIANS_BITS = 8
+
+
+def _popcount(words: np.ndarray) -> int:
+    """
+    Count set bits in array of uint64 words
+
+    Parameters
+    ----------
+    words: np.ndarray
+        Array of uint64 words
+    Returns
+    -------
+    count: int
+        Number of set bits
+    """
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(words.astype("<u8").view(np.uint8)).sum())
+
+
+class BitMatrix:
+    """
+    Boolean matrix stored as rows of bits packed into uint64 words.
+    Suits small and medium matrices with dense rows, where
+    word-level OR/AND is cheaper than sparse bookkeeping.
+    Mirrors the part of scipy.sparse API used by BooleanMatrices
+
+    Attributes
+    ----------
+    words: np.ndarray
+        Array of shape (rows, ceil(cols / 64)) with packed rows,
+        bit j of row i is stored in words[i, j // 64] at position j % 64
+    shape: Tuple[int, int]
+        Shape of matrix
+    """
+
+    format = "bitset"
+
+    def __init__(self, words: np.ndarray, shape: Tuple[int, int]):
+        self.words = words
+        self.shape = shape
+
+    @staticmethod
+    def _words_count(cols: int) -> int:
+        return (cols + WORD_BITS - 1) // WORD_BITS
+
+    @classmethod
+    def zeros(cls, shape: Tuple[int, int]) -> "BitMatrix":
+        """
+        Create matrix without set bits
+
+        Parameters
+        ----------
+        shape: Tuple[int, int]
+            Shape of matrix
+        Returns
+        -------
+        matrix: BitMatrix
+            Zero matrix
+        """
+        rows, cols = shape
+        return cls(np.zeros((rows, cls._words_count(cols)), dtype=np.uint64), shape)
+
+    @classmethod
+    def identity(cls, n: int) -> "BitMatrix":
+        """
+        Create identity matrix
+
+        Parameters
+        ----------
+        n: int
+            Number of rows and columns
+        Returns
+        -------
+        matrix: BitMatrix
+            Identity matrix
+        """
+        indices = np.arange(n)
+        return cls.from_coords(indices, indices, (n, n))
+
+    @classmethod
+    def from_coords(cls, rows, cols, shape: Tuple[int, int]) -> "BitMatrix":
+        """
+        Create matrix from coordinates of set bits
+
+        Parameters
+        ----------
+        rows: Sequence[int]
+            Row indices of set bits
+        cols: Sequence[int]
+            Column indices of set bits
+        shape: Tuple[int, int]
+            Shape of matrix
+        Returns
+        -------
+        matrix: BitMatrix
+            Matrix with given bits set
+        """
+        matrix = cls.zeros(shape)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if rows.size:
+            bits = np.left_shift(np.uint64(1), (cols % WORD_BITS).astype(np.uint64))
+            np.bitwise_or.at(matrix.words, (rows, cols // WORD_BITS), bits)
+        return matrix
+
+    @classmethod
+    def from_sparse(cls, matrix) -> "BitMatrix":
+        """
+        Create matrix from scipy sparse matrix
+
+        Parameters
+        ----------
+        matrix: spmatrix
+            Sparse boolean matrix
+        Returns
+        -------
+        matrix: BitMatrix
+            Packed representation of matrix
+        """
+        if isinstance(matrix, BitMatrix):
+            return matrix
+        rows, cols = matrix.nonzero()
+        return cls.from_coords(rows, cols, matrix.shape)
+
+    @classmethod
+    def from_dense(cls, dense: np.ndarray) -> "BitMatrix":
+        """
+        Create matrix by packing dense boolean array
+
+        Parameters
+        ----------
+        dense: np.ndarray
+            Two-dimensional boolean array
+        Returns
+        -------
+        matrix: BitMatrix
+            Packed representation of array
+        """
+        rows, cols = dense.shape
+        packed = np.zeros((rows, cls._words_count(cols) * 8), dtype=np.uint8)
+        packed[:, : (cols + 7) // 8] = np.packbits(dense, axis=1, bitorder="little")
+        words = packed.view("<u8").astype(np.uint64)
+        return cls(words, (rows, cols))
+
+    def to_dense(self, rows=slice(None)) -> np.ndarray:
+        """
+        Unpack rows of matrix into dense boolean array
+
+        Parameters
+        ----------
+        rows: slice
+            Rows to unpack, all by default
+        Returns
+        -------
+        dense: np.ndarray
+            Two-dimensional boolean array
+        """
+        as_bytes = self.words[rows].astype("<u8").view(np.uint8)
+        bits = np.unpackbits(as_bytes, axis=1, bitorder="little")
+        return bits[:, : self.shape[1]].astype(bool)
+
+    @property
+    def nnz(self) -> int:
+        return _popcount(self.words)
+
+    @property
+    def size(self) -> int:
+        return self.nnz
+
+    @property
+    def nbytes(self) -> int:
+        return self.words.nbytes
+
+    @property
+    def T(self) -> "BitMatrix":
+        return self.transpose()
+
+    def sum(self) -> int:
+        return self.nnz
+
+    def copy(self) -> "BitMatrix":
+        return BitMatrix(self.words.copy(), self.shape)
+
+    def transpose(self) -> "BitMatrix":
+        return BitMatrix.from_dense(self.to_dense().T)
+
+    def nonzero(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get coordinates of set bits in row-major order
+
+        Returns
+        -------
+        coords: Tuple[np.ndarray, np.ndarray]
+            Row and column indices of set bits
+        """
+        word_rows, word_cols = np.nonzero(self.words)
+        rows, cols = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for start in range(0, word_rows.size, _CHUNK_WORDS):
+            chunk = slice(start, start + _CHUNK_WORDS)
+            as_bytes = self.words[word_rows[chunk], word_cols[chunk]].astype("<u8")
+            bits = np.unpackbits(
+                as_bytes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little"
+            )
+            word_idx, bit_idx = np.nonzero(bits)
+            rows.append(word_rows[chunk][word_idx])
+            cols.append(word_cols[chunk][word_idx] * WORD_BITS + bit_idx)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def asformat(self, format: str):
+        """
+        Convert matrix to given format
+
+        Parameters
+        ----------
+        format: str
+            "bitset" or any scipy.sparse format name
+        Returns
+        -------
+        matrix: BitMatrix | spmatrix
+            Matrix in given format
+        """
+        if format == self.format:
+            return self
+        rows, cols = self.nonzero()
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=self.shape
+        )
+        return matrix.asformat(format)
+
+    def tocsr(self) -> sparse.csr_matrix:
+        return self.asformat("csr")
+
+    def __getitem__(self, key: Tuple[int, int]) -> bool:
+        i, j = key
+        return bool((int(self.words[i, j // WORD_BITS]) >> (j % WORD_BITS)) & 1)
+
+    def __setitem__(self, key: Tuple[int, int], value: bool):
+        i, j = key
+        bit = np.uint64(1) << np.uint64(j % WORD_BITS)
+        if value:
+            self.words[i, j // WORD_BITS] |= bit
+        else:
+            self.words[i, j // WORD_BITS] &= ~bit
+
+    def __add__(self, other) -> "BitMatrix":
+        other = BitMatrix.from_sparse(other)
+        if self.shape != other.shape:
+            raise ValueError(f"Inconsistent shapes: {self.shape} and {other.shape}")
+        return BitMatrix(self.words | other.words, self.shape)
+
+    __radd__ = __add__
+    __or__ = __add__
+
+    def __matmul__(self, other) -> "BitMatrix":
+        """
+        Boolean matrix product.
+        For sparse self, rows of other selected by set bits of each row of self
+        are gathered and merged with word-level OR.
+        Otherwise, for every row k of other, word-level AND extracts rows of self
+        having bit k set and word-level OR merges row k of other into them
+
+        Parameters
+        ----------
+        other: BitMatrix | spmatrix
+            Right-hand side matrix
+        Returns
+        -------
+        product: BitMatrix
+            Boolean product of matrices
+        """
+        other = BitMatrix.from_sparse(other)
+        if self.shape[1] != other.shape[0]:
+            raise ValueError(f"Inconsistent shapes: {self.shape} and {other.shape}")
+        result = BitMatrix.zeros((self.shape[0], other.shape[1]))
+        nonempty = np.flatnonzero(other.words.any(axis=1))
+        if self._prefers_gather(other, nonempty.size):
+            self._gather_product(other, result)
+            return result
+        for k in nonempty:
+            column = self.words[:, k // WORD_BITS] >> np.uint64(k % WORD_BITS)
+            rows = np.flatnonzero(column & np.uint64(1))
+            if rows.size:
+                result.words[rows] |= other.words[k]
+        return result
+
+    def _prefers_gather(self, other: "BitMatrix", nonempty_rows: int) -> bool:
+        """
+        Check whether gathering rows of other by set bits of self
+        touches fewer words than scanning columns of self
+        """
+        return self.nnz * other.words.shape[1] < nonempty_rows * self.shape[0]
+
+    def _gather_product(self, other: "BitMatrix", result: "BitMatrix"):
+        """
+        Compute boolean product of sparse self and other into result
+        by OR-reducing rows of other selected by set bits of self
+        """
+        rows, cols = self.nonzero()
+        chunk = max(1, _CHUNK_WORDS // max(1, other.words.shape[1]))
+        for start in range(0, rows.size, chunk):
+            chunk_rows = rows[start : start + chunk]
+            starts = np.flatnonzero(np.diff(chunk_rows, prepend=-1))
+            reduced = np.bitwise_or.reduceat(
+                other.words[cols[start : start + chunk]], starts, axis=0
+            )
+            result.words[chunk_rows[starts]] |= reduced
+
+    def four_russians(self, other) -> "BitMatrix":
+        """
+        Boolean matrix product by the method of Four Russians.
+        Rows of other are split into blocks of 8, for every block a table of
+        ORs of all 256 subsets of its rows is built, and every row of self
+        picks one entry of the table by the byte of its bits over the block.
+        Sparse self is multiplied by gathering rows as in __matmul__
+
+        Parameters
+        ----------
+        other: BitMatrix | spmatrix
+            Right-hand side matrix
+        Returns
+        -------
+        product: BitMatrix
+            Boolean product of matrices
+        """
+        other = BitMatrix.from_sparse(other)
+        if self.shape[1] != other.shape[0]:
+            raise ValueError(f"Inconsistent shapes: {self.shape} and {other.shape}")
+        result = BitMatrix.zeros((self.shape[0], other.shape[1]))
+        nonempty = other.words.any(axis=1)
+        if self._prefers_gather(other, np.count_nonzero(nonempty)):
+            self._gather_product(other, result)
+            return result
+        keys = self.words.astype("<u8").view(np.uint8)
+        table = np.zeros((1 << _RUSSIANS_BITS, other.words.shape[1]), dtype=np.uint64)
+        for block in range(0, other.shape[0], _RUSSIANS_BITS):
+            block_rows = range(block, min(block + _RUSSIANS_BITS, other.shape[0]))
+            if not nonempty[block_rows.start : block_rows.stop].any():
+                continue
+            block_keys = keys[:, block // _RUSSIANS_BITS]
+            rows = np.flatnonzero(block_keys)
+            if not rows.size:
+                continue
+            for bit, row in enumerate(block_rows):
+                size = 1 << bit
+                np.bitwise_or(
+                    table[:size], other.words[row], out=table[size : 2 * size]
+                )
+            result.words[rows] |= table[block_keys[rows]]
+        return result
+
+    def __rmatmul__(self, other) -> "BitMatrix":
+        return BitMatrix.from_sparse(other) @ self
+
+    def __repr__(self):
+        return f"<BitMatrix of shape {self.shape} with {self.nnz} set bits>"
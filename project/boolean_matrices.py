@@ -1,12 +1,126 @@
+import copy
+import json
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Callable, Dict
+
+import numpy as np
 from pyformlang.cfg import Variable
-from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State, Symbol
 from scipy import sparse
 
+from project.matrix_backends import (
+    MatrixBackend,
+    get_backend,
+    default_backend_name,
+    AUTO_BACKEND,
+)
+from project.graph_statistics import GraphStatistics
+from project.lazy_kronecker import LazyIntersection
 from project.rsm_utils import RSM, Box
+from project.scc_closure import CondensedClosure, condensed_closure
+from project.semirings import get_semiring
+from project.vertex_ordering import vertex_order
+
+__all__ = [
+    "BooleanMatrices",
+    "BITSET_MAX_STATES",
+    "BITSET_MIN_DENSITY",
+    "CLOSURE_ALGORITHMS",
+    "STORAGE_FORMAT_VERSION",
+]
+
+CLOSURE_ALGORITHMS = ("squaring", "semi-naive", "scc")
+
+BITSET_MAX_STATES = 8192
+BITSET_MIN_DENSITY = 0.001
+
+STORAGE_FORMAT_VERSION = 1
+_HEADER_FILE = "header.json"
+_STATISTICS_FILE = "statistics.json"
+
+
+def _encode_state(value):
+    """
+    Encode value of state for JSON header, tuples are kept as {"tuple": [...]}
+    so that they are read back as tuples instead of lists
+
+    Raises
+    ------
+    ValueError
+        If value is neither JSON scalar nor tuple of such values
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, tuple):
+        return {"tuple": [_encode_state(item) for item in value]}
+    raise ValueError(
+        f"Cannot export state {value!r} of type {type(value).__name__}: "
+        "states should be JSON scalars or tuples of them"
+    )
+
+
+def _decode_state(value):
+    """
+    Decode value of state encoded by _encode_state
+    """
+    if isinstance(value, dict):
+        return tuple(_decode_state(item) for item in value["tuple"])
+    return value
+
+
+class _IdentityIndexes(Mapping):
+    """
+    Read-only mapping of states 0..n-1 to themselves,
+    used as state_indexes of product automata instead of materialized dict
+    """
+
+    def __init__(self, n: int):
+        self.n = n
 
-__all__ = ["BooleanMatrices"]
+    def __getitem__(self, state):
+        if state not in self:
+            raise KeyError(state)
+        return state
 
-from scipy.sparse import dok_matrix
+    def __contains__(self, state):
+        return isinstance(state, (int, np.integer)) and 0 <= state < self.n
+
+    def __iter__(self):
+        return iter(range(self.n))
+
+    def __len__(self):
+        return self.n
+
+
+class _LazyStateIndexes(Mapping):
+    """
+    Read-only mapping of states to indices built by given function on first access,
+    used as state_indexes of automata built from integer offsets
+    """
+
+    def __init__(self, build: Callable[[], Dict], n: int):
+        self._build = build
+        self._mapping = None
+        self.n = n
+
+    @property
+    def mapping(self) -> Dict:
+        if self._mapping is None:
+            self._mapping = self._build()
+        return self._mapping
+
+    def __getitem__(self, state):
+        return self.mapping[state]
+
+    def __contains__(self, state):
+        return state in self.mapping
+
+    def __iter__(self):
+        return iter(self.mapping)
+
+    def __len__(self):
+        return self.n
 
 
 class BooleanMatrices:
@@ -18,16 +132,59 @@ class BooleanMatrices:
     num_states: int
         Number of states in automaton
     start_states: Set[State]
-        Set of start states of automaton
+        Set of start states of automaton,
+        built on first access for automata created from masks, see start_mask
     final_states: Set[State]
-        Set of final states of automaton
-    bool_matrices: Dict[Symbol, dok_matrix]
-        Mapping of labels to boolean matrices
+        Set of final states of automaton,
+        built on first access for automata created from masks, see final_mask
+    bool_matrices: Dict[Symbol, Any]
+        Mapping of labels to boolean matrices of storage backend type
     state_indexes: Dict[State, int]
         Mapping of states to their indices
+    backend: str
+        Requested matrix backend, name from project.matrix_backends registry or "auto".
+        "csr" keeps matrices in CSR from construction onward,
+        "csr-parallel" stores matrices as "csr" and multiplies row blocks
+        of left operand in a thread pool (see ParallelScipyBackend),
+        "dok" is the legacy format suitable for cell-by-cell updates,
+        "bitset" packs matrix rows into uint64 words (see BitMatrix),
+        "four-russians" stores matrices as "bitset" and multiplies them
+        by the method of Four Russians,
+        "sets" stores Python sets of columns (see SetMatrix),
+        "auto" picks "bitset" for automata with at most BITSET_MAX_STATES states
+        and label density of at least BITSET_MIN_DENSITY, "csr" otherwise.
+        Defaults to value of FLC_MATRIX_BACKEND environment variable or "auto"
+    storage: str
+        Name of backend actually storing label matrices, resolved from backend
+        when matrices are built
+    closure_iterations: int
+        Number of matrix multiplications done by the last transitive_closure call
+    version: int
+        Number of changes made by add_edge and remove_edge
+    label_versions: Dict[Symbol, int]
+        Mapping of labels to version of their last change, see changed_labels
+    permutation: np.ndarray
+        For matrices made by reordered, index of every state in matrices
+        they were made from, None otherwise
     """
 
-    def __init__(self, n_automaton: NondeterministicFiniteAutomaton = None):
+    def __init__(
+        self,
+        n_automaton: NondeterministicFiniteAutomaton = None,
+        backend: str = None,
+    ):
+        backend = backend or default_backend_name()
+        if backend != AUTO_BACKEND:
+            get_backend(backend)
+        self.backend = backend
+        self.storage = None if backend == AUTO_BACKEND else backend
+        self.closure_iterations = 0
+        self.version = 0
+        self.label_versions = {}
+        self._closure = None
+        self._statistics = None
+        self._adjacency = {}
+        self.permutation = None
         if n_automaton is None:
             self.num_states = 0
             self.start_states = set()
@@ -55,7 +212,7 @@ class BooleanMatrices:
         """
         automaton = NondeterministicFiniteAutomaton()
         for label, bool_matrix in self.bool_matrices.items():
-            for s_from, s_to in zip(*bool_matrix.nonzero()):
+            for s_from, s_to in zip(*self.matrix_backend.nonzero(bool_matrix)):
                 automaton.add_transition(s_from, label, s_to)
 
         for state in self.start_states:
@@ -69,131 +226,941 @@ class BooleanMatrices:
     def get_states(self):
         return self.state_indexes.keys()
 
+    def get_states_by_index(self) -> list:
+        """
+        Get states ordered by their indices
+
+        Returns
+        -------
+        states: List[State]
+            List with state of index i at position i
+        """
+        states = [None] * self.num_states
+        for state, index in self.state_indexes.items():
+            states[index] = state
+        return states
+
+    def with_states(
+        self, start_states: set = None, final_states: set = None, labels: set = None
+    ):
+        """
+        Get copy sharing label matrices with given start and final states.
+        Labels added to or replaced in copy are not seen by self
+
+        Parameters
+        ----------
+        start_states: set
+            Start states of copy, start states of self by default
+        final_states: set
+            Final states of copy, final states of self by default
+        labels: set
+            Labels of matrices kept in copy, all by default
+        Returns
+        -------
+        bm: BooleanMatrices
+            Shallow copy of self
+        Raises
+        ------
+        ValueError
+            If some of given states are unknown
+        """
+        bm = copy.copy(self)
+        bm.bool_matrices = {
+            label: matrix
+            for label, matrix in self.bool_matrices.items()
+            if labels is None or label in labels
+        }
+        if labels is not None:
+            bm._statistics = None
+        bm._closure = None
+        bm._adjacency = {}
+        for name, states in (("start", start_states), ("final", final_states)):
+            if states is None:
+                continue
+            unknown = {s for s in states if s not in self.state_indexes}
+            if unknown:
+                raise ValueError(f"Invalid {name} states: {unknown}")
+            setattr(
+                bm,
+                f"{name}_states",
+                {s if isinstance(s, State) else State(s) for s in states},
+            )
+        return bm
+
     def get_start_states(self):
         return self.start_states.copy()
 
     def get_final_states(self):
         return self.final_states.copy()
 
-    def transitive_closure(self):
+    @property
+    def start_states(self):
+        if self._start_states is None:
+            self._start_states = self._states_at(np.flatnonzero(self._start_mask))
+            self._start_mask = None
+        return self._start_states
+
+    @start_states.setter
+    def start_states(self, states):
+        self._start_states = states
+        self._start_mask = None
+
+    @property
+    def final_states(self):
+        if self._final_states is None:
+            self._final_states = self._states_at(np.flatnonzero(self._final_mask))
+            self._final_mask = None
+        return self._final_states
+
+    @final_states.setter
+    def final_states(self, states):
+        self._final_states = states
+        self._final_mask = None
+
+    def start_mask(self) -> np.ndarray:
+        """
+        Get start states as boolean mask over state indices
+
+        Returns
+        -------
+        mask: np.ndarray
+            Boolean array of length num_states
+        """
+        if self._start_states is None:
+            return self._start_mask
+        return self._states_mask(self._start_states)
+
+    def final_mask(self) -> np.ndarray:
+        """
+        Get final states as boolean mask over state indices
+
+        Returns
+        -------
+        mask: np.ndarray
+            Boolean array of length num_states
+        """
+        if self._final_states is None:
+            return self._final_mask
+        return self._states_mask(self._final_states)
+
+    def _states_at(self, indices: np.ndarray) -> set:
+        if isinstance(self.state_indexes, _IdentityIndexes):
+            return set(indices.tolist())
+        states = self.get_states_by_index()
+        return {states[index] for index in indices}
+
+    def _states_mask(self, states) -> np.ndarray:
+        mask = np.zeros(self.num_states, dtype=bool)
+        indexes = [self.state_indexes[s] for s in states if s in self.state_indexes]
+        mask[np.asarray(indexes, dtype=np.int64)] = True
+        return mask
+
+    @property
+    def matrix_backend(self) -> MatrixBackend:
+        """
+        Backend storing label matrices, resolved on first access for "auto"
+        """
+        if self.storage is None:
+            self._resolve_storage(
+                sum(matrix.nnz for matrix in self.bool_matrices.values())
+            )
+        return get_backend(self.storage)
+
+    def closure(self, algorithm: str = "squaring"):
+        """
+        Transitive closure of boolean matrices cached between calls.
+        The cache is kept consistent by add_edge and remove_edge,
+        other modifications of label matrices require invalidate_closure
+
+        Parameters
+        ----------
+        algorithm: str
+            Algorithm computing closure when it is not cached,
+            see transitive_closure
+        Returns
+        -------
+        tc: Any
+            Transitive closure of shape (num_states, num_states)
+            of storage backend type
+        """
+        if self._closure is None:
+            ops = self.matrix_backend
+            if self.bool_matrices:
+                tc = self.transitive_closure(algorithm)
+                if isinstance(tc, CondensedClosure):
+                    tc = tc.materialize()
+                self._closure = ops.convert(tc)
+            else:
+                self._closure = ops.zeros((self.num_states, self.num_states))
+        return self._closure
+
+    def invalidate_closure(self):
+        """
+        Drop cached transitive closure, see closure
+        """
+        self._closure = None
+
+    def statistics(self) -> GraphStatistics:
+        """
+        Statistics of label matrices cached between calls
+        and dropped by add_edge and remove_edge.
+        Statistics are saved by save and read back by load
+
+        Returns
+        -------
+        statistics: GraphStatistics
+            Per-label statistics of transitions
+        """
+        if self._statistics is None:
+            self._statistics = GraphStatistics.from_boolean_matrices(self)
+        return self._statistics
+
+    def adjacency_lists(self, label, transposed: bool = False):
+        """
+        Adjacency lists of label matrix in CSR form cached between calls
+        and dropped by add_edge and remove_edge
+
+        Parameters
+        ----------
+        label: Any
+            Label of matrix
+        transposed: bool
+            Whether lists of predecessors are built instead of successors
+        Returns
+        -------
+        lists: Tuple[np.ndarray, np.ndarray]
+            Offsets of lists of states and concatenated lists
+        """
+        key = (label, transposed)
+        if key not in self._adjacency:
+            rows, cols = self.matrix_backend.nonzero(self.bool_matrices[label])
+            if transposed:
+                rows, cols = cols, rows
+            order = np.argsort(rows, kind="stable")
+            counts = np.bincount(rows, minlength=self.num_states)
+            self._adjacency[key] = (
+                np.concatenate(([0], np.cumsum(counts))),
+                np.asarray(cols, dtype=np.int64)[order],
+            )
+        return self._adjacency[key]
+
+    def add_edge(self, s_from, label, s_to):
+        """
+        Add labelled transition in place, creating missing states and label.
+        Cached closure is extended by pairs (x, y) such that x reaches s_from
+        and s_to reaches y, which takes one outer product
+
+        Parameters
+        ----------
+        s_from: State
+            State transition starts from
+        label: Symbol
+            Label of transition
+        s_to: State
+            State transition ends in
+        """
+        i, j = self._state_index(s_from), self._state_index(s_to)
+        ops = self.matrix_backend
+        matrix = self.bool_matrices.get(label)
+        if matrix is not None and matrix[i, j]:
+            return
+        edge = ops.from_coords([i], [j], (self.num_states, self.num_states))
+        self.bool_matrices[label] = edge if matrix is None else ops.add(matrix, edge)
+        self._touch(label)
+
+        if self._closure is None or self._closure[i, j]:
+            return
+        to_source = ops.add(
+            self._column(i), ops.from_coords([i], [0], (self.num_states, 1))
+        )
+        from_target = ops.add(
+            self._row(j), ops.from_coords([0], [j], (1, self.num_states))
+        )
+        self._closure = ops.add(self._closure, ops.multiply(to_source, from_target))
+
+    def remove_edge(self, s_from, label, s_to):
+        """
+        Remove labelled transition in place.
+        Rows of cached closure are recomputed only for states
+        reaching s_from, the only ones which may lose reachable states
+
+        Parameters
+        ----------
+        s_from: State
+            State transition starts from
+        label: Symbol
+            Label of transition
+        s_to: State
+            State transition ends in
+        Raises
+        ------
+        ValueError
+            If there is no such transition
+        """
+        matrix = self.bool_matrices.get(label)
+        i = self.state_indexes.get(s_from)
+        j = self.state_indexes.get(s_to)
+        if matrix is None or i is None or j is None or not matrix[i, j]:
+            raise ValueError(f"No transition {s_from} -{label}-> {s_to}")
+        ops = self.matrix_backend
+        edge = ops.from_coords([i], [j], (self.num_states, self.num_states))
+        self.bool_matrices[label] = ops.subtract(matrix, edge)
+        self._touch(label)
+
+        if self._closure is None or any(
+            other[i, j] for other in self.bool_matrices.values()
+        ):
+            return
+        sources = ops.nonzero(self._column(i))[0]
+        self._closure = self._recompute_rows(np.union1d(sources, [i]))
+
+    def changed_labels(self, since: int) -> set:
+        """
+        Get labels changed after given version, results computed from
+        other labels only are still valid
+
+        Parameters
+        ----------
+        since: int
+            Version to compare with
+        Returns
+        -------
+        labels: Set[Symbol]
+            Labels changed after given version
+        """
+        return {
+            label for label, version in self.label_versions.items() if version > since
+        }
+
+    def _touch(self, label):
+        self._statistics = None
+        self._adjacency.pop((label, False), None)
+        self._adjacency.pop((label, True), None)
+        self.version += 1
+        self.label_versions[label] = self.version
+
+    def _state_index(self, state) -> int:
+        """
+        Get index of state, appending new state when it is missing
+        """
+        if state in self.state_indexes:
+            return self.state_indexes[state]
+        if not isinstance(self.state_indexes, dict):
+            raise ValueError(f"Cannot add state {state}: state indexes are read-only")
+        self.state_indexes[
+            state if isinstance(state, State) else State(state)
+        ] = self.num_states
+        self.num_states += 1
+        ops = self.matrix_backend
+        shape = (self.num_states, self.num_states)
+        for label, matrix in self.bool_matrices.items():
+            self.bool_matrices[label] = ops.from_coords(*ops.nonzero(matrix), shape)
+        self._adjacency = {}
+        if self._closure is not None:
+            self._closure = ops.from_coords(*ops.nonzero(self._closure), shape)
+        return self.num_states - 1
+
+    def _column(self, index: int):
+        """
+        Column of cached closure as matrix of shape (num_states, 1)
+        """
+        ops = self.matrix_backend
+        selector = ops.from_coords([index], [0], (self.num_states, 1))
+        return ops.multiply(self._closure, selector)
+
+    def _row(self, index: int):
+        """
+        Row of cached closure as matrix of shape (1, num_states)
+        """
+        ops = self.matrix_backend
+        selector = ops.from_coords([0], [index], (1, self.num_states))
+        return ops.multiply(selector, self._closure)
+
+    def _recompute_rows(self, sources: np.ndarray):
+        """
+        Replace rows of cached closure for given states by states reachable
+        from them, found with breadth-first search over label matrices
+
+        Parameters
+        ----------
+        sources: np.ndarray
+            Sorted indices of states
+        Returns
+        -------
+        tc: Any
+            Updated closure
+        """
+        ops = self.matrix_backend
+        n, k = self.num_states, sources.size
+        adjacency = self.adjacency_matrix()
+        scatter = ops.from_coords(sources, np.arange(k), (n, k))
+        reached = ops.multiply(ops.transpose(scatter), adjacency)
+        frontier = reached
+        while ops.nnz(frontier):
+            frontier = ops.subtract(ops.multiply(frontier, adjacency), reached)
+            reached = ops.add(reached, frontier)
+
+        kept = np.setdiff1d(np.arange(n), sources)
+        keep = ops.from_coords(kept, kept, (n, n))
+        return ops.add(
+            ops.multiply(keep, self._closure), ops.multiply(scatter, reached)
+        )
+
+    def transitive_closure(self, algorithm: str = "squaring"):
         """
         Computes transitive closure of boolean matrices
+
+        Parameters
+        ----------
+        algorithm: str
+            One of CLOSURE_ALGORITHMS.
+            "squaring" repeats tc += tc @ tc until closure stops growing,
+            which takes a logarithmic number of multiplications of full matrices.
+            "semi-naive" multiplies only pairs discovered on the previous step
+            by adjacency matrix, which is cheaper on long chain-like automata.
+            "scc" condenses strongly connected components and propagates
+            reachability over the condensation in topological order,
+            which is cheaper on automata with large strongly connected components
         Returns
         -------
-        tc: dok_matrix
-            Transitive closure of boolean matrices
+        tc: Any
+            Transitive closure of boolean matrices of storage backend type,
+            CondensedClosure expanding pairs of states on demand for "scc"
+        Raises
+        ------
+        ValueError
+            If algorithm is unknown
         """
+        if algorithm not in CLOSURE_ALGORITHMS:
+            raise ValueError(
+                f"Unknown closure algorithm: {algorithm}, "
+                f"expected one of {CLOSURE_ALGORITHMS}"
+            )
+        ops = self.matrix_backend
+        self.closure_iterations = 0
         if not self.bool_matrices.values():
-            return dok_matrix((1, 1))
-        tc = sum(bm for bm in self.bool_matrices.values())
-        prev_nnz = tc.nnz
+            return ops.zeros((1, 1))
+        adjacency = self.adjacency_matrix()
+        if algorithm == "semi-naive":
+            return self._semi_naive_closure(adjacency)
+        if algorithm == "scc":
+            return condensed_closure(adjacency, ops)
+
+        tc = adjacency
+        prev_nnz = ops.nnz(tc)
         new_nnz = 0
 
         while prev_nnz != new_nnz:
-            tc += tc @ tc
-            prev_nnz, new_nnz = new_nnz, tc.nnz
+            tc = ops.add(tc, ops.multiply(tc, tc))
+            prev_nnz, new_nnz = new_nnz, ops.nnz(tc)
+            self.closure_iterations += 1
+
+        return tc
+
+    def _semi_naive_closure(self, adjacency):
+        """
+        Computes transitive closure multiplying only newly discovered pairs.
+        For sparse layouts discovered pairs are kept in levels of geometrically
+        decreasing size, so that filtering out known pairs does not touch
+        the whole closure on every step and each pair is merged
+        a logarithmic number of times
+
+        Parameters
+        ----------
+        adjacency: Any
+            Union of label matrices
+        Returns
+        -------
+        tc: Any
+            Transitive closure of adjacency matrix
+        """
+        ops = self.matrix_backend
+        levels = [adjacency]
+        delta = adjacency
+        while ops.nnz(delta):
+            delta = ops.multiply(delta, adjacency)
+            for level in levels:
+                delta = ops.subtract(delta, level)
+            self.closure_iterations += 1
+            if not ops.nnz(delta):
+                break
+            levels.append(delta)
+            while len(levels) > 1 and (
+                not ops.sparse_layout or 2 * ops.nnz(levels[-1]) > ops.nnz(levels[-2])
+            ):
+                last = levels.pop()
+                levels[-1] = ops.add(levels[-1], last)
 
+        tc = levels[0]
+        for level in levels[1:]:
+            tc = ops.add(tc, level)
         return tc
 
+    def adjacency_matrix(self):
+        """
+        Union of all label matrices
+
+        Returns
+        -------
+        adjacency: Any
+            Boolean matrix of storage backend type
+        """
+        ops = self.matrix_backend
+        adjacency = ops.zeros((self.num_states, self.num_states))
+        for bm in self.bool_matrices.values():
+            adjacency = ops.add(adjacency, ops.convert(bm))
+        return adjacency
+
+    def weighted_closure(self, semiring, sources: np.ndarray = None):
+        """
+        Computes closure of label matrices over semiring,
+        e.g. numbers of paths or lengths of shortest paths between states
+
+        Parameters
+        ----------
+        semiring: str | Semiring
+            Semiring or name of semiring, see project.semirings
+        sources: np.ndarray
+            Indices of states to compute rows for, all states by default
+        Returns
+        -------
+        closure: sparse.csr_matrix
+            Matrix with row i holding values of paths from i-th source
+        """
+        semiring = get_semiring(semiring)
+        ops = self.matrix_backend
+        shape = (self.num_states, self.num_states)
+        matrices = [
+            sparse.csr_matrix(
+                (np.ones(len(rows), dtype=bool), (rows, cols)), shape=shape
+            )
+            for rows, cols in (ops.nonzero(bm) for bm in self.bool_matrices.values())
+        ]
+        if not matrices:
+            matrices = [sparse.csr_matrix(shape, dtype=bool)]
+        return semiring.closure(semiring.adjacency(matrices), sources)
+
     @classmethod
-    def from_rsm(cls, rsm: RSM):
+    def from_rsm(cls, rsm: RSM, backend: str = None):
         """
-        Create an instance of BooleanMatrices from rsm
+        Create an instance of BooleanMatrices from rsm.
+        States of every box get consecutive indices starting at offset of the box,
+        transitions are gathered into coordinate arrays and label matrices
+        are built in bulk. Names of states "state#variable" are created only
+        when state_indexes is accessed
         Attributes
         ----------
         rsm: RSM
             Recursive State Machine
+        backend: str
+            Storage format of label matrices
         """
-        bm = cls()
-        bm.num_states = sum(len(box.dfa.states) for box in rsm.boxes)
-        box_idx = 0
-        for box in rsm.boxes:
-            for idx, state in enumerate(box.dfa.states):
-                new_name = bm._rename_rsm_box_state(state, box.variable)
-                bm.state_indexes[new_name] = idx + box_idx
-                if state in box.dfa.start_states:
-                    bm.start_states.add(bm.state_indexes[new_name])
-                if state in box.dfa.final_states:
-                    bm.final_states.add(bm.state_indexes[new_name])
-
-            bm.states_to_box_variable.update(
-                {
-                    (
-                        bm.state_indexes[
-                            bm._rename_rsm_box_state(box.dfa.start_state, box.variable)
-                        ],
-                        bm.state_indexes[bm._rename_rsm_box_state(state, box.variable)],
-                    ): box.variable.value
-                    for state in box.dfa.final_states
-                }
-            )
-            bm.bool_matrices.update(bm._create_box_bool_matrices(box))
-            box_idx += len(box.dfa.states)
+        bm = cls(backend=backend)
+        boxes = [(box, list(box.dfa.states)) for box in rsm.boxes]
+        bm.num_states = sum(len(states) for _, states in boxes)
+        transitions = {}
+        start_indexes, final_indexes = [], []
+        offset = 0
+        for box, states in boxes:
+            local = {state: idx + offset for idx, state in enumerate(states)}
+            start = local.get(box.dfa.start_state)
+            finals = [local[state] for state in box.dfa.final_states]
+            if start is not None:
+                start_indexes.append(start)
+                bm.states_to_box_variable.update(
+                    {(start, final): box.variable.value for final in finals}
+                )
+            final_indexes.extend(finals)
+            bm._collect_box_transitions(box, local, transitions)
+            offset += len(states)
 
+        bm.state_indexes = _LazyStateIndexes(
+            lambda: cls._rsm_state_indexes(boxes), bm.num_states
+        )
+        bm._start_states = bm._final_states = None
+        bm._start_mask = np.zeros(bm.num_states, dtype=bool)
+        bm._start_mask[start_indexes] = True
+        bm._final_mask = np.zeros(bm.num_states, dtype=bool)
+        bm._final_mask[final_indexes] = True
+        bm.bool_matrices = bm._build_matrices(transitions)
         return bm
 
+    @classmethod
+    def _rsm_state_indexes(cls, boxes: list) -> Dict[State, int]:
+        """
+        Build mapping of renamed RSM box states to their indices
+
+        Parameters
+        ----------
+        boxes: List[Tuple[Box, List[State]]]
+            Boxes of RSM with their states in order of indices
+        Returns
+        -------
+        state_indexes: Dict[State, int]
+            Mapping of states "state#variable" to indices
+        """
+        state_indexes = {}
+        for box, states in boxes:
+            for state in states:
+                new_name = cls._rename_rsm_box_state(state, box.variable)
+                state_indexes[new_name] = len(state_indexes)
+        return state_indexes
+
     @staticmethod
     def _rename_rsm_box_state(state: State, box_variable: Variable):
         return State(f"{state.value}#{box_variable.value}")
 
-    def _create_box_bool_matrices(self, box: Box) -> dict:
+    @staticmethod
+    def _collect_box_transitions(box: Box, local: dict, transitions: dict):
         """
-        Create bool matrices for RSM box
+        Collect coordinates of RSM box transitions per label
         Attributes
         ----------
         box: Box
             Box of RSM
-        Returns
-        -------
-        bmatrix: dict
-            Boolean Matrices dict
+        local: dict
+            Mapping of box states to their indices
+        transitions: dict
+            Mapping of labels to pair of row and column index lists, updated in place
         """
-        bmatrix = {}
-        for s_from, trans in box.dfa.to_dict().items():
-            for label, states_to in trans.items():
-                if not isinstance(states_to, set):
-                    states_to = {states_to}
-                for s_to in states_to:
-                    idx_from = self.state_indexes[
-                        self._rename_rsm_box_state(s_from, box.variable)
-                    ]
-                    idx_to = self.state_indexes[
-                        self._rename_rsm_box_state(s_to, box.variable)
-                    ]
-
-                    if label in self.bool_matrices:
-                        self.bool_matrices[label][idx_from, idx_to] = True
-                        continue
-                    if label not in bmatrix:
-                        bmatrix[label] = sparse.dok_matrix(
-                            (self.num_states, self.num_states), dtype=bool
-                        )
-                    bmatrix[label][idx_from, idx_to] = True
-
-        return bmatrix
+        for s_from, label, s_to in box.dfa:
+            rows, cols = transitions.setdefault(label, ([], []))
+            rows.append(local[s_from])
+            cols.append(local[s_to])
 
     @classmethod
-    def from_automaton(cls, automaton):
+    def from_automaton(cls, automaton, backend: str = None, order: str = None):
         """
         Transforms NFA into BooleanMatrices
         Parameters
         ----------
         automaton: NondeterministicFiniteAutomaton
             NFA to transform
+        backend: str
+            Storage format of label matrices
+        order: str
+            Order of states, one of VERTEX_ORDERS, see reordered.
+            States are indexed in order of automaton by default
         Returns
         -------
         obj: BooleanMatrices
             BooleanMatrices object from NFA
         """
-        bm = cls()
+        bm = cls(backend=backend)
         bm.num_states = len(automaton.states)
         bm.start_states = automaton.start_states
         bm.final_states = automaton.final_states
         bm.state_indexes = {state: idx for idx, state in enumerate(automaton.states)}
         bm.bool_matrices = bm._create_boolean_matrices(automaton)
+        return bm if order is None else bm.reordered(order)
+
+    def reordered(self, order: str = "rcm"):
+        """
+        Get copy with states renumbered by given order, which places
+        nonzero cells of label matrices close to diagonal and speeds up
+        their multiplication. States keep their names, so results
+        translated through state_indexes are not affected
+
+        Parameters
+        ----------
+        order: str
+            One of VERTEX_ORDERS, see vertex_order
+        Returns
+        -------
+        bm: BooleanMatrices
+            Copy with permuted label matrices and state indexes,
+            its permutation maps new indexes to indexes in self
+        Raises
+        ------
+        ValueError
+            If order is unknown
+        """
+        permutation = vertex_order(
+            get_backend("csr").convert(self.adjacency_matrix()), order
+        )
+        inverse = np.empty_like(permutation)
+        inverse[permutation] = np.arange(permutation.size)
+
+        bm = copy.copy(self)
+        bm._closure = None
+        bm._adjacency = {}
+        bm.label_versions = dict(self.label_versions)
+        bm.permutation = permutation
+        ops = self.matrix_backend
+        shape = (self.num_states, self.num_states)
+        bm.bool_matrices = {}
+        for label, matrix in self.bool_matrices.items():
+            rows, cols = ops.nonzero(matrix)
+            bm.bool_matrices[label] = ops.from_coords(
+                inverse[rows], inverse[cols], shape
+            )
+        bm.state_indexes = {
+            state: int(inverse[index]) for state, index in self.state_indexes.items()
+        }
+        bm._start_states = bm._final_states = None
+        bm._start_mask = self.start_mask()[permutation]
+        bm._final_mask = self.final_mask()[permutation]
+        bm.states_to_box_variable = {
+            (int(inverse[i]), int(inverse[j])): variable
+            for (i, j), variable in self.states_to_box_variable.items()
+        }
+        return bm
+
+    def export_csr(self):
+        """
+        Export label matrices as CSR index arrays with header describing
+        labels, states, start and final states, see save and load
+
+        Returns
+        -------
+        export: Tuple[dict, List[Tuple[np.ndarray, np.ndarray]]]
+            JSON-serializable header and indptr and indices arrays of every label
+        Raises
+        ------
+        ValueError
+            If some state is neither JSON scalar nor tuple of such values
+        """
+        csr = get_backend("csr")
+        labels, arrays = [], []
+        for label, matrix in self.bool_matrices.items():
+            matrix = csr.convert(matrix)
+            matrix.sum_duplicates()
+            index_dtype = (
+                np.int32 if max(self.num_states, matrix.nnz) < 2**31 else np.int64
+            )
+            arrays.append(
+                (matrix.indptr.astype(index_dtype), matrix.indices.astype(index_dtype))
+            )
+            labels.append(
+                {
+                    "label": label.value if isinstance(label, Symbol) else label,
+                    "symbol": isinstance(label, Symbol),
+                    "nnz": int(matrix.nnz),
+                    "dtype": np.dtype(index_dtype).name,
+                }
+            )
+
+        states = None
+        if self.state_indexes and not isinstance(self.state_indexes, _IdentityIndexes):
+            states = [
+                _encode_state(state.value) for state in self.get_states_by_index()
+            ]
+        header = {
+            "version": STORAGE_FORMAT_VERSION,
+            "num_states": self.num_states,
+            "labels": labels,
+            "states": states,
+            "start_states": np.flatnonzero(self.start_mask()).tolist(),
+            "final_states": np.flatnonzero(self.final_mask()).tolist(),
+            "states_to_box_variable": [
+                [i, j, variable]
+                for (i, j), variable in self.states_to_box_variable.items()
+            ],
+        }
+        return header, arrays
+
+    @classmethod
+    def from_csr_arrays(cls, header: dict, arrays: list, backend: str = None):
+        """
+        Create BooleanMatrices from header and CSR index arrays made by export_csr.
+        CSR label matrices are built over given arrays without copying them,
+        other storages convert matrices in memory
+
+        Parameters
+        ----------
+        header: dict
+            Header made by export_csr
+        arrays: List[Tuple[np.ndarray, np.ndarray]]
+            Indptr and indices arrays of every label in order of header
+        backend: str
+            Storage format of label matrices
+        Returns
+        -------
+        obj: BooleanMatrices
+            BooleanMatrices object over given arrays
+        Raises
+        ------
+        ValueError
+            If header has unsupported format version
+        """
+        if header["version"] != STORAGE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported storage format: {header['version']}")
+        bm = cls(backend=backend)
+        n = bm.num_states = header["num_states"]
+
+        matrices = {}
+        for entry, (indptr, indices) in zip(header["labels"], arrays):
+            matrix = sparse.csr_matrix(
+                (np.broadcast_to(np.True_, (entry["nnz"],)), indices, indptr),
+                shape=(n, n),
+                copy=False,
+            )
+            matrix.has_sorted_indices = True
+            label = Symbol(entry["label"]) if entry["symbol"] else entry["label"]
+            matrices[label] = matrix
+
+        bm._resolve_storage(sum(entry["nnz"] for entry in header["labels"]))
+        ops = bm.matrix_backend
+        bm.bool_matrices = {
+            label: ops.convert(matrix) for label, matrix in matrices.items()
+        }
+
+        states = header["states"]
+        bm.state_indexes = (
+            _IdentityIndexes(n)
+            if states is None
+            else _LazyStateIndexes(
+                lambda: {
+                    State(_decode_state(value)): index
+                    for index, value in enumerate(states)
+                },
+                n,
+            )
+        )
+        bm._start_states = bm._final_states = None
+        bm._start_mask = np.zeros(n, dtype=bool)
+        bm._start_mask[header["start_states"]] = True
+        bm._final_mask = np.zeros(n, dtype=bool)
+        bm._final_mask[header["final_states"]] = True
+        bm.states_to_box_variable = {
+            (i, j): variable for i, j, variable in header["states_to_box_variable"]
+        }
+        return bm
+
+    def save(self, path: str):
+        """
+        Save label matrices into directory as raw CSR index arrays,
+        one pair of files per label, with JSON header describing labels,
+        states, start and final states, and JSON statistics of labels
+
+        Parameters
+        ----------
+        path: str
+            Directory to save into, created when missing
+        Raises
+        ------
+        ValueError
+            If some state cannot be exported, see export_csr
+        """
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        header, arrays = self.export_csr()
+        for number, (indptr, indices) in enumerate(arrays):
+            indptr.tofile(directory / f"{number}.indptr")
+            indices.tofile(directory / f"{number}.indices")
+        (directory / _HEADER_FILE).write_text(json.dumps(header))
+        self.statistics().save(directory / _STATISTICS_FILE)
+
+    @classmethod
+    def load(cls, path: str, backend: str = "csr"):
+        """
+        Load BooleanMatrices saved by save.
+        Index arrays are memory-mapped read-only, so CSR label matrices are
+        opened without reading them and processes loading the same directory
+        share pages through OS cache. Other storages, requested explicitly,
+        convert matrices in memory
+
+        Parameters
+        ----------
+        path: str
+            Directory with saved matrices
+        backend: str
+            Storage format of label matrices, "csr" keeps them memory-mapped
+        Returns
+        -------
+        obj: BooleanMatrices
+            Loaded BooleanMatrices object
+        Raises
+        ------
+        ValueError
+            If directory has unsupported format version
+        """
+        directory = Path(path)
+        header = json.loads((directory / _HEADER_FILE).read_text())
+        if header["version"] != STORAGE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported storage format: {header['version']}")
+        n = header["num_states"]
+        arrays = []
+        for number, entry in enumerate(header["labels"]):
+            dtype, nnz = np.dtype(entry["dtype"]), entry["nnz"]
+            indptr = np.memmap(
+                directory / f"{number}.indptr", dtype=dtype, mode="r", shape=(n + 1,)
+            )
+            indices = (
+                np.memmap(
+                    directory / f"{number}.indices", dtype=dtype, mode="r", shape=(nnz,)
+                )
+                if nnz
+                else np.empty(0, dtype=dtype)
+            )
+            arrays.append((indptr, indices))
+        bm = cls.from_csr_arrays(header, arrays, backend)
+        if (directory / _STATISTICS_FILE).exists():
+            bm._statistics = GraphStatistics.load(directory / _STATISTICS_FILE)
         return bm
 
-    def intersect(self, other):
+    @classmethod
+    def from_transitions(cls, num_states: int, transitions: dict, backend=None):
+        """
+        Create an instance of BooleanMatrices from coordinates of transitions
+
+        Parameters
+        ----------
+        num_states: int
+            Number of states
+        transitions: Dict[Any, Tuple[Sequence[int], Sequence[int]]]
+            Mapping of labels to pair of row and column index sequences
+        backend: str
+            Storage of label matrices
+        Returns
+        -------
+        obj: BooleanMatrices
+            BooleanMatrices object with given transitions
+        """
+        bm = cls(backend=backend)
+        bm.num_states = num_states
+        bm.bool_matrices = bm._build_matrices(transitions)
+        return bm
+
+    @classmethod
+    def disjoint_union(cls, automata: list, backend: str = None):
+        """
+        Create automaton accepting union of languages of given automata,
+        which keeps them apart: states of i-th automaton get consecutive
+        indices following states of previous automata, and states are named
+        by their indices
+
+        Parameters
+        ----------
+        automata: List[BooleanMatrices]
+            Automata to unite
+        backend: str
+            Storage of label matrices
+        Returns
+        -------
+        obj: BooleanMatrices
+            Union of automata without transitions between them
+        """
+        offsets = np.cumsum([0] + [bm.num_states for bm in automata])
+        transitions = {}
+        for offset, bm in zip(offsets, automata):
+            for label, matrix in bm.bool_matrices.items():
+                rows, cols = bm.matrix_backend.nonzero(matrix)
+                label_rows, label_cols = transitions.setdefault(label, ([], []))
+                label_rows.extend((rows + offset).tolist())
+                label_cols.extend((cols + offset).tolist())
+        union = cls.from_transitions(int(offsets[-1]), transitions, backend)
+        union.state_indexes = _IdentityIndexes(union.num_states)
+        union._start_states = union._final_states = None
+        union._start_mask = np.concatenate(
+            [bm.start_mask() for bm in automata] + [np.zeros(0, dtype=bool)]
+        )
+        union._final_mask = np.concatenate(
+            [bm.final_mask() for bm in automata] + [np.zeros(0, dtype=bool)]
+        )
+        return union
+
+    def intersect(self, other, lazy: bool = False):
         """
         Returns a new class object containing
         the Kronecker products for given matrices
@@ -202,32 +1169,38 @@ class BooleanMatrices:
         ----------
         other: BooleanMatrices
             Right-hand side boolean matrix
+        lazy: bool
+            Whether to keep Kronecker products implicit, see LazyIntersection.
+            Lazy intersection answers traversals from start states
+            without allocating product matrices
         Returns
         -------
-        intersection: BooleanMatrices
+        intersection: BooleanMatrices | LazyIntersection
             Intersection of two boolean matrices
         """
-        bm_res = BooleanMatrices()
+        bm_res = BooleanMatrices(backend=self.backend)
         bm_res.num_states = self.num_states * other.num_states
         common_labels = self.bool_matrices.keys() & other.bool_matrices.keys()
+        bm_res._resolve_storage(
+            sum(
+                self.bool_matrices[label].nnz * other.bool_matrices[label].nnz
+                for label in common_labels
+            )
+        )
+        if lazy:
+            return LazyIntersection(self, other, bm_res.storage)
 
+        ops = bm_res.matrix_backend
         for label in common_labels:
-            bm_res.bool_matrices[label] = sparse.kron(
-                self.bool_matrices[label], other.bool_matrices[label], format="dok"
+            bm_res.bool_matrices[label] = ops.kron(
+                ops.convert(self.bool_matrices[label]),
+                ops.convert(other.bool_matrices[label]),
             )
 
-        for s_first, s_first_index in self.state_indexes.items():
-            for s_second, s_second_index in other.state_indexes.items():
-                new_state = new_state_index = (
-                    s_first_index * other.num_states + s_second_index
-                )
-                bm_res.state_indexes[new_state] = new_state_index
-
-                if s_first in self.start_states and s_second in other.start_states:
-                    bm_res.start_states.add(new_state)
-
-                if s_first in self.final_states and s_second in other.final_states:
-                    bm_res.final_states.add(new_state)
+        bm_res.state_indexes = _IdentityIndexes(bm_res.num_states)
+        bm_res._start_states = bm_res._final_states = None
+        bm_res._start_mask = np.outer(self.start_mask(), other.start_mask()).ravel()
+        bm_res._final_mask = np.outer(self.final_mask(), other.final_mask()).ravel()
 
         return bm_res
 
@@ -244,18 +1217,81 @@ class BooleanMatrices:
         boolean_matrices: dict
             Dict of boolean matrix for every automata label-key
         """
-        bool_matrices = {}
+        transitions = {}
         for s_from, trans in automaton.to_dict().items():
             for label, states_to in trans.items():
                 if not isinstance(states_to, set):
                     states_to = {states_to}
+                rows, cols = transitions.setdefault(label, ([], []))
                 for s_to in states_to:
-                    index_from = self.state_indexes[s_from]
-                    index_to = self.state_indexes[s_to]
-                    if label not in bool_matrices:
-                        bool_matrices[label] = sparse.dok_matrix(
-                            (self.num_states, self.num_states), dtype=bool
-                        )
-                    bool_matrices[label][index_from, index_to] = True
-
-        return bool_matrices
+                    rows.append(self.state_indexes[s_from])
+                    cols.append(self.state_indexes[s_to])
+
+        return self._build_matrices(transitions)
+
+    def _resolve_storage(self, nnz: int):
+        """
+        Choose storage of label matrices for "auto" backend
+
+        Parameters
+        ----------
+        nnz: int
+            Total number of nonzero cells in label matrices
+        """
+        if self.storage is not None:
+            return
+        density = nnz / max(1, self.num_states) ** 2
+        if self.num_states <= BITSET_MAX_STATES and density >= BITSET_MIN_DENSITY:
+            self.storage = "bitset"
+        else:
+            self.storage = "csr"
+
+    def _build_matrices(self, transitions: dict) -> dict:
+        """
+        Build label matrices from coordinates of transitions
+
+        Parameters
+        ----------
+        transitions: dict
+            Mapping of labels to pair of row and column index sequences
+        Returns
+        -------
+        boolean_matrices: dict
+            Dict of boolean matrix for every label
+        """
+        self._resolve_storage(sum(len(rows) for rows, _ in transitions.values()))
+        return self.matrix_backend.from_label_coords(
+            transitions, (self.num_states, self.num_states)
+        )
+
+    def identity_matrix(self):
+        """
+        Build identity matrix in storage of label matrices
+
+        Returns
+        -------
+        matrix: Any
+            Identity matrix of shape (num_states, num_states)
+        """
+        return self.matrix_backend.identity(self.num_states)
+
+    def _matrix_from_coords(self, rows, cols):
+        """
+        Build boolean label matrix in storage of label matrices
+        from coordinates of its nonzero cells
+
+        Parameters
+        ----------
+        rows: Sequence[int]
+            Row indices of nonzero cells
+        cols: Sequence[int]
+            Column indices of nonzero cells
+        Returns
+        -------
+        matrix: Any
+            Boolean matrix of shape (num_states, num_states)
+        """
+        self._resolve_storage(len(rows))
+        return self.matrix_backend.from_coords(
+            rows, cols, (self.num_states, self.num_states)
+        )
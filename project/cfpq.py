@@ -1,9 +1,9 @@
-from typing import Set, Tuple
+from typing import Set, Tuple, Union
 
 import networkx as nx
 from pyformlang.cfg import CFG, Variable
 
-from project import hellings, matrix, tensor
+from project import BooleanMatrices, hellings, matrix, tensor
 
 __all__ = ["hellings_cfpq", "matrix_cfpq", "tensor_cfpq"]
 
@@ -75,7 +75,7 @@ def hellings_cfpq(
 
 
 def matrix_cfpq(
-    graph: nx.MultiDiGraph,
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
     cfg: CFG,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
@@ -87,8 +87,8 @@ def matrix_cfpq(
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | BooleanMatrices
+        input graph or its label matrices, see BooleanMatrices.load and attach
     cfg: CFG
         input CFG
     start_nodes: Set[int]
@@ -109,7 +109,7 @@ def matrix_cfpq(
 
 
 def tensor_cfpq(
-    graph: nx.MultiDiGraph,
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
     cfg: CFG,
     start_nodes: Set[int] = None,
     final_nodes: Set[int] = None,
@@ -119,8 +119,8 @@ def tensor_cfpq(
     Context-Free Path Querying based on tensor algorithm and RSM
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | BooleanMatrices
+        input graph or its label matrices, see BooleanMatrices.load and attach
     cfg: CFG
         input CFG
     start_nodes: Set[int]
@@ -1,22 +1,87 @@
-from typing import Set, Tuple
+from typing import Set, Tuple, Union
 import networkx as nx
-from pyformlang.cfg import CFG
-from scipy import sparse
-from scipy.sparse import dok_matrix, identity
-from project import cfg_to_wcnf, is_wcnf, BooleanMatrices, graph_to_nfa
+import numpy as np
+from pyformlang.cfg import CFG, Variable
+from pyformlang.finite_automaton import State
+from project import (
+    cfg_to_wcnf,
+    is_wcnf,
+    BooleanMatrices,
+    get_graph_index_cache,
+    graph_matrices,
+)
 
 __all__ = ["hellings", "matrix", "tensor"]
 
 
-def hellings(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
+def _node_values(graph: BooleanMatrices) -> list:
+    """
+    Get graph nodes ordered by indices of states of BooleanMatrices
+    """
+    return [
+        state.value if isinstance(state, State) else state
+        for state in graph.get_states_by_index()
+    ]
+
+
+def _generating_variables(wcnf: CFG, labels: set) -> set:
+    """
+    Get variables of grammar in weak Chomsky normal form deriving
+    some word built from given labels only
+    """
+    generating = set()
+    changed = True
+    while changed:
+        changed = False
+        for p in wcnf.productions:
+            if p.head.value in generating:
+                continue
+            if all(
+                b.value in (generating if isinstance(b, Variable) else labels)
+                for b in p.body
+            ):
+                generating.add(p.head.value)
+                changed = True
+    return generating
+
+
+def _to_node_triplets(
+    triplets: set, graph: BooleanMatrices
+) -> Set[Tuple[int, str, int]]:
+    """
+    Translate state indices of triplets into graph nodes
+    """
+    nodes = _node_values(graph)
+    return {(nodes[u], variable, nodes[v]) for u, variable, v in triplets}
+
+
+def _graph_matrices(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
+    wcnf: CFG,
+    backend: str = None,
+) -> BooleanMatrices:
+    """
+    Get label matrices of graph, cached by GraphIndexCache for nx graphs,
+    converting only edges labelled with terminals of grammar
+    """
+    if isinstance(graph, BooleanMatrices):
+        return graph
+    return get_graph_index_cache().boolean_matrices(
+        graph, backend, labels={t.value for t in wcnf.terminals}
+    )
+
+
+def hellings(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices], cfg: CFG
+) -> Set[Tuple[int, str, int]]:
     """
     Hellings algorithm for solving Context-Free Path Querying problem
     for given graph and cfg
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | BooleanMatrices
+        input graph, or its label matrices
     cfg: CFG
         input cfg
 
@@ -31,11 +96,16 @@ def hellings(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
     term_productions = {p for p in wcnf.productions if len(p.body) == 1}
     var_productions = {p for p in wcnf.productions if len(p.body) == 2}
 
-    r = {(v, h, v) for v in range(graph.number_of_nodes()) for h in eps_prod_heads} | {
+    bm = _graph_matrices(graph, wcnf)
+    ops = bm.matrix_backend
+    edges = {
+        getattr(label, "value", label): list(zip(*ops.nonzero(label_matrix)))
+        for label, label_matrix in bm.bool_matrices.items()
+    }
+    r = {(v, h, v) for v in range(bm.num_states) for h in eps_prod_heads} | {
         (u, p.head.value, v)
-        for u, v, edge_data in graph.edges(data=True)
         for p in term_productions
-        if p.body[0].value == edge_data["label"]
+        for u, v in edges.get(p.body[0].value, [])
     }
 
     new = r.copy()
@@ -70,18 +140,22 @@ def hellings(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
                 r_temp |= triplets
         r |= r_temp
 
-    return r
+    return _to_node_triplets(r, bm)
 
 
-def matrix(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
+def matrix(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices], cfg: CFG, backend: str = None
+) -> Set[Tuple[int, str, int]]:
     """
     Matrix algorithm for solving Context-Free Path Querying problem
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | BooleanMatrices
+        input graph, or its label matrices e.g. loaded or attached from shared memory
     cfg: CFG
         input cfg
+    backend: str
+        name of matrix backend, see project.matrix_backends
     Returns
     -------
     Set[Tuple[int, str, int]]:
@@ -89,51 +163,76 @@ def matrix(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
     """
     wcnf = cfg_to_wcnf(cfg)
 
-    num_of_nodes = graph.number_of_nodes()
-    matrices = {
-        v.value: sparse.dok_matrix((num_of_nodes, num_of_nodes), dtype=bool)
-        for v in wcnf.variables
-    }
+    transitions = {v.value: ([], []) for v in wcnf.variables}
 
     term_productions = {p for p in wcnf.productions if len(p.body) == 1}
-    for i, j, data in graph.edges(data=True):
-        l = data["label"]
-        for v in {p.head.value for p in term_productions if p.body[0].value == l}:
-            matrices[v][i, j] = True
+    graph_bm = _graph_matrices(graph, wcnf, backend)
+    num_of_nodes = graph_bm.num_states
+    graph_ops = graph_bm.matrix_backend
+    for p in term_productions:
+        label_matrix = graph_bm.bool_matrices.get(p.body[0].value)
+        if label_matrix is not None:
+            rows, cols = graph_ops.nonzero(label_matrix)
+            transitions[p.head.value][0].extend(rows)
+            transitions[p.head.value][1].extend(cols)
 
     eps_products_heads = [p.head.value for p in wcnf.productions if not p.body]
-    for i in range(num_of_nodes):
-        for v in eps_products_heads:
-            matrices[v][i, i] = True
+    for v in eps_products_heads:
+        transitions[v][0].extend(range(num_of_nodes))
+        transitions[v][1].extend(range(num_of_nodes))
+
+    bm = BooleanMatrices.from_transitions(num_of_nodes, transitions, backend)
+    matrices = bm.bool_matrices
+    ops = bm.matrix_backend
 
     changed = True
     variable_productions = {p for p in wcnf.productions if len(p.body) == 2}
     while changed:
         changed = False
         for p in variable_productions:
-            old_nnz = matrices[p.head.value].nnz
-            matrices[p.head.value] += (
-                matrices[p.body[0].value] @ matrices[p.body[1].value]
+            old_nnz = ops.nnz(matrices[p.head.value])
+            matrices[p.head.value] = ops.add(
+                matrices[p.head.value],
+                ops.multiply(matrices[p.body[0].value], matrices[p.body[1].value]),
             )
-            new_nnz = matrices[p.head.value].nnz
+            new_nnz = ops.nnz(matrices[p.head.value])
             changed = changed or old_nnz != new_nnz
 
-    return {
-        (u, variable, v)
-        for variable, var_matrix in matrices.items()
-        for u, v in zip(*var_matrix.nonzero())
-    }
+    return _to_node_triplets(
+        {
+            (u, variable, v)
+            for variable, var_matrix in matrices.items()
+            for u, v in zip(*ops.nonzero(var_matrix))
+        },
+        graph_bm,
+    )
 
 
-def tensor(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
+def tensor(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
+    cfg: CFG,
+    backend: str = None,
+    closure_algorithm: str = "squaring",
+    order: str = None,
+) -> Set[Tuple[int, str, int]]:
     """
     Tensor algorithm for solving Context-Free Path Querying problem
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        input graph
+    graph: nx.MultiDiGraph | BooleanMatrices
+        input graph, or its label matrices e.g. loaded or attached from shared memory,
+        which are used as is and never modified.
+        Only edges labelled with terminals of cfg are converted
     cfg: CFG
         input cfg
+    backend: str
+        name of matrix backend, see project.matrix_backends,
+        graph given as BooleanMatrices keeps its storage
+    closure_algorithm: str
+        transitive closure algorithm, see BooleanMatrices.transitive_closure
+    order: str
+        order of graph nodes in matrices, see BooleanMatrices.reordered,
+        results are given in graph nodes whenever order is set
     Returns
     -------
     set[Tuple[int, str, int]]:
@@ -141,7 +240,6 @@ def tensor(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
     """
     wcnf = cfg_to_wcnf(cfg)
 
-    n = sum(len(p.body) + 1 for p in wcnf.productions)
     rsm_heads = dict()
     nonterm = set()
     boxes = dict()
@@ -149,61 +247,83 @@ def tensor(graph: nx.MultiDiGraph, cfg: CFG) -> Set[Tuple[int, str, int]]:
     final_states = set()
     counter = 0
 
-    nfa_by_graph = graph_to_nfa(graph)
-    bm = BooleanMatrices.from_automaton(nfa_by_graph)
+    terminals = {t.value for t in wcnf.terminals}
+    if isinstance(graph, BooleanMatrices):
+        bm = graph.with_states(labels=terminals)
+        if order is not None:
+            bm = bm.reordered(order)
+    else:
+        bm = graph_matrices(graph, labels=terminals, backend=backend, order=order)
+    # productions using terminals missing from graph never fire
+    present = {getattr(label, "value", label) for label in bm.bool_matrices}
+    generating = _generating_variables(wcnf, present)
+    productions = [
+        p
+        for p in wcnf.productions
+        if all(
+            b.value in (generating if isinstance(b, Variable) else present)
+            for b in p.body
+        )
+    ]
+    if not productions:
+        return set()
+    n = sum(len(p.body) + 1 for p in productions)
 
-    for p in wcnf.productions:
+    for p in productions:
         nonterm.add(p.head.value)
         start_states.add(counter)
         final_states.add(counter + len(p.body))
-        rsm_heads[(counter, counter + len(p.body))] = p.head.value
+        rsm_heads[counter * n + counter + len(p.body)] = p.head.value
         for b in p.body:
-            m = boxes.get(b.value, dok_matrix((n, n), dtype=bool))
-            m[counter, counter + 1] = True
-            boxes[b.value] = m
+            rows, cols = boxes.setdefault(b.value, ([], []))
+            rows.append(counter)
+            cols.append(counter + 1)
             counter += 1
         counter += 1
 
-    for p in wcnf.productions:
+    for p in productions:
         if len(p.body) == 0:
-            bm.bool_matrices[p.head.value] = identity(bm.num_states, dtype=bool).todok()
+            bm.bool_matrices[p.head.value] = bm.identity_matrix()
 
     changed = True
-    bfa = BooleanMatrices()
+    bfa = BooleanMatrices.from_transitions(n, boxes, backend)
     bfa.start_states = start_states
     bfa.final_states = final_states
-    bfa.bool_matrices = boxes
-    bfa.states_count = n
+    heads_keys = np.fromiter(rsm_heads.keys(), dtype=np.int64)
 
+    ops = bm.matrix_backend
     while changed:
         changed = False
-        transitive_closure = bfa.intersect(bm).transitive_closure()
-        x, y = transitive_closure.nonzero()
+        intersection = bfa.intersect(bm)
+        x, y = intersection.matrix_backend.nonzero(
+            intersection.transitive_closure(closure_algorithm)
+        )
 
-        for (i, j) in zip(x, y):
-            rfa_from = i // bm.num_states
-            rfa_to = j // bm.num_states
-            graph_from = i % bm.num_states
-            graph_to = j % bm.num_states
+        rfa_from, graph_from = np.divmod(x, bm.num_states)
+        rfa_to, graph_to = np.divmod(y, bm.num_states)
+        keys = rfa_from * n + rfa_to
+        is_head = np.isin(keys, heads_keys)
+        keys, graph_from, graph_to = (
+            keys[is_head],
+            graph_from[is_head],
+            graph_to[is_head],
+        )
 
-            if (rfa_from, rfa_to) not in rsm_heads:
-                continue
-
-            variable = rsm_heads[(rfa_from, rfa_to)]
-            m = bm.bool_matrices.get(
-                variable,
-                dok_matrix((bm.num_states, bm.num_states), dtype=bool),
-            )
-            if not m[graph_from, graph_to]:
+        for key in np.unique(keys):
+            variable = rsm_heads[key]
+            selected = keys == key
+            found = bm._matrix_from_coords(graph_from[selected], graph_to[selected])
+            m = bm.bool_matrices.get(variable)
+            updated = found if m is None else ops.add(m, found)
+            if m is None or ops.nnz(updated) != ops.nnz(m):
                 changed = True
-                m[graph_from, graph_to] = True
-                bm.bool_matrices[variable] = m
+                bm.bool_matrices[variable] = updated
 
     triplets = set()
     for key, m in bm.bool_matrices.items():
         if key not in nonterm:
             continue
-        for (u, v), _ in m.items():
+        for u, v in zip(*ops.nonzero(m)):
             triplets.add((u, key, v))
 
-    return triplets
+    return _to_node_triplets(triplets, bm)
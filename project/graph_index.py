@@ -0,0 +1,367 @@
+import threading
+import weakref
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Set, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+from project.boolean_matrices import BooleanMatrices
+from project.graphs import GraphException, graph_to_nfa
+from project.matrix_backends import default_backend_name
+
+__all__ = [
+    "GraphIndexCache",
+    "GraphIndexInfo",
+    "get_graph_index_cache",
+    "graph_matrices",
+    "graph_fingerprint",
+    "GRAPH_CACHE_BYTES",
+    "GRAPH_VERSION_KEY",
+]
+
+GRAPH_CACHE_BYTES = 1 << 30
+
+GRAPH_VERSION_KEY = "version"
+
+# rough size of entry of state_indexes and of State object it holds
+_STATE_BYTES = 200
+
+
+class GraphIndexInfo(NamedTuple):
+    """
+    Counters of GraphIndexCache, see GraphIndexCache.info
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    nbytes: int
+    max_bytes: int
+    currsize: int
+
+
+def graph_fingerprint(graph: nx.MultiDiGraph) -> Tuple:
+    """
+    Get fingerprint of graph content. Graphs versioned by caller in
+    graph.graph[GRAPH_VERSION_KEY] are fingerprinted by numbers of nodes
+    and edges and version only, without hashing their content, so version
+    should be changed on every in-place change of such graph.
+    Unversioned graphs are fingerprinted by numbers of nodes and edges and
+    order-independent hashes of nodes and of labelled edges (u, v, label),
+    which takes a single pass over graph, much cheaper than its conversion
+    into matrices, and sees changes keeping numbers of nodes and edges,
+    e.g. relabelled or moved edges
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph
+        Graph with labelled edges
+    Returns
+    -------
+    fingerprint: Tuple
+        Numbers of nodes and edges and either version of graph
+        or hashes of its content
+    """
+    counts = (graph.number_of_nodes(), graph.number_of_edges())
+    version = graph.graph.get(GRAPH_VERSION_KEY)
+    if version is not None:
+        return counts + (version,)
+    return counts + (
+        sum(map(hash, graph.nodes)),
+        sum(map(hash, graph.edges(data="label"))),
+    )
+
+
+def _matrix_nbytes(matrix) -> int:
+    """
+    Estimate memory taken by boolean matrix of any backend
+    """
+    if sparse.issparse(matrix) and hasattr(matrix, "indptr"):
+        return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    if hasattr(matrix, "words"):
+        return matrix.words.nbytes
+    return 16 * matrix.nnz
+
+
+def _nbytes(bm: BooleanMatrices) -> int:
+    """
+    Estimate memory taken by label matrices and states of BooleanMatrices
+    """
+    return _STATE_BYTES * bm.num_states + sum(
+        _matrix_nbytes(matrix) for matrix in bm.bool_matrices.values()
+    )
+
+
+class _GraphEntry:
+    def __init__(
+        self,
+        graph: nx.MultiDiGraph,
+        fingerprint: Tuple,
+        matrices: BooleanMatrices,
+        labels: Optional[Set] = None,
+    ):
+        self.ref = weakref.ref(graph)
+        self.fingerprint = fingerprint
+        self.matrices = matrices
+        self.labels = labels
+        self.nbytes = _nbytes(matrices)
+
+    def missing_labels(self, labels: Optional[Set]) -> Optional[Set]:
+        """
+        Get requested labels which are not converted yet,
+        None when the whole graph is requested but only some labels are converted
+        """
+        if self.labels is None:
+            return set()
+        if labels is None:
+            return None
+        return labels - self.labels
+
+
+def _with_labels(
+    bm: BooleanMatrices, graph: nx.MultiDiGraph, labels: Set, backend: str
+) -> BooleanMatrices:
+    """
+    Get copy of label matrices of graph with matrices of given labels added,
+    converting only edges with these labels and keeping indexes of states
+    """
+    extra = BooleanMatrices.from_automaton(graph_to_nfa(graph, labels=labels), backend)
+    positions = np.empty(extra.num_states, dtype=np.int64)
+    for state, index in extra.state_indexes.items():
+        positions[index] = bm.state_indexes[state]
+    merged = bm.with_states(labels=set(bm.bool_matrices))
+    ops, extra_ops = merged.matrix_backend, extra.matrix_backend
+    shape = (bm.num_states, bm.num_states)
+    for label, matrix in extra.bool_matrices.items():
+        rows, cols = extra_ops.nonzero(matrix)
+        merged.bool_matrices[label] = ops.from_coords(
+            positions[rows], positions[cols], shape
+        )
+    return merged
+
+
+class GraphIndexCache:
+    """
+    Cache of label matrices of graphs, so that queries against the same graph
+    skip conversion of its edges. Entries are keyed by identity of graph
+    together with backend and order of matrices and checked against
+    graph_fingerprint of graph content on every lookup, so in-place changes
+    of graph are converted again. Entries hold matrices of labels
+    requested so far, extended on demand. Graphs are referenced weakly,
+    and the least recently used entries are evicted when estimated size
+    of cached matrices exceeds the budget
+
+    Attributes
+    ----------
+    max_bytes: int
+        Memory budget of cached matrices in bytes, 0 disables caching
+    hits: int
+        Number of lookups of cached graphs
+    misses: int
+        Number of lookups converting graph
+    evictions: int
+        Number of entries evicted to fit into budget
+    nbytes: int
+        Estimated size of cached matrices in bytes
+    """
+
+    def __init__(self, max_bytes: int = GRAPH_CACHE_BYTES):
+        if max_bytes < 0:
+            raise ValueError(f"Memory budget should be nonnegative: {max_bytes}")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def boolean_matrices(
+        self,
+        graph: nx.MultiDiGraph,
+        backend: str = None,
+        order: str = None,
+        labels: set = None,
+    ) -> BooleanMatrices:
+        """
+        Get label matrices of graph with all nodes being start and final.
+        Only edges with requested labels are converted: on miss entry of graph
+        is extended by matrices of labels it lacks, keeping matrices
+        converted for previous queries
+
+        Parameters
+        ----------
+        graph: nx.MultiDiGraph
+            Graph with labelled edges
+        backend: str
+            Name of matrix backend, see project.matrix_backends
+        order: str
+            Order of nodes in matrices, see BooleanMatrices.reordered
+        labels: set
+            Labels of needed matrices, all by default
+        Returns
+        -------
+        bm: BooleanMatrices
+            Matrices shared by all callers, which must not modify them
+            and use copies made by BooleanMatrices.with_states instead.
+            They have matrices of all requested labels present in graph
+            and may have matrices of other labels
+        """
+        key = (id(graph), backend or default_backend_name(), order)
+        fingerprint = graph_fingerprint(graph)
+        if labels is not None:
+            labels = {getattr(label, "value", label) for label in labels}
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                entry.ref() is not graph or entry.fingerprint != fingerprint
+            ):
+                entry = None
+            missing = None if entry is None else entry.missing_labels(labels)
+            if missing is not None and not missing:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.matrices
+            self.misses += 1
+
+        if missing is None:
+            matrices = BooleanMatrices.from_automaton(
+                graph_to_nfa(graph, labels=labels), backend, order
+            )
+            converted = labels
+        else:
+            matrices = _with_labels(entry.matrices, graph, missing, backend)
+            converted = entry.labels | labels
+        entry = _GraphEntry(graph, fingerprint, matrices, converted)
+        with self._lock:
+            self._remove(key)
+            self._remove_dead()
+            if entry.nbytes <= self.max_bytes:
+                self._entries[key] = entry
+                self.nbytes += entry.nbytes
+                self._fit(self.max_bytes)
+        return matrices
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
+
+    def _remove_dead(self):
+        for key in [key for key, entry in self._entries.items() if entry.ref() is None]:
+            self._remove(key)
+
+    def _fit(self, max_bytes: int):
+        while self.nbytes > max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self.nbytes -= entry.nbytes
+            self.evictions += 1
+
+    def invalidate(self, graph: nx.MultiDiGraph):
+        """
+        Drop all entries of graph, e.g. after changes not seen by fingerprint
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == id(graph)]:
+                self._remove(key)
+
+    def resize(self, max_bytes: int):
+        """
+        Change memory budget evicting the least recently used entries
+        which do not fit it
+        """
+        if max_bytes < 0:
+            raise ValueError(f"Memory budget should be nonnegative: {max_bytes}")
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._fit(max_bytes)
+
+    def clear(self):
+        """
+        Drop cached matrices and reset counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.nbytes = 0
+
+    def info(self) -> GraphIndexInfo:
+        """
+        Get counters of cache
+        """
+        with self._lock:
+            return GraphIndexInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self.nbytes,
+                self.max_bytes,
+                len(self._entries),
+            )
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_DEFAULT_CACHE = GraphIndexCache()
+
+
+def get_graph_index_cache() -> GraphIndexCache:
+    """
+    Get cache used by rpq and CFPQ algorithms
+    """
+    return _DEFAULT_CACHE
+
+
+def _check_nodes(graph: nx.MultiDiGraph, start_nodes: set, final_nodes: set):
+    """
+    Check that start and final nodes are nodes of graph, see graph_matrices
+    """
+    for name, nodes in (("start", start_nodes), ("final", final_nodes)):
+        if nodes is not None and not set(nodes).issubset(graph.nodes):
+            raise GraphException(
+                f"Invalid {name} states: {set(nodes).difference(set(graph.nodes))}"
+            )
+
+
+def graph_matrices(
+    graph: nx.MultiDiGraph,
+    start_nodes: set = None,
+    final_nodes: set = None,
+    labels: set = None,
+    backend: str = None,
+    order: str = None,
+) -> BooleanMatrices:
+    """
+    Get label matrices of graph from the default GraphIndexCache
+    restricted to given start and final nodes and labels,
+    replacing conversion of graph_to_nfa by BooleanMatrices.from_automaton.
+    Only edges with given labels are converted on miss
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph
+        Graph with labelled edges
+    start_nodes: set
+        Start nodes, all nodes by default
+    final_nodes: set
+        Final nodes, all nodes by default
+    labels: set
+        Labels of kept matrices, all by default
+    backend: str
+        Name of matrix backend, see project.matrix_backends
+    order: str
+        Order of nodes in matrices, see BooleanMatrices.reordered
+    Returns
+    -------
+    bm: BooleanMatrices
+        Copy of cached matrices, which may be modified by caller
+    Raises
+    ------
+    GraphException:
+        If start or final nodes are not nodes of graph
+    """
+    _check_nodes(graph, start_nodes, final_nodes)
+    bm = get_graph_index_cache().boolean_matrices(graph, backend, order, labels)
+    return bm.with_states(start_nodes, final_nodes, labels)
@@ -48,7 +48,7 @@ class FiniteAutomata(BaseAutomata):
             Reachable vertices set
         """
         bmatrix = BooleanMatrices(nfa)
-        return get_reachable(bmatrix)
+        return get_reachable(bmatrix, closure_algorithm="scc")
 
     @classmethod
     def fromGraph(cls, graph: MultiDiGraph) -> "FiniteAutomata":
@@ -164,9 +164,9 @@ class GqlCFG(BaseAutomata):
         ecfg = cfg_to_ecfg(self.cfg)
         rsm = ecfg_to_rsm(ecfg)
         rsm_bm = BooleanMatrices.from_rsm(rsm)
-        tc = rsm_bm.make_transitive_closure()
+        tc = rsm_bm.transitive_closure()
         reachable = set()
-        for i, j in zip(*tc.nonzero()):
+        for i, j in zip(*rsm_bm.matrix_backend.nonzero(tc)):
             reachable.add((i, rsm_bm.states_to_box_variable.get((i, j)), j))
 
         return Set(reachable)
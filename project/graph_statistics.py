@@ -0,0 +1,320 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+__all__ = ["GraphStatistics", "graph_statistics"]
+
+
+def _label_name(label):
+    """
+    Get plain value of label, labels of automata are pyformlang Symbols
+    """
+    return getattr(label, "value", label)
+
+
+class GraphStatistics:
+    """
+    Per-label statistics of labelled graph, used to estimate sizes of
+    query results. Parallel edges with the same label are counted once,
+    as in label matrices of BooleanMatrices
+
+    Attributes
+    ----------
+    num_nodes: int
+        Number of nodes in graph
+    label_edges: Dict[Any, int]
+        Mapping of labels to number of edges with label
+    label_sources: Dict[Any, int]
+        Mapping of labels to number of distinct nodes having outgoing edge with label
+    label_targets: Dict[Any, int]
+        Mapping of labels to number of distinct nodes having incoming edge with label
+    out_degree_histogram: List[int]
+        Number of nodes of every out-degree, degree is position in list
+    in_degree_histogram: List[int]
+        Number of nodes of every in-degree, degree is position in list
+    co_occurrence: Dict[Tuple[Any, Any], int]
+        Mapping of pairs of labels (a, b) to number of paths u -a-> v -b-> w,
+        pairs without such paths are omitted
+    """
+
+    def __init__(
+        self,
+        num_nodes: int,
+        label_edges: Dict,
+        label_sources: Dict,
+        label_targets: Dict,
+        out_degree_histogram: List[int],
+        in_degree_histogram: List[int],
+        co_occurrence: Dict[Tuple, int],
+    ):
+        self.num_nodes = num_nodes
+        self.label_edges = label_edges
+        self.label_sources = label_sources
+        self.label_targets = label_targets
+        self.out_degree_histogram = out_degree_histogram
+        self.in_degree_histogram = in_degree_histogram
+        self.co_occurrence = co_occurrence
+
+    @classmethod
+    def from_label_coords(cls, num_nodes: int, coords: Dict) -> "GraphStatistics":
+        """
+        Compute statistics in one pass over coordinates of labelled edges
+
+        Parameters
+        ----------
+        num_nodes: int
+            Number of nodes
+        coords: Dict[Any, Tuple[Sequence[int], Sequence[int]]]
+            Mapping of labels to pair of source and target index sequences
+        Returns
+        -------
+        statistics: GraphStatistics
+            Statistics of edges
+        """
+        labels = [_label_name(label) for label in coords]
+        label_edges, label_sources, label_targets = {}, {}, {}
+        out_degree = np.zeros(num_nodes, dtype=np.int64)
+        in_degree = np.zeros(num_nodes, dtype=np.int64)
+        in_rows, in_cols, in_counts = [], [], []
+        out_rows, out_cols, out_counts = [], [], []
+
+        for number, (label, (rows, cols)) in enumerate(zip(labels, coords.values())):
+            keys = np.unique(
+                np.asarray(rows, dtype=np.int64) * num_nodes
+                + np.asarray(cols, dtype=np.int64)
+            )
+            rows, cols = np.divmod(keys, max(1, num_nodes))
+            sources, source_degrees = np.unique(rows, return_counts=True)
+            targets, target_degrees = np.unique(cols, return_counts=True)
+            out_degree[sources] += source_degrees
+            in_degree[targets] += target_degrees
+            label_edges[label] = int(keys.size)
+            label_sources[label] = int(sources.size)
+            label_targets[label] = int(targets.size)
+            out_rows.append(np.full(sources.size, number))
+            out_cols.append(sources)
+            out_counts.append(source_degrees)
+            in_rows.append(np.full(targets.size, number))
+            in_cols.append(targets)
+            in_counts.append(target_degrees)
+
+        co_occurrence = {}
+        if labels:
+            shape = (len(labels), num_nodes)
+            incoming = sparse.csr_matrix(
+                (
+                    np.concatenate(in_counts),
+                    (np.concatenate(in_rows), np.concatenate(in_cols)),
+                ),
+                shape=shape,
+            )
+            outgoing = sparse.csr_matrix(
+                (
+                    np.concatenate(out_counts),
+                    (np.concatenate(out_rows), np.concatenate(out_cols)),
+                ),
+                shape=shape,
+            )
+            paths = (incoming @ outgoing.T).tocoo()
+            co_occurrence = {
+                (labels[first], labels[second]): int(count)
+                for first, second, count in zip(paths.row, paths.col, paths.data)
+            }
+
+        return cls(
+            num_nodes,
+            label_edges,
+            label_sources,
+            label_targets,
+            np.bincount(out_degree).tolist() if num_nodes else [],
+            np.bincount(in_degree).tolist() if num_nodes else [],
+            co_occurrence,
+        )
+
+    @classmethod
+    def from_boolean_matrices(cls, bm) -> "GraphStatistics":
+        """
+        Compute statistics of label matrices
+
+        Parameters
+        ----------
+        bm: BooleanMatrices
+            Label matrices of graph
+        Returns
+        -------
+        statistics: GraphStatistics
+            Statistics of label matrices
+        """
+        ops = bm.matrix_backend
+        return cls.from_label_coords(
+            bm.num_states,
+            {label: ops.nonzero(matrix) for label, matrix in bm.bool_matrices.items()},
+        )
+
+    @classmethod
+    def from_graph(cls, graph: nx.MultiDiGraph) -> "GraphStatistics":
+        """
+        Compute statistics of graph with labelled edges
+
+        Parameters
+        ----------
+        graph: nx.MultiDiGraph
+            Graph with "label" attribute on edges
+        Returns
+        -------
+        statistics: GraphStatistics
+            Statistics of graph
+        """
+        indexes = {node: index for index, node in enumerate(graph.nodes)}
+        coords = {}
+        for u, v, label in graph.edges(data="label"):
+            rows, cols = coords.setdefault(label, ([], []))
+            rows.append(indexes[u])
+            cols.append(indexes[v])
+        return cls.from_label_coords(len(indexes), coords)
+
+    @property
+    def num_edges(self) -> int:
+        return sum(self.label_edges.values())
+
+    @property
+    def labels(self) -> set:
+        return set(self.label_edges)
+
+    def selectivity(self, label) -> float:
+        """
+        Get fraction of pairs of nodes connected by edge with given label
+
+        Parameters
+        ----------
+        label: Any
+            Label of edges
+        Returns
+        -------
+        selectivity: float
+            Number of edges with label divided by squared number of nodes
+        """
+        if not self.num_nodes:
+            return 0.0
+        return self.label_edges.get(_label_name(label), 0) / self.num_nodes**2
+
+    def estimate_path_count(self, labels: Sequence) -> float:
+        """
+        Estimate number of paths spelling given word.
+        Paths of one or two edges are counted exactly,
+        longer paths are extended edge by edge assuming that
+        the next label depends only on the previous one
+
+        Parameters
+        ----------
+        labels: Sequence[Any]
+            Labels of path edges
+        Returns
+        -------
+        count: float
+            Estimated number of paths
+        """
+        labels = [_label_name(label) for label in labels]
+        if not labels:
+            return float(self.num_nodes)
+        count = float(self.label_edges.get(labels[0], 0))
+        for previous, label in zip(labels, labels[1:]):
+            edges = self.label_edges.get(previous, 0)
+            if not count or not edges:
+                return 0.0
+            count *= self.co_occurrence.get((previous, label), 0) / edges
+        return count
+
+    def to_dict(self) -> dict:
+        """
+        Get JSON-serializable representation of statistics, see from_dict
+        """
+        return {
+            "num_nodes": self.num_nodes,
+            "labels": [
+                [
+                    label,
+                    self.label_edges[label],
+                    self.label_sources[label],
+                    self.label_targets[label],
+                ]
+                for label in self.label_edges
+            ],
+            "out_degree_histogram": self.out_degree_histogram,
+            "in_degree_histogram": self.in_degree_histogram,
+            "co_occurrence": [
+                [first, second, count]
+                for (first, second), count in self.co_occurrence.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GraphStatistics":
+        """
+        Restore statistics from representation made by to_dict
+        """
+        return cls(
+            data["num_nodes"],
+            {label: edges for label, edges, _, _ in data["labels"]},
+            {label: sources for label, _, sources, _ in data["labels"]},
+            {label: targets for label, _, _, targets in data["labels"]},
+            data["out_degree_histogram"],
+            data["in_degree_histogram"],
+            {(first, second): count for first, second, count in data["co_occurrence"]},
+        )
+
+    def save(self, path: str):
+        """
+        Save statistics into JSON file
+
+        Parameters
+        ----------
+        path: str
+            Path to file
+        """
+        Path(path).write_text(json.dumps(self.to_dict()))
+
+    @classmethod
+    def load(cls, path: str) -> "GraphStatistics":
+        """
+        Load statistics saved by save
+
+        Parameters
+        ----------
+        path: str
+            Path to file
+        Returns
+        -------
+        statistics: GraphStatistics
+            Loaded statistics
+        """
+        return cls.from_dict(json.loads(Path(path).read_text()))
+
+    def __str__(self):
+        return f"""
+        Nodes count: {self.num_nodes}
+        Edges count: {self.num_edges}
+        Edges by label: {self.label_edges}
+    """
+
+
+def graph_statistics(graph) -> GraphStatistics:
+    """
+    Gets statistics of graph or its label matrices
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | BooleanMatrices
+        Graph with labelled edges or its label matrices
+    Returns
+    -------
+    GraphStatistics
+        Statistics of graph
+    """
+    if isinstance(graph, nx.MultiDiGraph):
+        return GraphStatistics.from_graph(graph)
+    return GraphStatistics.from_boolean_matrices(graph)
@@ -130,7 +130,10 @@ def generate_two_cycles_graph(
 
 
 def graph_to_nfa(
-    graph: MultiDiGraph, start_states: set = None, final_states: set = None
+    graph: MultiDiGraph,
+    start_states: set = None,
+    final_states: set = None,
+    labels: set = None,
 ) -> NondeterministicFiniteAutomaton:
     """
     Converts graph by name to the finite state automaton
@@ -143,6 +146,9 @@ def graph_to_nfa(
         Set of containing start nodes
     final_states: set
         Set of containing end nodes
+    labels: set
+        Labels of edges to keep, all by default.
+        Queries pass labels they can read, so other edges are never converted
 
     Returns
     -------
@@ -161,7 +167,8 @@ def graph_to_nfa(
 
     for n_from, n_to in graph.edges():
         e_data = graph.get_edge_data(n_from, n_to)[0]["label"]
-        nfa.add_transition(n_from, e_data, n_to)
+        if labels is None or e_data in labels:
+            nfa.add_transition(n_from, e_data, n_to)
 
     if start_states is None:
         start_states = set(graph_nodes)
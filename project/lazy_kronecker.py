@@ -0,0 +1,324 @@
+from typing import Dict, Tuple
+
+import numpy as np
+
+from project.matrix_backends import MatrixBackend, get_backend
+
+__all__ = ["LazyKronecker", "LazyIntersection"]
+
+
+def _expand_positions(indptr: np.ndarray, keys: np.ndarray):
+    """
+    Expand every key into positions of its neighbours in adjacency lists
+    given in CSR form
+
+    Parameters
+    ----------
+    indptr: np.ndarray
+        Offsets of adjacency lists of rows
+    keys: np.ndarray
+        Rows to expand
+    Returns
+    -------
+    expansion: Tuple[np.ndarray, np.ndarray]
+        Positions of keys repeated once per neighbour and positions of
+        the neighbours in concatenated adjacency lists
+    """
+    starts = indptr[keys]
+    counts = indptr[keys + 1] - starts
+    owners = np.repeat(np.arange(keys.size), counts)
+    offsets = np.arange(owners.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners, np.repeat(starts, counts) + offsets
+
+
+def _expand(indptr: np.ndarray, indices: np.ndarray, keys: np.ndarray):
+    """
+    Expand every key into its neighbours in adjacency lists given in CSR form
+
+    Parameters
+    ----------
+    indptr: np.ndarray
+        Offsets of adjacency lists of rows
+    indices: np.ndarray
+        Concatenated adjacency lists
+    keys: np.ndarray
+        Rows to expand
+    Returns
+    -------
+    expansion: Tuple[np.ndarray, np.ndarray]
+        Positions of keys repeated once per neighbour and the neighbours themselves
+    """
+    owners, positions = _expand_positions(indptr, keys)
+    return owners, indices[positions]
+
+
+class LazyKronecker:
+    """
+    Kronecker product of two boolean matrices which is never materialized.
+    Cell (i * m + j, k * m + l) is set iff lhs[i, k] and rhs[j, l] are set,
+    where m is number of rows of rhs.
+    Rows of the product are computed on demand from adjacency lists of factors
+
+    Attributes
+    ----------
+    lhs: Any
+        Left factor, boolean matrix of backend type
+    rhs: Any
+        Right factor, boolean matrix of backend type
+    ops: MatrixBackend
+        Backend of factors, also used for results of multiplications
+    shape: Tuple[int, int]
+        Shape of product
+    """
+
+    format = "lazy-kron"
+
+    def __init__(self, lhs, rhs, ops: MatrixBackend):
+        self.lhs = lhs
+        self.rhs = rhs
+        self.ops = ops
+        self.shape = (lhs.shape[0] * rhs.shape[0], lhs.shape[1] * rhs.shape[1])
+        self._lhs_lists = self._adjacency_lists(lhs)
+        self._rhs_lists = self._adjacency_lists(rhs)
+
+    def _adjacency_lists(self, matrix) -> Tuple[np.ndarray, np.ndarray]:
+        rows, cols = self.ops.nonzero(matrix)
+        order = np.argsort(rows, kind="stable")
+        counts = np.bincount(rows, minlength=matrix.shape[0])
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return indptr, np.asarray(cols, dtype=np.int64)[order]
+
+    @property
+    def nnz(self) -> int:
+        return self.ops.nnz(self.lhs) * self.ops.nnz(self.rhs)
+
+    def __getitem__(self, key: Tuple[int, int]) -> bool:
+        i, j = key
+        m, n = self.rhs.shape
+        return bool(self.lhs[i // m, j // n]) and bool(self.rhs[i % m, j % n])
+
+    def expand(self, rows: np.ndarray, states: np.ndarray):
+        """
+        Follow product transitions from given cells of a frontier
+
+        Parameters
+        ----------
+        rows: np.ndarray
+            Frontier rows of cells
+        states: np.ndarray
+            Product states of cells
+        Returns
+        -------
+        expansion: Tuple[np.ndarray, np.ndarray]
+            Frontier rows and product states reached in one step
+        """
+        m, n = self.rhs.shape
+        lhs_states, rhs_states = np.divmod(np.asarray(states, dtype=np.int64), m)
+        owners, lhs_to = _expand(*self._lhs_lists, lhs_states)
+        rhs_owners, rhs_to = _expand(*self._rhs_lists, rhs_states[owners])
+        owners = owners[rhs_owners]
+        return np.asarray(rows)[owners], lhs_to[rhs_owners] * n + rhs_to
+
+    def neighbours(self, state: int) -> np.ndarray:
+        """
+        Get columns of set cells in row of product
+
+        Parameters
+        ----------
+        state: int
+            Row of product
+        Returns
+        -------
+        neighbours: np.ndarray
+            Sorted columns of row
+        """
+        _, states = self.expand(np.zeros(1, dtype=np.int64), np.array([state]))
+        return np.unique(states)
+
+    def rmultiply(self, frontier):
+        """
+        Boolean product frontier @ self without materializing self
+
+        Parameters
+        ----------
+        frontier: Any
+            Boolean matrix of backend type with as many columns as self has rows
+        Returns
+        -------
+        product: Any
+            Boolean matrix of backend type
+        """
+        rows, states = self.expand(*self.ops.nonzero(frontier))
+        return self.ops.from_coords(rows, states, (frontier.shape[0], self.shape[1]))
+
+    def nonzero(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get coordinates of all set cells, materializing them
+
+        Returns
+        -------
+        coords: Tuple[np.ndarray, np.ndarray]
+            Row and column indices of set cells
+        """
+        rows = np.arange(self.shape[0], dtype=np.int64)
+        return self.expand(rows, rows)
+
+    def materialize(self):
+        """
+        Build product as boolean matrix of backend type
+        """
+        return self.ops.kron(self.lhs, self.rhs)
+
+    def __repr__(self):
+        return f"<LazyKronecker of shape {self.shape} with {self.nnz} nonzero cells>"
+
+
+class LazyIntersection:
+    """
+    Intersection of two automata given by boolean matrices,
+    with label matrices kept as LazyKronecker products.
+    Mirrors BooleanMatrices: traversals from start states via reachable_from_starts
+    only touch reached product states, while other methods delegate to
+    the materialized intersection built on first use
+
+    Attributes
+    ----------
+    first: BooleanMatrices
+        Left-hand side automaton
+    second: BooleanMatrices
+        Right-hand side automaton
+    num_states: int
+        Number of product states
+    backend: str
+        Requested matrix backend of product
+    storage: str
+        Name of backend storing factors and traversal results
+    bool_matrices: Dict[Any, LazyKronecker]
+        Mapping of common labels to lazy products of label matrices
+    closure_iterations: int
+        Number of frontier expansions done by the last reachable_from_starts call
+    """
+
+    def __init__(self, first, second, storage: str):
+        self.first = first
+        self.second = second
+        self.num_states = first.num_states * second.num_states
+        self.backend = first.backend
+        self.storage = storage
+        self.closure_iterations = 0
+        self._materialized = None
+        ops = self.matrix_backend
+        self.bool_matrices: Dict = {
+            label: LazyKronecker(
+                ops.convert(first.bool_matrices[label]),
+                ops.convert(second.bool_matrices[label]),
+                ops,
+            )
+            for label in first.bool_matrices.keys() & second.bool_matrices.keys()
+        }
+
+    @property
+    def matrix_backend(self) -> MatrixBackend:
+        return get_backend(self.storage)
+
+    def _product_indices(self, first_mask, second_mask) -> np.ndarray:
+        return np.add.outer(
+            np.flatnonzero(first_mask) * self.second.num_states,
+            np.flatnonzero(second_mask),
+        ).ravel()
+
+    def start_indices(self) -> np.ndarray:
+        """
+        Get sorted indices of product start states
+        """
+        return self._product_indices(self.first.start_mask(), self.second.start_mask())
+
+    def final_indices(self) -> np.ndarray:
+        """
+        Get sorted indices of product final states
+        """
+        return self._product_indices(self.first.final_mask(), self.second.final_mask())
+
+    @property
+    def start_states(self):
+        return set(self.start_indices().tolist())
+
+    @property
+    def final_states(self):
+        return set(self.final_indices().tolist())
+
+    @property
+    def state_indexes(self):
+        return self.materialize().state_indexes
+
+    def get_states(self):
+        return self.state_indexes.keys()
+
+    def get_start_states(self):
+        return self.start_states
+
+    def get_final_states(self):
+        return self.final_states
+
+    def reachable_from_starts(self, max_length: int = None):
+        """
+        Find product states reachable from every start state by nonempty path,
+        expanding frontier of reached states through lazy label matrices
+
+        Parameters
+        ----------
+        max_length: int
+            Largest length of paths, frontier is expanded at most
+            max_length times. Paths are not bounded by default
+
+        Returns
+        -------
+        reachable: Tuple[np.ndarray, Any]
+            Indices of start states and boolean matrix of backend type
+            with row i marking states reachable from i-th start state
+        """
+        ops = self.matrix_backend
+        starts = self.start_indices()
+        shape = (starts.size, self.num_states)
+        frontier = ops.from_coords(np.arange(starts.size), starts, shape)
+        visited = ops.zeros(shape)
+        self.closure_iterations = 0
+        while ops.nnz(frontier) and (
+            max_length is None or self.closure_iterations < max_length
+        ):
+            reached = ops.zeros(shape)
+            for matrix in self.bool_matrices.values():
+                reached = ops.add(reached, matrix.rmultiply(frontier))
+            frontier = ops.subtract(reached, visited)
+            visited = ops.add(visited, frontier)
+            self.closure_iterations += 1
+        return starts, visited
+
+    def materialize(self):
+        """
+        Build intersection with materialized Kronecker products
+
+        Returns
+        -------
+        intersection: BooleanMatrices
+            Intersection of automata
+        """
+        if self._materialized is None:
+            self._materialized = self.first.intersect(self.second)
+        return self._materialized
+
+    def transitive_closure(self, algorithm: str = "squaring"):
+        """
+        Computes transitive closure of materialized intersection,
+        see BooleanMatrices.transitive_closure
+        """
+        materialized = self.materialize()
+        tc = materialized.transitive_closure(algorithm)
+        self.closure_iterations = materialized.closure_iterations
+        return tc
+
+    def adjacency_matrix(self):
+        return self.materialize().adjacency_matrix()
+
+    def to_automaton(self):
+        return self.materialize().to_automaton()
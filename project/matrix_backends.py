@@ -0,0 +1,517 @@
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from project.bit_matrix import BitMatrix
+from project.set_matrix import SetMatrix
+
+__all__ = [
+    "MatrixBackend",
+    "ScipyBackend",
+    "ParallelScipyBackend",
+    "BitsetBackend",
+    "FourRussiansBackend",
+    "SetsBackend",
+    "register_backend",
+    "get_backend",
+    "available_backends",
+    "default_backend_name",
+    "BACKEND_ENV_VAR",
+    "WORKERS_ENV_VAR",
+    "AUTO_BACKEND",
+    "PARALLEL_MIN_NNZ",
+]
+
+BACKEND_ENV_VAR = "FLC_MATRIX_BACKEND"
+WORKERS_ENV_VAR = "FLC_WORKERS"
+AUTO_BACKEND = "auto"
+
+PARALLEL_MIN_NNZ = 1 << 16
+
+
+class MatrixBackend(ABC):
+    """
+    Interface of boolean matrix engine used by BooleanMatrices,
+    RPQ and CFPQ algorithms.
+    Backends are stateless, they operate on matrices of their own type
+
+    Attributes
+    ----------
+    name: str
+        Name of backend in registry
+    sparse_layout: bool
+        Whether cost of element-wise operations depends on number of nonzero cells
+        rather than on shape of matrices
+    """
+
+    name: str = None
+    sparse_layout: bool = True
+
+    @abstractmethod
+    def from_coords(self, rows, cols, shape: Tuple[int, int]):
+        """
+        Create matrix from coordinates of nonzero cells
+
+        Parameters
+        ----------
+        rows: Sequence[int]
+            Row indices of nonzero cells
+        cols: Sequence[int]
+            Column indices of nonzero cells
+        shape: Tuple[int, int]
+            Shape of matrix
+        Returns
+        -------
+        matrix: Any
+            Boolean matrix of backend type
+        """
+        pass
+
+    @abstractmethod
+    def multiply(self, lhs, rhs):
+        """
+        Boolean matrix product lhs @ rhs
+        """
+        pass
+
+    @abstractmethod
+    def add(self, lhs, rhs):
+        """
+        Element-wise boolean sum (OR) of matrices
+        """
+        pass
+
+    @abstractmethod
+    def subtract(self, lhs, rhs):
+        """
+        Element-wise boolean difference: cells of lhs which are not set in rhs
+        """
+        pass
+
+    @abstractmethod
+    def is_native(self, matrix) -> bool:
+        """
+        Check whether matrix has type of backend
+        """
+        pass
+
+    def from_label_coords(self, transitions: dict, shape: Tuple[int, int]) -> dict:
+        """
+        Create matrices of all labels from coordinates of their nonzero cells
+
+        Parameters
+        ----------
+        transitions: Dict[Any, Tuple[Sequence[int], Sequence[int]]]
+            Mapping of labels to pair of row and column index sequences
+        shape: Tuple[int, int]
+            Shape of matrices
+        Returns
+        -------
+        matrices: Dict[Any, Any]
+            Mapping of labels to boolean matrices of backend type
+        """
+        return {
+            label: self.from_coords(rows, cols, shape)
+            for label, (rows, cols) in transitions.items()
+        }
+
+    def zeros(self, shape: Tuple[int, int]):
+        return self.from_coords([], [], shape)
+
+    def identity(self, n: int):
+        indices = np.arange(n)
+        return self.from_coords(indices, indices, (n, n))
+
+    def nnz(self, matrix) -> int:
+        return matrix.nnz
+
+    def nonzero(self, matrix) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get row and column indices of nonzero cells
+        """
+        return matrix.nonzero()
+
+    def transpose(self, matrix):
+        rows, cols = self.nonzero(matrix)
+        return self.from_coords(cols, rows, (matrix.shape[1], matrix.shape[0]))
+
+    def rows(self, matrix, indices):
+        """
+        Get matrix of given rows of matrix, in order of indices
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        selector = self.from_coords(
+            np.arange(indices.size), indices, (indices.size, matrix.shape[0])
+        )
+        return self.multiply(selector, matrix)
+
+    def kron(self, lhs, rhs):
+        """
+        Kronecker product of matrices
+        """
+        lhs_rows, lhs_cols = self.nonzero(lhs)
+        rhs_rows, rhs_cols = self.nonzero(rhs)
+        rows = lhs_rows[:, None] * rhs.shape[0] + rhs_rows[None, :]
+        cols = lhs_cols[:, None] * rhs.shape[1] + rhs_cols[None, :]
+        return self.from_coords(
+            rows.ravel(),
+            cols.ravel(),
+            (lhs.shape[0] * rhs.shape[0], lhs.shape[1] * rhs.shape[1]),
+        )
+
+    def convert(self, matrix):
+        """
+        Convert boolean matrix of any supported type into backend type
+        """
+        if self.is_native(matrix):
+            return matrix
+        rows, cols = matrix.nonzero()
+        return self.from_coords(rows, cols, matrix.shape)
+
+
+class ScipyBackend(MatrixBackend):
+    """
+    Backend on top of scipy.sparse matrices of given format
+
+    Attributes
+    ----------
+    format: str
+        scipy.sparse format of matrices, e.g. "csr"
+    """
+
+    def __init__(self, format: str = "csr"):
+        self.name = format
+        self.format = format
+
+    def from_coords(self, rows, cols, shape):
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=shape, dtype=bool
+        )
+        return matrix.asformat(self.format)
+
+    def from_label_coords(self, transitions, shape):
+        """
+        Sort coordinates of all labels at once and slice CSR arrays
+        of every label out of them
+        """
+        if self.format != "csr":
+            return super().from_label_coords(transitions, shape)
+        labels = list(transitions.keys())
+        sizes = [len(rows) for rows, _ in transitions.values()]
+        label_ids = np.repeat(np.arange(len(labels)), sizes)
+        rows = np.fromiter(
+            (i for rows, _ in transitions.values() for i in rows),
+            dtype=np.int64,
+            count=sum(sizes),
+        )
+        cols = np.fromiter(
+            (j for _, cols in transitions.values() for j in cols),
+            dtype=np.int64,
+            count=sum(sizes),
+        )
+        order = np.lexsort((cols, rows, label_ids))
+        label_ids, rows, cols = label_ids[order], rows[order], cols[order]
+        unique = np.ones(label_ids.size, dtype=bool)
+        unique[1:] = (
+            (np.diff(label_ids) != 0) | (np.diff(rows) != 0) | (np.diff(cols) != 0)
+        )
+        label_ids, rows, cols = label_ids[unique], rows[unique], cols[unique]
+        bounds = np.searchsorted(label_ids, np.arange(len(labels) + 1))
+        index_dtype = np.int32 if max(shape + (cols.size,)) < 2**31 else np.int64
+        cols = cols.astype(index_dtype)
+
+        matrices = {}
+        for label_id, label in enumerate(labels):
+            start, end = bounds[label_id], bounds[label_id + 1]
+            indptr = np.searchsorted(rows[start:end], np.arange(shape[0] + 1))
+            indptr = indptr.astype(index_dtype)
+            matrices[label] = sparse.csr_matrix(
+                (np.ones(end - start, dtype=bool), cols[start:end], indptr),
+                shape=shape,
+            )
+        return matrices
+
+    def is_native(self, matrix):
+        return sparse.issparse(matrix) and matrix.format == self.format
+
+    def multiply(self, lhs, rhs):
+        return (lhs @ rhs).asformat(self.format)
+
+    def add(self, lhs, rhs):
+        return (lhs + rhs).asformat(self.format)
+
+    def subtract(self, lhs, rhs):
+        lhs, rhs = lhs.tocsr(), rhs.tocsr()
+        if 0 < lhs.nnz and lhs.nnz * 8 < rhs.nnz:
+            rows, cols = lhs.nonzero()
+            present = np.asarray(rhs[rows, cols]).ravel().astype(bool)
+            return self.from_coords(rows[~present], cols[~present], lhs.shape)
+        return (lhs > rhs).asformat(self.format)
+
+    def kron(self, lhs, rhs):
+        return sparse.kron(lhs, rhs, format=self.format)
+
+    def identity(self, n):
+        return sparse.identity(n, dtype=bool, format=self.format)
+
+    def transpose(self, matrix):
+        return matrix.T.asformat(self.format)
+
+    def rows(self, matrix, indices):
+        if self.format != "csr":
+            return super().rows(matrix, indices)
+        return matrix[np.asarray(indices, dtype=np.int64)]
+
+    def convert(self, matrix):
+        if sparse.issparse(matrix):
+            return matrix.asformat(self.format)
+        return super().convert(matrix)
+
+
+class ParallelScipyBackend(ScipyBackend):
+    """
+    CSR backend multiplying row blocks of left operand in a thread pool.
+    Blocks hold about the same number of nonzero cells, every block is
+    multiplied by the whole right operand which is shared read-only by threads,
+    and products of blocks are stacked back. scipy multiplies sparse matrices
+    in compiled code without holding the GIL, so blocks run on separate cores
+
+    Attributes
+    ----------
+    workers: int
+        Number of threads, value of FLC_WORKERS environment variable
+        at time of product or number of CPUs by default
+    min_nnz: int
+        Products of operands with fewer nonzero cells in total run on one thread
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        min_nnz: int = PARALLEL_MIN_NNZ,
+        name: str = "csr-parallel",
+    ):
+        super().__init__("csr")
+        self.name = name
+        self.workers = workers
+        self.min_nnz = min_nnz
+        self._pool = None
+        self._pool_workers = None
+
+    @property
+    def workers(self) -> int:
+        """
+        Number of threads, FLC_WORKERS is read on every access
+        unless number was given explicitly
+        """
+        if self._workers is not None:
+            return self._workers
+        return int(os.getenv(WORKERS_ENV_VAR, os.cpu_count() or 1))
+
+    @workers.setter
+    def workers(self, workers: int):
+        self._workers = workers or None
+
+    def _executor(self, workers: int) -> ThreadPoolExecutor:
+        if self._pool is None or self._pool_workers != workers:
+            self.close()
+            self._pool = ThreadPoolExecutor(workers)
+            self._pool_workers = workers
+        return self._pool
+
+    def close(self):
+        """
+        Shut down thread pool, it is started again by the next product
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def multiply(self, lhs, rhs):
+        lhs, rhs = lhs.tocsr(), rhs.tocsr()
+        workers = self.workers
+        if workers < 2 or lhs.shape[0] == 0 or lhs.nnz + rhs.nnz < self.min_nnz:
+            return lhs @ rhs
+        blocks = min(4 * workers, lhs.shape[0])
+        bounds = np.searchsorted(
+            lhs.indptr, np.linspace(0, lhs.nnz, blocks + 1), side="left"
+        )
+        bounds[0], bounds[-1] = 0, lhs.shape[0]
+        bounds = np.unique(bounds)
+        products = self._executor(workers).map(
+            lambda block: lhs[bounds[block] : bounds[block + 1]] @ rhs,
+            range(bounds.size - 1),
+        )
+        return sparse.vstack(list(products), format="csr")
+
+
+class BitsetBackend(MatrixBackend):
+    """
+    Backend on top of packed uint64 rows, see BitMatrix
+    """
+
+    name = "bitset"
+    sparse_layout = False
+
+    def from_coords(self, rows, cols, shape):
+        return BitMatrix.from_coords(rows, cols, shape)
+
+    def is_native(self, matrix):
+        return isinstance(matrix, BitMatrix)
+
+    def multiply(self, lhs, rhs):
+        return lhs @ rhs
+
+    def add(self, lhs, rhs):
+        return lhs + rhs
+
+    def subtract(self, lhs, rhs):
+        return BitMatrix(lhs.words & ~rhs.words, lhs.shape)
+
+    def identity(self, n):
+        return BitMatrix.identity(n)
+
+    def transpose(self, matrix):
+        return matrix.transpose()
+
+    def rows(self, matrix, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        return BitMatrix(matrix.words[indices], (indices.size, matrix.shape[1]))
+
+
+class FourRussiansBackend(BitsetBackend):
+    """
+    Backend on top of packed uint64 rows multiplying matrices
+    by the method of Four Russians, see BitMatrix.four_russians
+    """
+
+    name = "four-russians"
+
+    def multiply(self, lhs, rhs):
+        return lhs.four_russians(rhs)
+
+
+class SetsBackend(MatrixBackend):
+    """
+    Pure-Python backend on top of sets of column indices, see SetMatrix
+    """
+
+    name = "sets"
+
+    def from_coords(self, rows, cols, shape):
+        return SetMatrix.from_coords(rows, cols, shape)
+
+    def is_native(self, matrix):
+        return isinstance(matrix, SetMatrix)
+
+    def multiply(self, lhs, rhs):
+        return lhs @ rhs
+
+    def add(self, lhs, rhs):
+        return lhs + rhs
+
+    def subtract(self, lhs, rhs):
+        rows = {}
+        for i, cols in lhs.rows.items():
+            row = cols - rhs.rows.get(i, set())
+            if row:
+                rows[i] = row
+        return SetMatrix(rows, lhs.shape)
+
+    def identity(self, n):
+        return SetMatrix.identity(n)
+
+    def transpose(self, matrix):
+        return matrix.transpose()
+
+    def rows(self, matrix, indices):
+        return SetMatrix(
+            {
+                row: matrix.rows[index]
+                for row, index in enumerate(indices)
+                if index in matrix.rows
+            },
+            (len(indices), matrix.shape[1]),
+        )
+
+
+_REGISTRY: Dict[str, MatrixBackend] = {}
+
+
+def register_backend(backend: MatrixBackend):
+    """
+    Register backend under its name, replacing backend with the same name
+
+    Parameters
+    ----------
+    backend: MatrixBackend
+        Backend to register
+    Raises
+    ------
+    ValueError
+        If backend name is empty or reserved
+    """
+    if not backend.name or backend.name == AUTO_BACKEND:
+        raise ValueError(f"Invalid backend name: {backend.name}")
+    _REGISTRY[backend.name] = backend
+
+
+def get_backend(name: str) -> MatrixBackend:
+    """
+    Get registered backend by name
+
+    Parameters
+    ----------
+    name: str
+        Name of backend
+    Returns
+    -------
+    backend: MatrixBackend
+        Registered backend
+    Raises
+    ------
+    ValueError
+        If there is no backend with given name
+    """
+    if name not in _REGISTRY:
+        raise ValueError(
+            f"Unknown backend: {name}, expected one of {available_backends()}"
+        )
+    return _REGISTRY[name]
+
+
+def available_backends() -> List[str]:
+    """
+    Get names of registered backends
+
+    Returns
+    -------
+    names: List[str]
+        Names of registered backends
+    """
+    return list(_REGISTRY.keys())
+
+
+def default_backend_name() -> str:
+    """
+    Get backend name used when none is given explicitly:
+    value of FLC_MATRIX_BACKEND environment variable or "auto"
+
+    Returns
+    -------
+    name: str
+        Name of default backend
+    """
+    return os.getenv(BACKEND_ENV_VAR, AUTO_BACKEND)
+
+
+register_backend(ScipyBackend("csr"))
+register_backend(ScipyBackend("dok"))
+register_backend(ParallelScipyBackend())
+register_backend(BitsetBackend())
+register_backend(FourRussiansBackend())
+register_backend(SetsBackend())
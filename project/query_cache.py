@@ -0,0 +1,249 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Tuple, Union
+
+from pyformlang.finite_automaton import DeterministicFiniteAutomaton
+from pyformlang.regular_expression import Regex
+
+from project.boolean_matrices import BooleanMatrices
+from project.matrix_backends import default_backend_name
+
+__all__ = [
+    "CompiledQuery",
+    "QueryCache",
+    "QueryCacheInfo",
+    "get_query_cache",
+    "QUERY_CACHE_SIZE",
+]
+
+QUERY_CACHE_SIZE = 256
+
+
+class QueryCacheInfo(NamedTuple):
+    """
+    Counters of QueryCache, see QueryCache.info
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+def _regex_key(regex: Regex) -> Tuple:
+    """
+    Build hashable key of parse tree of regular expression, where every node
+    is kept with type of its head, so that operators and Empty or Epsilon nodes
+    are never mistaken for symbols with the same text
+    """
+    return (type(regex.head).__name__, regex.head.value) + tuple(
+        _regex_key(son) for son in regex.sons
+    )
+
+
+class CompiledQuery:
+    """
+    Regular expression compiled into minimal DFA, with boolean matrices
+    of the DFA built on first request for every backend
+
+    Attributes
+    ----------
+    key: Tuple
+        Canonical key of regular expression, see QueryCache.canonical
+    dfa: DeterministicFiniteAutomaton
+        Minimal DFA equivalent to regular expression
+    matrices: Dict[str, BooleanMatrices]
+        Mapping of backend names to boolean matrices of dfa
+    """
+
+    def __init__(self, key: Tuple, dfa: DeterministicFiniteAutomaton):
+        self.key = key
+        self.dfa = dfa
+        self.matrices: Dict[str, BooleanMatrices] = {}
+
+    @classmethod
+    def compile(cls, regex: Regex) -> "CompiledQuery":
+        """
+        Build minimal DFA of regular expression
+
+        Parameters
+        ----------
+        regex: Regex
+            Regular expression
+        Returns
+        -------
+        query: CompiledQuery
+            Compiled query without boolean matrices
+        """
+        dfa = regex.to_epsilon_nfa().to_deterministic().minimize()
+        return cls(_regex_key(regex), dfa)
+
+    def boolean_matrices(self, backend: str = None) -> BooleanMatrices:
+        """
+        Get boolean matrices of dfa for given backend, built once
+
+        Parameters
+        ----------
+        backend: str
+            Name of matrix backend, see project.matrix_backends
+        Returns
+        -------
+        bm: BooleanMatrices
+            Boolean matrices of dfa shared by all callers
+        """
+        backend = backend or default_backend_name()
+        if backend not in self.matrices:
+            self.matrices[backend] = BooleanMatrices.from_automaton(self.dfa, backend)
+        return self.matrices[backend]
+
+
+class QueryCache:
+    """
+    Bounded cache of compiled regular expressions keyed by their parse
+    trees, so that equal expressions written differently, e.g. with
+    different parentheses or as PythonRegex, share one entry.
+    When cache is full, the least recently used entry is evicted
+
+    Attributes
+    ----------
+    maxsize: int
+        Largest number of cached queries, 0 disables caching
+    hits: int
+        Number of lookups of cached queries
+    misses: int
+        Number of lookups compiling query
+    evictions: int
+        Number of queries evicted to make room for new ones
+    """
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE):
+        if maxsize < 0:
+            raise ValueError(f"Size of cache should be nonnegative: {maxsize}")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._queries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def canonical(regex: Union[str, Regex]) -> Tuple:
+        """
+        Get canonical key of regular expression
+
+        Parameters
+        ----------
+        regex: str | Regex
+            Regular expression or its string representation
+        Returns
+        -------
+        key: Tuple
+            Parse tree of expression as nested tuples
+            (type of node, value of node, keys of children...)
+        Raises
+        ------
+        MisformedRegexError
+            If there is wrong form of string representation of regular expression
+        """
+        return _regex_key(Regex(regex) if isinstance(regex, str) else regex)
+
+    def get(self, regex: Union[str, Regex]) -> CompiledQuery:
+        """
+        Get compiled query, compiling and caching it on miss
+
+        Parameters
+        ----------
+        regex: str | Regex
+            Regular expression or its string representation
+        Returns
+        -------
+        query: CompiledQuery
+            Compiled query shared by all callers, which must not modify it
+        """
+        if isinstance(regex, str):
+            regex = Regex(regex)
+        key = self.canonical(regex)
+        with self._lock:
+            query = self._queries.get(key)
+            if query is not None:
+                self._queries.move_to_end(key)
+                self.hits += 1
+                return query
+            self.misses += 1
+
+        query = CompiledQuery.compile(regex)
+        with self._lock:
+            if key in self._queries:
+                return self._queries[key]
+            if self.maxsize:
+                self._queries[key] = query
+            while len(self._queries) > self.maxsize:
+                self._queries.popitem(last=False)
+                self.evictions += 1
+        return query
+
+    def min_dfa(self, regex: Union[str, Regex]) -> DeterministicFiniteAutomaton:
+        """
+        Get minimal DFA of regular expression shared by all callers
+        """
+        return self.get(regex).dfa
+
+    def boolean_matrices(
+        self, regex: Union[str, Regex], backend: str = None
+    ) -> BooleanMatrices:
+        """
+        Get boolean matrices of minimal DFA of regular expression
+        shared by all callers, see CompiledQuery.boolean_matrices
+        """
+        return self.get(regex).boolean_matrices(backend)
+
+    def resize(self, maxsize: int):
+        """
+        Change size of cache evicting the least recently used queries
+        which do not fit it
+        """
+        if maxsize < 0:
+            raise ValueError(f"Size of cache should be nonnegative: {maxsize}")
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._queries) > maxsize:
+                self._queries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop cached queries and reset counters
+        """
+        with self._lock:
+            self._queries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> QueryCacheInfo:
+        """
+        Get counters of cache
+        """
+        with self._lock:
+            return QueryCacheInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self.maxsize,
+                len(self._queries),
+            )
+
+    def __contains__(self, regex) -> bool:
+        return self.canonical(regex) in self._queries
+
+    def __len__(self):
+        return len(self._queries)
+
+
+_DEFAULT_CACHE = QueryCache()
+
+
+def get_query_cache() -> QueryCache:
+    """
+    Get cache used by regex_to_min_dfa, regex_str_to_min_dfa and rpq
+    """
+    return _DEFAULT_CACHE
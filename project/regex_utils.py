@@ -1,12 +1,15 @@
 from pyformlang.finite_automaton import DeterministicFiniteAutomaton
 from pyformlang.regular_expression import Regex
 
+from project.query_cache import get_query_cache
+
 __all__ = ["regex_str_to_min_dfa", "regex_to_min_dfa", "check_regex_equality"]
 
 
 def regex_str_to_min_dfa(regex_str: str) -> DeterministicFiniteAutomaton:
     """
-    Gets a string representation of regular expression and builds equivalent Deterministic Finite Automaton
+    Gets a string representation of regular expression and builds equivalent Deterministic Finite Automaton.
+    Automata are cached by parse tree of expression, see QueryCache
 
     Parameters
     ----------
@@ -16,23 +19,20 @@ def regex_str_to_min_dfa(regex_str: str) -> DeterministicFiniteAutomaton:
     Returns
     -------
     DeterministicFiniteAutomaton
-        Deterministic Finite Automaton, which is equivalent to given regular expression
+        Copy of cached Deterministic Finite Automaton, which is equivalent to given regular expression
 
     Raises
     ------
     MisformedRegexError
         If there is wrong form of string representation of regular expression
     """
-    regex = Regex(regex_str)
-    enfa = regex.to_epsilon_nfa()
-    dfa = enfa.to_deterministic()
-    dfa_min = dfa.minimize()
-    return dfa_min
+    return get_query_cache().min_dfa(regex_str).copy()
 
 
 def regex_to_min_dfa(regex: Regex) -> DeterministicFiniteAutomaton:
     """
-    Gets a regular expression and builds equivalent Deterministic Finite Automaton
+    Gets a regular expression and builds equivalent Deterministic Finite Automaton.
+    Automata are cached by parse tree of expression, see QueryCache
 
     Parameters
     ----------
@@ -42,17 +42,14 @@ def regex_to_min_dfa(regex: Regex) -> DeterministicFiniteAutomaton:
     Returns
     -------
     DeterministicFiniteAutomaton
-        Deterministic Finite Automaton, which is equivalent to given regular expression
+        Copy of cached Deterministic Finite Automaton, which is equivalent to given regular expression
 
     Raises
     ------
     MisformedRegexError
         If there is wrong form of string representation of regular expression
     """
-    enfa = regex.to_epsilon_nfa()
-    dfa = enfa.to_deterministic()
-    dfa_min = dfa.minimize()
-    return dfa_min
+    return get_query_cache().min_dfa(regex).copy()
 
 
 def check_regex_equality(r1: Regex, r2: Regex):
@@ -1,56 +1,479 @@
-from typing import Tuple, Set
+from typing import Any, Dict, Iterator, Mapping, Tuple, Set, Sequence, Union
 
 import networkx as nx
+import numpy as np
 from pyformlang.regular_expression import Regex
 
-from project import regex_to_min_dfa, graph_to_nfa, BooleanMatrices
+from project import (
+    BooleanMatrices,
+    CondensedClosure,
+    GraphStatistics,
+    LazyIntersection,
+    Semiring,
+    get_semiring,
+    get_query_cache,
+    get_graph_index_cache,
+    graph_matrices,
+)
+from project.graph_index import _check_nodes
 
-__all__ = ["rpq", "get_reachable"]
+__all__ = [
+    "rpq",
+    "rpq_iter",
+    "get_reachable",
+    "get_reachable_from",
+    "iter_reachable",
+    "iter_reachable_from",
+    "RPQ_MODES",
+    "BFS_START_NODES_RATIO",
+    "LAZY_MIN_PRODUCT_EDGES",
+    "REACHABLE_CHUNK_SIZE",
+    "accepts_nonempty_word",
+    "rpq_values",
+    "rpq_batch",
+]
+
+RPQ_MODES = ("auto", "closure", "bfs", "lazy")
+
+BFS_START_NODES_RATIO = 0.1
+
+LAZY_MIN_PRODUCT_EDGES = 1 << 24
+
+REACHABLE_CHUNK_SIZE = 1 << 16
 
 
 def get_reachable(
-    bmatrix: BooleanMatrices, query_bm: BooleanMatrices = None
+    bmatrix: BooleanMatrices,
+    query_bm: BooleanMatrices = None,
+    closure_algorithm: str = "squaring",
+    max_length: int = None,
 ) -> Set[Tuple[int, int]]:
     """
     Parameters
     ----------
-    bmatrix: BooleanMatrices
-        Boolean matrix object
+    bmatrix: BooleanMatrices | LazyIntersection
+        Boolean matrix object, lazy intersection is traversed from start states
     query_bm: BooleanMatrices
         Query boolean matrix object
+    closure_algorithm: str
+        Transitive closure algorithm, see BooleanMatrices.transitive_closure
+    max_length: int
+        Largest length of paths. When given, frontier of start states is
+        expanded at most max_length times instead of computing closure
     Returns
     -------
         reachable: Set[Tuple[int, int]]
             All reachable nodes, according to start and final states
     """
-    transitive_closure = bmatrix.transitive_closure()
+    chunks = iter_reachable(bmatrix, query_bm, closure_algorithm, max_length)
+    if query_bm is None:
+        found = next(chunks, None) is not None
+        return {(bmatrix.num_states, bmatrix.num_states)} if found else set()
+    return _pairs_set(chunks)
+
+
+def iter_reachable(
+    bmatrix: BooleanMatrices,
+    query_bm: BooleanMatrices = None,
+    closure_algorithm: str = "squaring",
+    max_length: int = None,
+    chunk_size: int = REACHABLE_CHUNK_SIZE,
+    limit: int = None,
+) -> Iterator[np.ndarray]:
+    """
+    Generates pairs of graph states found by get_reachable in chunks decoded
+    from rows of closure of a few start states at a time, so pairs are never
+    collected all at once
+
+    Parameters
+    ----------
+    bmatrix: BooleanMatrices | LazyIntersection
+        Boolean matrix object of product of graph and query
+    query_bm: BooleanMatrices
+        Query boolean matrix object, pairs of product states are generated
+        when it is not given
+    closure_algorithm: str
+        Transitive closure algorithm, see BooleanMatrices.transitive_closure
+    max_length: int
+        Largest length of paths, see get_reachable
+    chunk_size: int
+        Largest number of pairs in chunk
+    limit: int
+        Largest number of generated pairs, generation stops as soon as
+        it is reached. Pairs are not limited by default
+    Returns
+    -------
+    chunks: Iterator[np.ndarray]
+        Arrays of shape (k, 2) with distinct pairs of indices
+        of graph start and final states
+    """
+    q = query_bm.num_states if query_bm is not None else 1
+    if isinstance(bmatrix, LazyIntersection):
+        starts, reachable = bmatrix.reachable_from_starts(max_length)
+        final_mask = np.zeros(bmatrix.num_states, dtype=bool)
+        final_mask[bmatrix.final_indices()] = True
+        blocks = _visited_blocks(bmatrix, starts, reachable, final_mask, q, chunk_size)
+    elif max_length is not None:
+        starts, reachable = _bounded_visited(bmatrix, max_length)
+        blocks = _visited_blocks(
+            bmatrix, starts, reachable, bmatrix.final_mask(), q, chunk_size
+        )
+    else:
+        blocks = _closure_blocks(bmatrix, closure_algorithm, q, chunk_size)
+    return _limited(blocks, chunk_size, limit)
 
-    start_states = bmatrix.get_start_states()
-    final_states = bmatrix.get_final_states()
 
-    result_set = set()
+def _pairs_set(chunks: Iterator[np.ndarray]) -> Set[Tuple[int, int]]:
+    """
+    Collect chunks of pairs of indices into set
+    """
+    pairs = set()
+    for chunk in chunks:
+        pairs.update(zip(chunk[:, 0].tolist(), chunk[:, 1].tolist()))
+    return pairs
+
 
-    for state_from, state_to in zip(*transitive_closure.nonzero()):
-        if state_from in start_states and state_to in final_states:
-            result_set.add(
-                (
-                    state_from // query_bm.num_states
-                    if query_bm is not None
-                    else bmatrix.num_states,
-                    state_to // query_bm.num_states
-                    if query_bm is not None
-                    else bmatrix.num_states,
-                )
+def _limited(
+    blocks: Iterator[np.ndarray], chunk_size: int, limit: int = None
+) -> Iterator[np.ndarray]:
+    """
+    Split blocks of pairs into chunks of at most chunk_size pairs
+    and stop after limit pairs
+    """
+    if chunk_size < 1:
+        raise ValueError(f"Size of chunks should be positive: {chunk_size}")
+    remaining = limit
+    for block in blocks:
+        for lo in range(0, block.shape[0], chunk_size):
+            if remaining is not None and remaining <= 0:
+                return
+            chunk = block[lo : lo + chunk_size]
+            if remaining is not None:
+                chunk = chunk[:remaining]
+                remaining -= chunk.shape[0]
+            yield chunk
+
+
+def _source_blocks(sources: np.ndarray, rows_per_block: int):
+    """
+    Split sorted graph states of rows into consecutive slices
+    of about rows_per_block rows, rows of the same state stay in one slice
+    """
+    lo = 0
+    while lo < sources.size:
+        hi = min(lo + rows_per_block, sources.size)
+        if hi < sources.size and sources[hi] == sources[hi - 1]:
+            hi = int(np.searchsorted(sources, sources[hi - 1], side="right"))
+        yield lo, hi
+        lo = hi
+
+
+def _rows_per_block(bmatrix, q: int, chunk_size: int) -> int:
+    """
+    Number of rows of closure decoded together, so that every block
+    gives about chunk_size pairs of graph states at most
+    """
+    return max(1, chunk_size // max(1, bmatrix.num_states // q))
+
+
+def _graph_pairs(rows: np.ndarray, cols: np.ndarray, q: int) -> np.ndarray:
+    """
+    Project pairs of product states onto distinct pairs of graph states
+    """
+    pairs = np.stack((rows // q, cols // q), axis=1)
+    return np.unique(pairs, axis=0) if pairs.size else pairs.reshape(0, 2)
+
+
+def _closure_blocks(
+    bmatrix: BooleanMatrices, closure_algorithm: str, q: int, chunk_size: int
+) -> Iterator[np.ndarray]:
+    """
+    Decode rows of start states of transitive closure of product block by block
+    """
+    if not bmatrix.bool_matrices:
+        return
+    transitive_closure = bmatrix.transitive_closure(closure_algorithm)
+    ops = bmatrix.matrix_backend
+    starts = np.flatnonzero(bmatrix.start_mask())
+    final_mask = bmatrix.final_mask()
+    rows_per_block = _rows_per_block(bmatrix, q, chunk_size)
+    for lo, hi in _source_blocks(starts // q, rows_per_block):
+        if isinstance(transitive_closure, CondensedClosure):
+            rows, cols = transitive_closure.nonzero_between(starts[lo:hi], final_mask)
+        else:
+            rows, cols = ops.nonzero(ops.rows(transitive_closure, starts[lo:hi]))
+            rows = starts[lo:hi][rows]
+            accepted = final_mask[cols]
+            rows, cols = rows[accepted], cols[accepted]
+        yield _graph_pairs(rows, cols, q)
+
+
+def _visited_blocks(
+    bmatrix,
+    starts: np.ndarray,
+    visited,
+    final_mask: np.ndarray,
+    q: int,
+    chunk_size: int,
+) -> Iterator[np.ndarray]:
+    """
+    Decode matrix of states visited from start states block by block,
+    row i of visited holds states reached from i-th start state
+    """
+    ops = bmatrix.matrix_backend
+    rows_per_block = _rows_per_block(bmatrix, q, chunk_size)
+    for lo, hi in _source_blocks(starts // q, rows_per_block):
+        rows, cols = ops.nonzero(ops.rows(visited, np.arange(lo, hi)))
+        accepted = final_mask[cols]
+        yield _graph_pairs(starts[lo:hi][rows[accepted]], cols[accepted], q)
+
+
+def _bounded_visited(bmatrix: BooleanMatrices, max_length: int):
+    """
+    Finds product states reachable from every start state by nonempty path
+    of at most max_length edges, expanding frontier of start states
+    through label matrices max_length times at most
+    """
+    ops = bmatrix.matrix_backend
+    starts = np.flatnonzero(bmatrix.start_mask())
+    shape = (starts.size, bmatrix.num_states)
+    frontier = ops.from_coords(np.arange(starts.size), starts, shape)
+    visited = ops.zeros(shape)
+    matrices = [ops.convert(matrix) for matrix in bmatrix.bool_matrices.values()]
+    bmatrix.closure_iterations = 0
+    while ops.nnz(frontier) and bmatrix.closure_iterations < max_length:
+        reached = ops.zeros(shape)
+        for matrix in matrices:
+            reached = ops.add(reached, ops.multiply(frontier, matrix))
+        frontier = ops.subtract(reached, visited)
+        visited = ops.add(visited, frontier)
+        bmatrix.closure_iterations += 1
+    return starts, visited
+
+
+def get_reachable_from(
+    graph_bm: BooleanMatrices,
+    query_bm: BooleanMatrices,
+    start_indices: Sequence[int] = None,
+    max_length: int = None,
+) -> Set[Tuple[int, int]]:
+    """
+    Finds pairs of graph states connected by path accepted by query
+    using breadth-first search over product of graph and query from start states only.
+    Frontier is a block of vectors, one (query states x graph states) block per
+    start state, propagated through label matrices of graph and query
+    without building their product, so cost depends on reachable part of product
+
+    Parameters
+    ----------
+    graph_bm: BooleanMatrices
+        Boolean matrix object of graph
+    query_bm: BooleanMatrices
+        Boolean matrix object of query
+    start_indices: Sequence[int]
+        Indices of graph states to start from, start states of graph_bm by default
+    max_length: int
+        Largest length of paths, frontier is expanded at most max_length times.
+        Paths are not bounded by default
+    Returns
+    -------
+        reachable: Set[Tuple[int, int]]
+            Pairs of indices of graph start and final states
+    """
+    return _pairs_set(
+        iter_reachable_from(graph_bm, query_bm, start_indices, max_length)
+    )
+
+
+def iter_reachable_from(
+    graph_bm: BooleanMatrices,
+    query_bm: BooleanMatrices,
+    start_indices: Sequence[int] = None,
+    max_length: int = None,
+    chunk_size: int = REACHABLE_CHUNK_SIZE,
+    limit: int = None,
+) -> Iterator[np.ndarray]:
+    """
+    Generates pairs of graph states found by get_reachable_from in chunks
+    decoded from visited states of a few start states at a time
+
+    Parameters
+    ----------
+    graph_bm: BooleanMatrices
+        Boolean matrix object of graph
+    query_bm: BooleanMatrices
+        Boolean matrix object of query
+    start_indices: Sequence[int]
+        Indices of graph states to start from, start states of graph_bm by default
+    max_length: int
+        Largest length of paths, see get_reachable_from
+    chunk_size: int
+        Largest number of pairs in chunk
+    limit: int
+        Largest number of generated pairs, pairs are not limited by default
+    Returns
+    -------
+    chunks: Iterator[np.ndarray]
+        Arrays of shape (k, 2) with distinct pairs of indices
+        of graph start and final states
+    """
+    return _limited(
+        _bfs_blocks(graph_bm, query_bm, start_indices, max_length, chunk_size),
+        chunk_size,
+        limit,
+    )
+
+
+def _bfs_blocks(
+    graph_bm: BooleanMatrices,
+    query_bm: BooleanMatrices,
+    start_indices: Sequence[int],
+    max_length: int,
+    chunk_size: int,
+) -> Iterator[np.ndarray]:
+    """
+    Search product of graph and query from start states, see get_reachable_from,
+    and decode visited states block by block
+    """
+    if start_indices is None:
+        start_indices = np.flatnonzero(graph_bm.start_mask())
+    start_indices = sorted(start_indices)
+    query_starts = np.flatnonzero(query_bm.start_mask()).tolist()
+    ops = graph_bm.matrix_backend
+    n, q, k = graph_bm.num_states, query_bm.num_states, len(start_indices)
+    if not n or not q or not k or not query_starts:
+        return
+
+    frontier = ops.from_coords(
+        [s * q + q0 for s in range(k) for q0 in query_starts],
+        [start_indices[s] for s in range(k) for _ in query_starts],
+        (k * q, n),
+    )
+    steps = [
+        (
+            ops.kron(
+                ops.identity(k),
+                ops.transpose(ops.convert(query_bm.bool_matrices[label])),
+            ),
+            ops.convert(graph_bm.bool_matrices[label]),
+        )
+        for label in query_bm.bool_matrices.keys() & graph_bm.bool_matrices.keys()
+    ]
+    visited = ops.zeros((k * q, n))
+
+    steps_done = 0
+    while ops.nnz(frontier) and (max_length is None or steps_done < max_length):
+        reached = ops.zeros((k * q, n))
+        for query_step, graph_step in steps:
+            reached = ops.add(
+                reached, ops.multiply(query_step, ops.multiply(frontier, graph_step))
             )
+        frontier = ops.subtract(reached, visited)
+        visited = ops.add(visited, frontier)
+        steps_done += 1
 
-    return result_set
+    start_indices = np.asarray(start_indices)
+    query_final_mask = query_bm.final_mask()
+    graph_final_mask = graph_bm.final_mask()
+    sources_per_block = max(1, chunk_size // n)
+    for lo in range(0, k, sources_per_block):
+        hi = min(lo + sources_per_block, k)
+        rows, cols = ops.nonzero(ops.rows(visited, np.arange(lo * q, hi * q)))
+        sources, query_states = np.divmod(rows, q)
+        accepted = query_final_mask[query_states] & graph_final_mask[cols]
+        pairs = np.stack(
+            (start_indices[lo + sources[accepted]], cols[accepted]), axis=1
+        )
+        yield np.unique(pairs, axis=0) if pairs.size else pairs.reshape(0, 2)
+
+
+def accepts_nonempty_word(bm: BooleanMatrices, labels) -> bool:
+    """
+    Check whether automaton accepts a nonempty word built from given labels only.
+    Graph lacking a label which every accepted word of query contains
+    has no answers, which is found without building their product
+
+    Parameters
+    ----------
+    bm: BooleanMatrices
+        Boolean matrix object of automaton
+    labels: Iterable[Any]
+        Labels allowed in words
+    Returns
+    -------
+    accepts: bool
+        True if some nonempty word over labels is accepted
+    """
+    ops = bm.matrix_backend
+    n = bm.num_states
+    adjacency = ops.zeros((n, n))
+    for label in set(labels) & bm.bool_matrices.keys():
+        adjacency = ops.add(adjacency, bm.bool_matrices[label])
+    starts = np.flatnonzero(bm.start_mask())
+    frontier = ops.multiply(
+        ops.from_coords(np.zeros(starts.size, dtype=np.int64), starts, (1, n)),
+        adjacency,
+    )
+    visited = frontier
+    while ops.nnz(frontier):
+        frontier = ops.subtract(ops.multiply(frontier, adjacency), visited)
+        visited = ops.add(visited, frontier)
+    return bool(bm.final_mask()[ops.nonzero(visited)[1]].any())
+
+
+def _estimate_product_edges(
+    statistics: GraphStatistics, query_bm: BooleanMatrices
+) -> int:
+    """
+    Estimate number of edges in product of graph and query from graph statistics
+    """
+    query_ops = query_bm.matrix_backend
+    return sum(
+        statistics.label_edges.get(getattr(label, "value", label), 0)
+        * query_ops.nnz(matrix)
+        for label, matrix in query_bm.bool_matrices.items()
+    )
+
+
+def _prepare_matrices(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
+    query: Regex,
+    start_nodes: set = None,
+    final_nodes: set = None,
+    backend: str = None,
+    order: str = None,
+) -> Tuple[BooleanMatrices, BooleanMatrices, BooleanMatrices]:
+    """
+    Build matrices of query and of graph pruned to labels of query,
+    also returns matrices of the whole graph, which cache statistics
+    unlike their copies made by with_states
+    """
+    query_bm = get_query_cache().boolean_matrices(query, backend)
+    labels = {getattr(label, "value", label) for label in query_bm.bool_matrices}
+    if isinstance(graph, BooleanMatrices):
+        prepared = graph
+        graph_bm = graph.with_states(start_nodes, final_nodes, labels)
+        if order is not None:
+            graph_bm = graph_bm.reordered(order)
+    else:
+        _check_nodes(graph, start_nodes, final_nodes)
+        prepared = get_graph_index_cache().boolean_matrices(
+            graph, backend, order, labels
+        )
+        graph_bm = prepared.with_states(start_nodes, final_nodes, labels)
+    return graph_bm, query_bm, prepared
 
 
 def rpq(
-    graph: nx.MultiDiGraph,
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
     query: Regex,
     start_nodes: set = None,
     final_nodes: set = None,
+    backend: str = None,
+    closure_algorithm: str = "squaring",
+    mode: str = "auto",
+    order: str = None,
+    max_length: int = None,
 ):
     """
     This function solves Regular Path Querying problem for
@@ -58,14 +481,26 @@ def rpq(
 
     Parameters
     ----------
-    graph: nx.MultiDiGraph
-        Graph for working with queries
+    graph: nx.MultiDiGraph | BooleanMatrices
+        Graph for working with queries, or its prepared boolean matrices,
+        e.g. loaded by BooleanMatrices.load, which keep their storage
     query: Regex
         Query represented by regex
     start_nodes:
         Set of start nodes in graph
     final_nodes:
         Set of final nodes in graph
+    backend: str
+        Name of matrix backend, see project.matrix_backends
+    closure_algorithm: str
+        Transitive closure algorithm, see BooleanMatrices.transitive_closure
+    mode: str
+        One of RPQ_MODES, see rpq_iter
+    order: str
+        Order of graph nodes in matrices, one of VERTEX_ORDERS,
+        see BooleanMatrices.reordered. Graph nodes keep their order by default
+    max_length: int
+        Largest length of matching paths, see rpq_iter
 
     Returns
     -------
@@ -73,10 +508,327 @@ def rpq(
         Set of pairs with answer to RPG problem
 
     """
-    graph_bm = BooleanMatrices.from_automaton(
-        graph_to_nfa(graph, start_nodes, final_nodes)
+    return set(
+        rpq_iter(
+            graph,
+            query,
+            start_nodes,
+            final_nodes,
+            backend,
+            closure_algorithm,
+            mode,
+            order,
+            max_length,
+        )
+    )
+
+
+def rpq_iter(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
+    query: Regex,
+    start_nodes: set = None,
+    final_nodes: set = None,
+    backend: str = None,
+    closure_algorithm: str = "squaring",
+    mode: str = "auto",
+    order: str = None,
+    max_length: int = None,
+    chunk_size: int = REACHABLE_CHUNK_SIZE,
+    limit: int = None,
+) -> Iterator[Tuple[Any, Any]]:
+    """
+    Generates answers of rpq pair by pair, decoding them from closure
+    in chunks of a few start nodes, so that the first pairs are available
+    before all of them are found and generation can be stopped early
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | BooleanMatrices
+        Graph for working with queries, or its prepared boolean matrices,
+        e.g. loaded by BooleanMatrices.load, which keep their storage
+    query: Regex
+        Query represented by regex
+    start_nodes:
+        Set of start nodes in graph
+    final_nodes:
+        Set of final nodes in graph
+    backend: str
+        Name of matrix backend, see project.matrix_backends
+    closure_algorithm: str
+        Transitive closure algorithm, see BooleanMatrices.transitive_closure
+    mode: str
+        One of RPQ_MODES.
+        "closure" computes transitive closure of the whole product of graph and query,
+        "bfs" propagates frontier from start nodes only, see get_reachable_from,
+        "lazy" traverses product from its start states without materializing it,
+        see LazyIntersection,
+        "auto" picks "bfs" when number of start nodes is at most
+        BFS_START_NODES_RATIO of number of graph nodes, otherwise "lazy" when
+        product of graph and query estimated from graph statistics
+        has at least LAZY_MIN_PRODUCT_EDGES edges, and "closure" for the rest
+    order: str
+        Order of graph nodes in matrices, one of VERTEX_ORDERS,
+        see BooleanMatrices.reordered. Graph nodes keep their order by default
+    max_length: int
+        Largest length of matching paths. Bounded queries never compute
+        closure: "closure" mode expands frontier of start states of
+        the product max_length times at most, and "auto" picks "lazy"
+        instead of "closure". Paths are not bounded by default
+    chunk_size: int
+        Largest number of pairs decoded at once
+    limit: int
+        Largest number of generated pairs, pairs are not limited by default
+
+    Returns
+    -------
+    pairs: Iterator[Tuple[Any, Any]]
+        Distinct pairs of nodes with answer to RPQ problem
+    """
+    if mode not in RPQ_MODES:
+        raise ValueError(f"Unknown rpq mode: {mode}, expected one of {RPQ_MODES}")
+    if max_length is not None and max_length < 0:
+        raise ValueError(f"Length of paths should be nonnegative: {max_length}")
+    graph_bm, query_bm, prepared = _prepare_matrices(
+        graph, query, start_nodes, final_nodes, backend, order
+    )
+    if not accepts_nonempty_word(query_bm, graph_bm.bool_matrices.keys()):
+        return iter(())
+
+    if mode == "auto":
+        is_selective = start_nodes is not None and len(
+            start_nodes
+        ) <= BFS_START_NODES_RATIO * max(1, graph_bm.num_states)
+        if is_selective:
+            mode = "bfs"
+        elif max_length is not None:
+            mode = "lazy"
+        else:
+            product_edges = _estimate_product_edges(prepared.statistics(), query_bm)
+            mode = "lazy" if product_edges >= LAZY_MIN_PRODUCT_EDGES else "closure"
+
+    if mode == "bfs":
+        chunks = iter_reachable_from(
+            graph_bm, query_bm, None, max_length, chunk_size, limit
+        )
+    else:
+        intersected_bm = graph_bm.intersect(query_bm, lazy=mode == "lazy")
+        chunks = iter_reachable(
+            intersected_bm,
+            query_bm,
+            closure_algorithm,
+            max_length,
+            chunk_size,
+            limit,
+        )
+    return _node_pairs(chunks, graph_bm.get_states_by_index())
+
+
+def _node_pairs(
+    chunks: Iterator[np.ndarray], states: list
+) -> Iterator[Tuple[Any, Any]]:
+    """
+    Translate chunks of pairs of state indices into pairs of nodes
+    """
+    for chunk in chunks:
+        for u, v in chunk.tolist():
+            yield states[u].value, states[v].value
+
+
+def rpq_values(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
+    query: Regex,
+    semiring: Union[str, Semiring] = "count",
+    start_nodes: set = None,
+    final_nodes: set = None,
+    backend: str = None,
+) -> Dict[Tuple[Any, Any], Any]:
+    """
+    Aggregates paths of graph matching regex query over semiring,
+    computing closure of product of graph and query from its start states only
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | BooleanMatrices
+        Graph for working with queries, or its prepared boolean matrices
+    query: Regex
+        Query represented by regex
+    semiring: str | Semiring
+        Semiring or name of semiring, see project.semirings.
+        "count" gives number of matching paths, saturating at COUNT_LIMIT,
+        "shortest" gives length of the shortest matching path,
+        BoundedSemiring(k) gives length of the shortest matching path
+        for pairs connected by matching path of at most k edges
+    start_nodes:
+        Set of start nodes in graph
+    final_nodes:
+        Set of final nodes in graph
+    backend: str
+        Name of matrix backend, see project.matrix_backends
+
+    Returns
+    -------
+    values: Dict[Tuple[Any, Any], Any]
+        Mapping of pairs of nodes connected by matching path to value of its paths
+    """
+    semiring = get_semiring(semiring)
+    graph_bm, query_bm, _ = _prepare_matrices(
+        graph, query, start_nodes, final_nodes, backend
+    )
+    if not accepts_nonempty_word(query_bm, graph_bm.bool_matrices.keys()):
+        return {}
+
+    product = graph_bm.intersect(query_bm)
+    sources = np.flatnonzero(product.start_mask())
+    closure = product.weighted_closure(semiring, sources).tocoo()
+    accepted = product.final_mask()[closure.col]
+    rows = sources[closure.row[accepted]] // query_bm.num_states
+    cols = closure.col[accepted] // query_bm.num_states
+    values = closure.data[accepted]
+    if not values.size:
+        return {}
+
+    order = np.lexsort((cols, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    starts = np.flatnonzero(
+        np.concatenate(([True], (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])))
     )
-    query_bm = BooleanMatrices.from_automaton(regex_to_min_dfa(query))
+    values = semiring.reduce(values, starts)
+    states = graph_bm.get_states_by_index()
+    return {
+        (states[u].value, states[v].value): value
+        for u, v, value in zip(
+            rows[starts].tolist(), cols[starts].tolist(), values.tolist()
+        )
+    }
+
+
+def rpq_batch(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
+    queries: Union[Mapping[Any, Regex], Sequence[Regex]],
+    start_nodes: set = None,
+    final_nodes: set = None,
+    backend: str = None,
+    closure_algorithm: str = "squaring",
+    merge: bool = True,
+    max_length: int = None,
+) -> Dict[Any, Set[Tuple[Any, Any]]]:
+    """
+    Solves Regular Path Querying problem for many queries against one graph.
+    Graph matrices are prepared once for labels of all queries, and equal
+    queries, e.g. differing in parentheses only, are evaluated once
 
-    intersected_bm = graph_bm.intersect(query_bm)
-    return get_reachable(intersected_bm, query_bm)
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | BooleanMatrices
+        Graph for working with queries, or its prepared boolean matrices
+    queries: Mapping[Any, Regex] | Sequence[Regex]
+        Queries by their ids, positions of queries are ids of sequence
+    start_nodes:
+        Set of start nodes in graph
+    final_nodes:
+        Set of final nodes in graph
+    backend: str
+        Name of matrix backend, see project.matrix_backends
+    closure_algorithm: str
+        Transitive closure algorithm used when queries are not merged,
+        see BooleanMatrices.transitive_closure
+    merge: bool
+        Whether to merge minimal DFAs of queries into one automaton with
+        final states tagged by query, so that a single traversal of its product
+        with graph from start states answers all queries.
+        Otherwise queries are evaluated by rpq one by one
+    max_length: int
+        Largest length of matching paths, see rpq
+
+    Returns
+    -------
+    results: Dict[Any, Set[Tuple[Any, Any]]]
+        Mapping of query ids to answers of queries
+    """
+    if not isinstance(queries, Mapping):
+        queries = dict(enumerate(queries))
+    cache = get_query_cache()
+    ids_by_key = {}
+    for query_id, query in queries.items():
+        ids_by_key.setdefault(cache.canonical(query), []).append(query_id)
+    compiled = {
+        key: cache.boolean_matrices(queries[ids[0]], backend)
+        for key, ids in ids_by_key.items()
+    }
+
+    labels = {
+        getattr(label, "value", label)
+        for query_bm in compiled.values()
+        for label in query_bm.bool_matrices
+    }
+    if isinstance(graph, BooleanMatrices):
+        graph_bm = graph.with_states(start_nodes, final_nodes, labels)
+    else:
+        graph_bm = graph_matrices(graph, start_nodes, final_nodes, labels, backend)
+    present = graph_bm.bool_matrices.keys()
+    answered = {
+        key: query_bm
+        for key, query_bm in compiled.items()
+        if accepts_nonempty_word(query_bm, present)
+    }
+
+    if merge:
+        answers = _merged_rpq(graph_bm, list(answered.values()), backend, max_length)
+        answers = dict(zip(answered, answers))
+    else:
+        answers = {
+            key: get_reachable(
+                graph_bm.intersect(query_bm),
+                query_bm,
+                closure_algorithm,
+                max_length,
+            )
+            for key, query_bm in answered.items()
+        }
+
+    states = graph_bm.get_states_by_index()
+    results = {}
+    for key, ids in ids_by_key.items():
+        pairs = {(states[u].value, states[v].value) for u, v in answers.get(key, set())}
+        for query_id in ids:
+            results[query_id] = pairs if query_id == ids[0] else set(pairs)
+    return results
+
+
+def _merged_rpq(
+    graph_bm: BooleanMatrices,
+    automata: list,
+    backend: str = None,
+    max_length: int = None,
+) -> list:
+    """
+    Answers queries given by automata at once traversing product of graph
+    with disjoint union of automata from its start states,
+    pairs are attributed to queries by automata of their final states
+    """
+    if not automata:
+        return []
+    merged = BooleanMatrices.disjoint_union(automata, backend)
+    owners = np.repeat(np.arange(len(automata)), [bm.num_states for bm in automata])
+    intersection = graph_bm.intersect(merged, lazy=True)
+    ops = intersection.matrix_backend
+    starts, visited = intersection.reachable_from_starts(max_length)
+    rows, cols = ops.nonzero(visited)
+    graph_states, query_states = np.divmod(cols, merged.num_states)
+    accepted = graph_bm.final_mask()[graph_states] & merged.final_mask()[query_states]
+    n = graph_bm.num_states
+    keys = np.unique(
+        (
+            owners[query_states[accepted]] * n
+            + starts[rows[accepted]] // merged.num_states
+        )
+        * n
+        + graph_states[accepted]
+    )
+    found_owners, pairs = np.divmod(keys, n * n)
+    sources, targets = np.divmod(pairs, n)
+    bounds = np.searchsorted(found_owners, np.arange(len(automata) + 1))
+    return [
+        set(zip(sources[lo:hi].tolist(), targets[lo:hi].tolist()))
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ]
@@ -0,0 +1,338 @@
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import networkx as nx
+import numpy as np
+from pyformlang.regular_expression import Regex
+
+from project.boolean_matrices import BooleanMatrices
+from project.graph_index import get_graph_index_cache
+from project.lazy_kronecker import _expand
+from project.query_cache import get_query_cache
+
+__all__ = ["rpq_exists", "rpq_witnesses"]
+
+
+class _ProductSearch:
+    """
+    Frontier search over product of graph and query automaton, whose
+    state (g, s) is encoded as g * q + s with q being number of query states.
+    Every level of search keeps its states sorted together with their parents
+    and labels of transitions from parents, so paths are restored from levels
+    with memory proportional to number of visited states
+
+    Attributes
+    ----------
+    graph_bm: BooleanMatrices
+        Label matrices of graph
+    query_bm: BooleanMatrices
+        Label matrices of query
+    labels: list
+        Labels shared by graph and query
+    """
+
+    def __init__(self, graph_bm: BooleanMatrices, query_bm: BooleanMatrices):
+        self.graph_bm = graph_bm
+        self.query_bm = query_bm
+        self.n = graph_bm.num_states
+        self.q = query_bm.num_states
+        self._nodes = None
+        self.labels = [
+            label for label in query_bm.bool_matrices if label in graph_bm.bool_matrices
+        ]
+        self._forward = [
+            (graph_bm.adjacency_lists(label), query_bm.adjacency_lists(label))
+            for label in self.labels
+        ]
+        self._backward = [
+            (
+                graph_bm.adjacency_lists(label, transposed=True),
+                query_bm.adjacency_lists(label, transposed=True),
+            )
+            for label in self.labels
+        ]
+
+    def states(self, graph_states, query_states) -> np.ndarray:
+        """
+        Encode pairs of graph and query states as sorted distinct product states
+        """
+        graph_states = np.asarray(graph_states, dtype=np.int64)
+        query_states = np.asarray(query_states, dtype=np.int64)
+        return np.unique(
+            (graph_states[:, None] * self.q + query_states[None, :]).ravel()
+        )
+
+    def expand(
+        self, frontier: np.ndarray, visited: np.ndarray, forward: bool = True
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Follow transitions of product from frontier, forward or backward,
+        skipping and marking visited states
+
+        Parameters
+        ----------
+        frontier: np.ndarray
+            Product states to expand
+        visited: np.ndarray
+            Boolean mask of visited product states, updated in place
+        forward: bool
+            Whether transitions are followed forward or backward
+        Returns
+        -------
+        level: Tuple[np.ndarray, np.ndarray, np.ndarray]
+            Sorted newly reached states, their parents in frontier
+            and indices of labels of transitions from parents
+        """
+        graph_states, query_states = np.divmod(frontier, self.q)
+        reached, parents, labels = [], [], []
+        for label, (graph_lists, query_lists) in enumerate(
+            self._forward if forward else self._backward
+        ):
+            owners, query_to = _expand(*query_lists, query_states)
+            if not owners.size:
+                continue
+            graph_owners, graph_to = _expand(*graph_lists, graph_states[owners])
+            owners = owners[graph_owners]
+            reached.append(graph_to * self.q + query_to[graph_owners])
+            parents.append(frontier[owners])
+            labels.append(np.full(owners.size, label, dtype=np.int64))
+        if not reached:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        reached = np.concatenate(reached)
+        fresh = ~visited[reached]
+        states, first = np.unique(reached[fresh], return_index=True)
+        visited[states] = True
+        return (
+            states,
+            np.concatenate(parents)[fresh][first],
+            np.concatenate(labels)[fresh][first],
+        )
+
+    def visited_mask(self) -> np.ndarray:
+        """
+        Get mask of product states, pages of which are allocated when touched
+        """
+        return np.zeros(self.n * self.q, dtype=bool)
+
+    @staticmethod
+    def depth(levels: list, state: int) -> int:
+        """
+        Get index of level containing state or -1 if it was not visited
+        """
+        for depth, (states, _, _) in enumerate(levels):
+            position = np.searchsorted(states, state)
+            if position < states.size and states[position] == state:
+                return depth
+        return -1
+
+    def trace(self, levels: list, state: int, depth: int) -> List[Tuple[int, int]]:
+        """
+        Restore chain of states and labels leading from level 0 to state
+
+        Returns
+        -------
+        chain: List[Tuple[int, int]]
+            Pairs of product state and index of label of transition from
+            the next pair, starting with state and ending in level 0
+        """
+        chain = []
+        for states, parents, labels in levels[depth:0:-1]:
+            position = np.searchsorted(states, state)
+            chain.append((state, int(labels[position])))
+            state = int(parents[position])
+        chain.append((state, -1))
+        return chain
+
+    def edges(self, states: List[int], labels: List[int]) -> List[Tuple[Any, Any, Any]]:
+        """
+        Translate consecutive product states and labels between them
+        into edges of graph path
+        """
+        if self._nodes is None:
+            self._nodes = self.graph_bm.get_states_by_index()
+        nodes = self._nodes
+        path = []
+        for i, label in enumerate(labels):
+            label = self.labels[label]
+            path.append(
+                (
+                    nodes[states[i] // self.q].value,
+                    getattr(label, "value", label),
+                    nodes[states[i + 1] // self.q].value,
+                )
+            )
+        return path
+
+
+def _node_index(bm: BooleanMatrices, node) -> int:
+    if node not in bm.state_indexes:
+        raise ValueError(f"Unknown node: {node}")
+    return bm.state_indexes[node]
+
+
+def _product_search(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices], query: Regex, backend: str
+) -> _ProductSearch:
+    """
+    Prepare search over product of cached matrices of graph and query
+    """
+    query_bm = get_query_cache().boolean_matrices(query, backend)
+    graph_bm = (
+        graph
+        if isinstance(graph, BooleanMatrices)
+        else get_graph_index_cache().boolean_matrices(
+            graph, backend, labels=query_bm.bool_matrices.keys()
+        )
+    )
+    return _ProductSearch(graph_bm, query_bm)
+
+
+def rpq_exists(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
+    query: Regex,
+    source: Any,
+    target: Any,
+    witness: bool = False,
+    backend: str = None,
+) -> Union[bool, Optional[List[Tuple[Any, Any, Any]]]]:
+    """
+    Check whether pair of nodes is an answer of rpq by bidirectional
+    search over product of graph and query. Frontier of (source, start state)
+    is expanded forward and frontier of (target, final states) backward,
+    the smaller one at every step, and search stops as soon as they meet,
+    so that only neighbourhoods of both nodes are visited instead of
+    all states reachable from source
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | BooleanMatrices
+        Graph for working with queries, or its prepared boolean matrices
+    query: Regex
+        Query represented by regex
+    source: Any
+        Start node of path
+    target: Any
+        Final node of path
+    witness: bool
+        Whether path is returned instead of boolean answer
+    backend: str
+        Name of matrix backend, see project.matrix_backends
+    Returns
+    -------
+    answer: bool | Optional[List[Tuple[Any, Any, Any]]]
+        Whether nonempty path from source to target is labelled by word
+        of query. When witness is requested, edges (u, label, v) of
+        such a path, which is the shortest one, or None if there is no path
+    Raises
+    ------
+    ValueError:
+        If source or target is not node of graph
+    """
+    search = _product_search(graph, query, backend)
+    graph_bm, query_bm = search.graph_bm, search.query_bm
+    u = _node_index(graph_bm, source)
+    v = _node_index(graph_bm, target)
+    forward = [(search.states([u], np.flatnonzero(query_bm.start_mask())), None, None)]
+    backward = [(search.states([v], np.flatnonzero(query_bm.final_mask())), None, None)]
+    # states of level 0 are not marked, so that cycles through them are found
+    visited = {True: search.visited_mask(), False: search.visited_mask()}
+
+    meeting = None
+    is_forward = True
+    while forward[-1][0].size and backward[-1][0].size:
+        levels = forward if is_forward else backward
+        level = search.expand(levels[-1][0], visited[is_forward], is_forward)
+        levels.append(level)
+        other = backward if is_forward else forward
+        met = level[0][
+            visited[not is_forward][level[0]] | np.isin(level[0], other[0][0])
+        ]
+        if met.size:
+            depths = [search.depth(other, state) for state in met.tolist()]
+            best = int(np.argmin(depths))
+            meeting = int(met[best]), depths[best], is_forward
+            break
+        is_forward = forward[-1][0].size <= backward[-1][0].size
+
+    if not witness:
+        return meeting is not None
+    if meeting is None:
+        return None
+    state, other_depth, is_forward = meeting
+    forward_depth = len(forward) - 1 if is_forward else other_depth
+    backward_depth = other_depth if is_forward else len(backward) - 1
+    head = search.trace(forward, state, forward_depth)[::-1]
+    tail = search.trace(backward, state, backward_depth)
+    states = [s for s, _ in head] + [s for s, _ in tail[1:]]
+    labels = [label for _, label in head[1:]] + [label for _, label in tail[:-1]]
+    return search.edges(states, labels)
+
+
+def rpq_witnesses(
+    graph: Union[nx.MultiDiGraph, BooleanMatrices],
+    query: Regex,
+    pairs: Iterable[Tuple[Any, Any]],
+    backend: str = None,
+) -> Dict[Tuple[Any, Any], Optional[List[Tuple[Any, Any, Any]]]]:
+    """
+    Find shortest paths explaining why pairs are answers of rpq.
+    Product of graph and query is traversed by BFS from start states of
+    every source node, recording parent of every visited state, until
+    all targets of the source are reached with final state of query.
+    Memory taken by BFS is proportional to number of visited states,
+    and rpq itself is not affected
+
+    Parameters
+    ----------
+    graph: nx.MultiDiGraph | BooleanMatrices
+        Graph for working with queries, or its prepared boolean matrices
+    query: Regex
+        Query represented by regex
+    pairs: Iterable[Tuple[Any, Any]]
+        Pairs of source and target nodes, e.g. selected answers of rpq
+    backend: str
+        Name of matrix backend, see project.matrix_backends
+    Returns
+    -------
+    witnesses: Dict[Tuple[Any, Any], Optional[List[Tuple[Any, Any, Any]]]]
+        Edges (u, label, v) of shortest nonempty path labelled by word
+        of query for every pair, or None if pair is not an answer
+    Raises
+    ------
+    ValueError:
+        If some of nodes are not nodes of graph
+    """
+    search = _product_search(graph, query, backend)
+    graph_bm, query_bm = search.graph_bm, search.query_bm
+    pairs = [
+        (pair, _node_index(graph_bm, pair[0]), _node_index(graph_bm, pair[1]))
+        for pair in pairs
+    ]
+    targets = defaultdict(set)
+    for _, u, v in pairs:
+        targets[u].add(v)
+
+    query_starts = np.flatnonzero(query_bm.start_mask())
+    query_final_mask = query_bm.final_mask()
+    paths = {}
+    for u, vs in targets.items():
+        pending = np.zeros(graph_bm.num_states, dtype=bool)
+        pending[list(vs)] = True
+        found = 0
+        levels = [(search.states([u], query_starts), None, None)]
+        visited = search.visited_mask()
+        while levels[-1][0].size and found < len(vs):
+            level = search.expand(levels[-1][0], visited)
+            levels.append(level)
+            graph_states, query_states = np.divmod(level[0], search.q)
+            reached = query_final_mask[query_states] & pending[graph_states]
+            nodes, first = np.unique(graph_states[reached], return_index=True)
+            pending[nodes] = False
+            found += nodes.size
+            for v, state in zip(nodes.tolist(), level[0][reached][first].tolist()):
+                chain = search.trace(levels, state, len(levels) - 1)[::-1]
+                paths[u, v] = search.edges(
+                    [state for state, _ in chain], [label for _, label in chain[1:]]
+                )
+    return {pair: paths.get((u, v)) for pair, u, v in pairs}
@@ -0,0 +1,190 @@
+from typing import Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from project.lazy_kronecker import _expand
+from project.matrix_backends import MatrixBackend
+
+__all__ = ["CondensedClosure", "condensed_closure"]
+
+
+class CondensedClosure:
+    """
+    Transitive closure kept in terms of strongly connected components.
+    State v is reachable from state u iff component of v is reachable
+    from component of u in the condensation, so pairs of states are produced
+    only when requested
+
+    Attributes
+    ----------
+    components: np.ndarray
+        Component of every state
+    reach: Any
+        Boolean matrix of backend type over components, cell (c, d) is set
+        iff there is a nonempty path from component c to component d
+    ops: MatrixBackend
+        Backend of reach matrix
+    shape: Tuple[int, int]
+        Shape of closure
+    """
+
+    format = "condensed"
+
+    def __init__(self, components: np.ndarray, reach, ops: MatrixBackend):
+        self.components = components
+        self.reach = reach
+        self.ops = ops
+        self.shape = (components.size, components.size)
+        self._sizes = np.bincount(components, minlength=reach.shape[0])
+
+    def _members(self, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        states = np.arange(self.components.size)
+        if mask is not None:
+            states = states[mask]
+        order = np.argsort(self.components[states], kind="stable")
+        counts = np.bincount(self.components[states], minlength=self.reach.shape[0])
+        return np.concatenate(([0], np.cumsum(counts))), states[order]
+
+    @property
+    def nnz(self) -> int:
+        rows, cols = self.ops.nonzero(self.reach)
+        return int((self._sizes[rows] * self._sizes[cols]).sum())
+
+    @property
+    def size(self) -> int:
+        return self.nnz
+
+    def sum(self) -> int:
+        return self.nnz
+
+    def __getitem__(self, key: Tuple[int, int]) -> bool:
+        i, j = key
+        return bool(self.reach[self.components[i], self.components[j]])
+
+    def nonzero_between(
+        self, row_mask: np.ndarray = None, col_mask: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Expand pairs of reachable states restricted to given rows and columns,
+        without touching pairs of other states
+
+        Parameters
+        ----------
+        row_mask: np.ndarray
+            Boolean mask of states to start from, all states by default
+        col_mask: np.ndarray
+            Boolean mask of states to reach, all states by default
+        Returns
+        -------
+        coords: Tuple[np.ndarray, np.ndarray]
+            Row and column indices of set cells
+        """
+        row_members = self._members(row_mask)
+        col_members = self._members(col_mask)
+        comp_from, comp_to = self.ops.nonzero(self.reach)
+        comp_from = np.asarray(comp_from, dtype=np.int64)
+        comp_to = np.asarray(comp_to, dtype=np.int64)
+        owners, rows = _expand(*row_members, comp_from)
+        col_owners, cols = _expand(*col_members, comp_to[owners])
+        return rows[col_owners], cols
+
+    def nonzero(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.nonzero_between()
+
+    def materialize(self):
+        """
+        Expand closure into boolean matrix of backend type
+        """
+        return self.ops.from_coords(*self.nonzero(), self.shape)
+
+    def __repr__(self):
+        return (
+            f"<CondensedClosure of shape {self.shape} "
+            f"with {self.reach.shape[0]} components>"
+        )
+
+
+def _topological_levels(dag: sparse.csr_matrix) -> np.ndarray:
+    """
+    Split vertices of acyclic graph into levels, level of a vertex is
+    the length of the longest path from it, so sinks form level 0
+
+    Parameters
+    ----------
+    dag: sparse.csr_matrix
+        Adjacency matrix of acyclic graph
+    Returns
+    -------
+    levels: np.ndarray
+        Level of every vertex
+    """
+    n = dag.shape[0]
+    parents = dag.T.tocsr()
+    out_degree = np.diff(dag.indptr)
+    levels = np.full(n, -1, dtype=np.int64)
+    frontier = np.flatnonzero(out_degree == 0)
+    level = 0
+    while frontier.size:
+        levels[frontier] = level
+        _, predecessors = _expand(parents.indptr, parents.indices, frontier)
+        out_degree = out_degree - np.bincount(predecessors, minlength=n)
+        candidates = np.unique(predecessors)
+        frontier = candidates[out_degree[candidates] == 0]
+        level += 1
+    return levels
+
+
+def condensed_closure(adjacency, ops: MatrixBackend) -> CondensedClosure:
+    """
+    Computes transitive closure of adjacency matrix by condensing strongly
+    connected components and propagating reachability over the condensation
+    in reverse topological order
+
+    Parameters
+    ----------
+    adjacency: Any
+        Square boolean matrix of backend type
+    ops: MatrixBackend
+        Backend of adjacency matrix
+    Returns
+    -------
+    tc: CondensedClosure
+        Transitive closure of adjacency matrix
+    """
+    n = adjacency.shape[0]
+    rows, cols = ops.nonzero(adjacency)
+    graph = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)), shape=(n, n)
+    )
+    count, components = connected_components(graph, directed=True, connection="strong")
+
+    comp_rows, comp_cols = components[rows], components[cols]
+    inner = comp_rows == comp_cols
+    cyclic = np.zeros(count, dtype=bool)
+    cyclic[comp_rows[inner]] = True
+    dag = sparse.csr_matrix(
+        (
+            np.ones(int((~inner).sum()), dtype=bool),
+            (comp_rows[~inner], comp_cols[~inner]),
+        ),
+        shape=(count, count),
+    )
+    dag.sum_duplicates()
+
+    reach = [None] * count
+    for comp in np.argsort(_topological_levels(dag), kind="stable"):
+        successors = dag.indices[dag.indptr[comp] : dag.indptr[comp + 1]]
+        reached = [successors] + [reach[succ] for succ in successors]
+        if cyclic[comp]:
+            reached.append(np.array([comp]))
+        reach[comp] = np.unique(np.concatenate(reached))
+
+    lengths = np.fromiter((r.size for r in reach), dtype=np.int64, count=count)
+    reach_matrix = ops.from_coords(
+        np.repeat(np.arange(count), lengths),
+        np.concatenate(reach) if count else np.empty(0, dtype=np.int64),
+        (count, count),
+    )
+    return CondensedClosure(components, reach_matrix, ops)
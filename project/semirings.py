@@ -0,0 +1,321 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from project.lazy_kronecker import _expand_positions
+from project.matrix_backends import get_backend
+from project.scc_closure import condensed_closure
+
+__all__ = [
+    "Semiring",
+    "BooleanSemiring",
+    "CountingSemiring",
+    "MinPlusSemiring",
+    "BoundedSemiring",
+    "get_semiring",
+    "SEMIRINGS",
+    "COUNT_LIMIT",
+]
+
+COUNT_LIMIT = 1 << 53
+
+
+class Semiring(ABC):
+    """
+    Semiring of values of matrix cells, generalizing boolean matrices
+    of BooleanMatrices. Matrices are scipy CSR matrices whose absent cells
+    hold zero of semiring, and cell (i, j) of closure aggregates values of
+    all nonempty paths from i to j, every edge contributing one step
+
+    Attributes
+    ----------
+    name: str
+        Name of semiring in SEMIRINGS
+    dtype: np.dtype
+        Type of stored values
+    """
+
+    name: str = None
+    dtype = np.bool_
+
+    @abstractmethod
+    def add(self, lhs: sparse.csr_matrix, rhs: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        Element-wise sum of semiring
+        """
+        pass
+
+    @abstractmethod
+    def multiply(
+        self, lhs: sparse.csr_matrix, rhs: sparse.csr_matrix
+    ) -> sparse.csr_matrix:
+        """
+        Matrix product of semiring lhs @ rhs
+        """
+        pass
+
+    def reduce(self, values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        """
+        Sum of semiring over consecutive groups of values
+
+        Parameters
+        ----------
+        values: np.ndarray
+            Values of cells
+        starts: np.ndarray
+            Positions where groups start
+        Returns
+        -------
+        sums: np.ndarray
+            Sum of every group
+        """
+        return np.logical_or.reduceat(values, starts)
+
+    def adjacency(self, matrices: Sequence) -> sparse.csr_matrix:
+        """
+        Combine label matrices into one-step matrix of semiring
+
+        Parameters
+        ----------
+        matrices: Sequence[spmatrix]
+            Boolean label matrices of the same shape
+        Returns
+        -------
+        adjacency: sparse.csr_matrix
+            Matrix of values of single edges
+        """
+        union = sparse.csr_matrix(matrices[0].shape, dtype=bool)
+        for matrix in matrices:
+            union = union + sparse.csr_matrix(matrix, dtype=bool)
+        return sparse.csr_matrix(union, dtype=self.dtype)
+
+    def improved(
+        self, result: sparse.csr_matrix, candidate: sparse.csr_matrix
+    ) -> sparse.csr_matrix:
+        """
+        Get cells of candidate changing result when added to it,
+        which are propagated by the next step of closure
+        """
+        changed = self.add(result, candidate) != result
+        return sparse.csr_matrix(candidate.multiply(changed), dtype=self.dtype)
+
+    def closure(
+        self, adjacency: sparse.csr_matrix, sources: np.ndarray = None
+    ) -> sparse.csr_matrix:
+        """
+        Computes closure of one-step matrix semi-naively:
+        only cells improved by the last step are extended by one more edge
+
+        Parameters
+        ----------
+        adjacency: sparse.csr_matrix
+            Square matrix of values of single edges
+        sources: np.ndarray
+            Indices of rows to compute, all rows by default
+        Returns
+        -------
+        closure: sparse.csr_matrix
+            Matrix with row i holding aggregated values of paths
+            from i-th source
+        """
+        result = _rows(adjacency, sources)
+        delta = result
+        while delta.nnz:
+            candidate = self.multiply(delta, adjacency)
+            delta = self.improved(result, candidate)
+            result = self.add(result, delta)
+        return result
+
+    def __repr__(self):
+        return f"<{type(self).__name__}>"
+
+
+class BooleanSemiring(Semiring):
+    """
+    Semiring ({False, True}, or, and) of plain reachability
+    """
+
+    name = "boolean"
+
+    def add(self, lhs, rhs):
+        return sparse.csr_matrix(lhs + rhs, dtype=bool)
+
+    def multiply(self, lhs, rhs):
+        return sparse.csr_matrix(lhs @ rhs, dtype=bool)
+
+
+class CountingSemiring(Semiring):
+    """
+    Semiring of natural numbers (+, *) saturating at limit, counting paths.
+    Pairs connected by infinitely many paths, i.e. by paths through a cycle,
+    get limit without enumerating the paths
+
+    Attributes
+    ----------
+    limit: int
+        Largest stored count, at most 2 ** 53 for counts to stay exact
+    """
+
+    name = "count"
+    dtype = np.int64
+
+    def __init__(self, limit: int = COUNT_LIMIT):
+        self.limit = min(limit, COUNT_LIMIT)
+
+    def add(self, lhs, rhs):
+        return sparse.csr_matrix((lhs + rhs).minimum(self.limit), dtype=np.int64)
+
+    def multiply(self, lhs, rhs):
+        product = sparse.csr_matrix(lhs, dtype=np.float64) @ sparse.csr_matrix(
+            rhs, dtype=np.float64
+        )
+        return sparse.csr_matrix(product.minimum(self.limit), dtype=np.int64)
+
+    def reduce(self, values, starts):
+        return np.minimum(np.add.reduceat(values, starts), self.limit)
+
+    def adjacency(self, matrices):
+        counts = sparse.csr_matrix(matrices[0].shape, dtype=np.int64)
+        for matrix in matrices:
+            counts = counts + sparse.csr_matrix(matrix, dtype=np.int64)
+        return counts
+
+    def improved(self, result, candidate):
+        return candidate
+
+    def closure(self, adjacency, sources=None):
+        """
+        Counts paths of every length separately, every step extends
+        paths of the previous length by one edge. Cells reaching a cycle
+        are found in advance from condensation of graph and dropped
+        from steps, so counting stops after the longest acyclic path
+        """
+        infinite = _rows(self._infinite(adjacency), sources)
+        finite = sparse.csr_matrix(_rows(adjacency, sources), dtype=np.int64)
+        finite = finite - finite.multiply(infinite)
+        result = finite
+        while finite.nnz:
+            finite = self.multiply(finite, adjacency)
+            finite = finite - finite.multiply(infinite)
+            finite.eliminate_zeros()
+            result = self.add(result, finite)
+        return self.add(result, sparse.csr_matrix(infinite * self.limit))
+
+    @staticmethod
+    def _infinite(adjacency: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        Find pairs connected by path through a state lying on a cycle
+        """
+        ops = get_backend("csr")
+        tc = condensed_closure(sparse.csr_matrix(adjacency, dtype=bool), ops)
+        cyclic = tc.reach.diagonal().astype(bool)[tc.components]
+        shape = adjacency.shape
+        to_cycles = ops.from_coords(*tc.nonzero_between(None, cyclic), shape)
+        from_cycles = ops.from_coords(*tc.nonzero_between(cyclic, None), shape)
+        return sparse.csr_matrix(to_cycles @ from_cycles, dtype=bool)
+
+
+class MinPlusSemiring(Semiring):
+    """
+    Tropical semiring of path lengths (min, +), absent cells are infinite
+    """
+
+    name = "shortest"
+    dtype = np.int64
+
+    def add(self, lhs, rhs):
+        lhs_cells = sparse.csr_matrix(lhs, dtype=bool)
+        rhs_cells = sparse.csr_matrix(rhs, dtype=bool)
+        common_lhs = lhs.multiply(rhs_cells)
+        common_rhs = rhs.multiply(lhs_cells)
+        result = (
+            (lhs - common_lhs) + (rhs - common_rhs) + common_lhs.minimum(common_rhs)
+        )
+        return sparse.csr_matrix(result, dtype=np.int64)
+
+    def multiply(self, lhs, rhs):
+        lhs, rhs = sparse.csr_matrix(lhs), sparse.csr_matrix(rhs)
+        lhs.sort_indices()
+        owners, positions = _expand_positions(rhs.indptr, lhs.indices)
+        rows = np.repeat(np.arange(lhs.shape[0]), np.diff(lhs.indptr))[owners]
+        cols = rhs.indices[positions]
+        lengths = lhs.data[owners] + rhs.data[positions]
+        return self._from_lengths(rows, cols, lengths, (lhs.shape[0], rhs.shape[1]))
+
+    def reduce(self, values, starts):
+        return np.minimum.reduceat(values, starts)
+
+    def _from_lengths(self, rows, cols, lengths, shape) -> sparse.csr_matrix:
+        """
+        Build matrix keeping the shortest of lengths given for the same cell
+        """
+        order = np.lexsort((lengths, cols, rows))
+        rows, cols, lengths = rows[order], cols[order], lengths[order]
+        first = np.ones(rows.size, dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        return sparse.csr_matrix(
+            (lengths[first].astype(np.int64), (rows[first], cols[first])), shape=shape
+        )
+
+
+class BoundedSemiring(MinPlusSemiring):
+    """
+    Tropical semiring truncated at given length: paths longer than bound
+    are dropped, so closure stops after bound steps
+
+    Attributes
+    ----------
+    bound: int
+        Largest length of kept paths
+    """
+
+    name = "bounded"
+
+    def __init__(self, bound: int):
+        if bound < 1:
+            raise ValueError(f"Bound of path length should be positive: {bound}")
+        self.bound = bound
+
+    def _from_lengths(self, rows, cols, lengths, shape):
+        kept = lengths <= self.bound
+        return super()._from_lengths(rows[kept], cols[kept], lengths[kept], shape)
+
+
+SEMIRINGS: Dict[str, type] = {
+    semiring.name: semiring
+    for semiring in (BooleanSemiring, CountingSemiring, MinPlusSemiring)
+}
+
+
+def get_semiring(semiring) -> Semiring:
+    """
+    Get semiring by name of one without parameters, or semiring itself
+
+    Parameters
+    ----------
+    semiring: str | Semiring
+        Name from SEMIRINGS or Semiring instance
+    Returns
+    -------
+    semiring: Semiring
+        Semiring instance
+    Raises
+    ------
+    ValueError
+        If semiring is unknown
+    """
+    if isinstance(semiring, Semiring):
+        return semiring
+    if semiring not in SEMIRINGS:
+        raise ValueError(
+            f"Unknown semiring: {semiring}, expected one of {list(SEMIRINGS)}"
+        )
+    return SEMIRINGS[semiring]()
+
+
+def _rows(matrix: sparse.csr_matrix, sources: np.ndarray = None) -> sparse.csr_matrix:
+    if sources is None:
+        return sparse.csr_matrix(matrix)
+    return sparse.csr_matrix(matrix[np.asarray(sources, dtype=np.int64)])
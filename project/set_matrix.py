@@ -0,0 +1,154 @@
+from typing import Dict, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+__all__ = ["SetMatrix"]
+
+
+class SetMatrix:
+    """
+    Boolean matrix stored as Python sets of column indices per nonempty row.
+    Reference implementation without vectorized kernels, useful as a baseline
+    in benchmarks and as an oracle in tests.
+    Mirrors the part of scipy.sparse API used by BooleanMatrices
+
+    Attributes
+    ----------
+    rows: Dict[int, Set[int]]
+        Mapping of row indices to sets of column indices of nonzero cells
+    shape: Tuple[int, int]
+        Shape of matrix
+    """
+
+    format = "sets"
+
+    def __init__(self, rows: Dict[int, Set[int]], shape: Tuple[int, int]):
+        self.rows = rows
+        self.shape = shape
+
+    @classmethod
+    def zeros(cls, shape: Tuple[int, int]) -> "SetMatrix":
+        return cls({}, shape)
+
+    @classmethod
+    def identity(cls, n: int) -> "SetMatrix":
+        return cls({i: {i} for i in range(n)}, (n, n))
+
+    @classmethod
+    def from_coords(cls, rows, cols, shape: Tuple[int, int]) -> "SetMatrix":
+        """
+        Create matrix from coordinates of nonzero cells
+
+        Parameters
+        ----------
+        rows: Sequence[int]
+            Row indices of nonzero cells
+        cols: Sequence[int]
+            Column indices of nonzero cells
+        shape: Tuple[int, int]
+            Shape of matrix
+        Returns
+        -------
+        matrix: SetMatrix
+            Matrix with given nonzero cells
+        """
+        matrix_rows = {}
+        for i, j in zip(rows, cols):
+            matrix_rows.setdefault(int(i), set()).add(int(j))
+        return cls(matrix_rows, shape)
+
+    @property
+    def nnz(self) -> int:
+        return sum(len(cols) for cols in self.rows.values())
+
+    @property
+    def size(self) -> int:
+        return self.nnz
+
+    @property
+    def T(self) -> "SetMatrix":
+        return self.transpose()
+
+    def sum(self) -> int:
+        return self.nnz
+
+    def copy(self) -> "SetMatrix":
+        return SetMatrix({i: set(cols) for i, cols in self.rows.items()}, self.shape)
+
+    def transpose(self) -> "SetMatrix":
+        transposed = {}
+        for i, cols in self.rows.items():
+            for j in cols:
+                transposed.setdefault(j, set()).add(i)
+        return SetMatrix(transposed, (self.shape[1], self.shape[0]))
+
+    def nonzero(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get coordinates of nonzero cells in row-major order
+
+        Returns
+        -------
+        coords: Tuple[np.ndarray, np.ndarray]
+            Row and column indices of nonzero cells
+        """
+        pairs = sorted((i, j) for i, cols in self.rows.items() for j in cols)
+        rows = np.fromiter((i for i, _ in pairs), dtype=np.int64, count=len(pairs))
+        cols = np.fromiter((j for _, j in pairs), dtype=np.int64, count=len(pairs))
+        return rows, cols
+
+    def asformat(self, format: str):
+        """
+        Convert matrix to given format
+
+        Parameters
+        ----------
+        format: str
+            "sets" or any scipy.sparse format name
+        Returns
+        -------
+        matrix: SetMatrix | spmatrix
+            Matrix in given format
+        """
+        if format == self.format:
+            return self
+        rows, cols = self.nonzero()
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows, cols)), shape=self.shape
+        )
+        return matrix.asformat(format)
+
+    def tocsr(self) -> sparse.csr_matrix:
+        return self.asformat("csr")
+
+    def __getitem__(self, key: Tuple[int, int]) -> bool:
+        i, j = key
+        return j in self.rows.get(i, ())
+
+    def __setitem__(self, key: Tuple[int, int], value: bool):
+        i, j = key
+        if value:
+            self.rows.setdefault(i, set()).add(j)
+        elif i in self.rows:
+            self.rows[i].discard(j)
+            if not self.rows[i]:
+                del self.rows[i]
+
+    def __add__(self, other: "SetMatrix") -> "SetMatrix":
+        result = self.copy()
+        for i, cols in other.rows.items():
+            result.rows.setdefault(i, set()).update(cols)
+        return result
+
+    def __matmul__(self, other: "SetMatrix") -> "SetMatrix":
+        result = {}
+        for i, cols in self.rows.items():
+            row = set()
+            for k in cols:
+                row |= other.rows.get(k, set())
+            if row:
+                result[i] = row
+        return SetMatrix(result, (self.shape[0], other.shape[1]))
+
+    def __repr__(self):
+        return f"<SetMatrix of shape {self.shape} with {self.nnz} nonzero cells>"
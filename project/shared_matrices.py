@@ -0,0 +1,257 @@
+import sys
+import weakref
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from project.boolean_matrices import BooleanMatrices
+
+__all__ = ["SharedMatricesHandle", "SharedMatrixPool", "AttachedMatrices", "attach"]
+
+_ALIGNMENT = 64
+
+
+def _open_segment(name: str) -> shared_memory.SharedMemory:
+    """
+    Open existing shared memory segment without taking ownership of it.
+    Before Python 3.13 attached segments are registered in resource tracker,
+    which is shared with the owner by processes started with multiprocessing
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedMatricesHandle:
+    """
+    Picklable reference to BooleanMatrices published in shared memory,
+    sent to worker processes to attach the same buffers
+
+    Attributes
+    ----------
+    name: str
+        Name of shared memory segment
+    header: dict
+        Header describing labels and states, see BooleanMatrices.export_csr
+    layout: List[Tuple[int, int]]
+        Offsets of indptr and indices arrays of every label in segment
+    """
+
+    def __init__(self, name: str, header: dict, layout: List[Tuple[int, int]]):
+        self.name = name
+        self.header = header
+        self.layout = layout
+
+    def arrays(self, views: "_SegmentViews") -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Build views of CSR index arrays over attached segment
+
+        Parameters
+        ----------
+        views: _SegmentViews
+            Attached segment
+        Returns
+        -------
+        arrays: List[Tuple[np.ndarray, np.ndarray]]
+            Indptr and indices arrays of every label
+        """
+        n = self.header["num_states"]
+        return [
+            tuple(
+                views.array(np.dtype(entry["dtype"]), count, offset)
+                for offset, count in zip(offsets, (n + 1, entry["nnz"]))
+            )
+            for entry, offsets in zip(self.header["labels"], self.layout)
+        ]
+
+    def __repr__(self):
+        return (
+            f"<SharedMatricesHandle {self.name} with "
+            f"{len(self.layout)} labels over {self.header['num_states']} states>"
+        )
+
+
+class SharedMatrixPool:
+    """
+    Owner of shared memory segments with label matrices.
+    Every published BooleanMatrices is copied once into its own segment
+    as CSR index arrays, worker processes attach segments by handles and
+    read the same physical pages. Segments live until released or
+    the pool is closed, so workers must detach before that
+
+    Attributes
+    ----------
+    handles: Dict[str, SharedMatricesHandle]
+        Mapping of segment names to handles of published matrices
+    """
+
+    def __init__(self):
+        self.handles: Dict[str, SharedMatricesHandle] = {}
+        self._segments: Dict[str, shared_memory.SharedMemory] = {}
+
+    def publish(self, bm: BooleanMatrices) -> SharedMatricesHandle:
+        """
+        Copy label matrices into new shared memory segment
+
+        Parameters
+        ----------
+        bm: BooleanMatrices
+            Matrices to publish
+        Returns
+        -------
+        handle: SharedMatricesHandle
+            Handle to pass to workers
+        """
+        header, arrays = bm.export_csr()
+        layout, size = [], 0
+        for indptr, indices in arrays:
+            indptr_offset = size
+            indices_offset = _aligned(indptr_offset + indptr.nbytes)
+            size = _aligned(indices_offset + indices.nbytes)
+            layout.append((indptr_offset, indices_offset))
+
+        segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (indptr, indices), offsets in zip(arrays, layout):
+            for array, offset in zip((indptr, indices), offsets):
+                view = np.ndarray(array.shape, array.dtype, segment.buf, offset)
+                view[:] = array
+                del view
+
+        handle = SharedMatricesHandle(segment.name, header, layout)
+        self._segments[segment.name] = segment
+        self.handles[segment.name] = handle
+        return handle
+
+    def release(self, handle: SharedMatricesHandle):
+        """
+        Close and unlink segment of published matrices.
+        Workers attached to segment keep their mapping until they detach
+
+        Parameters
+        ----------
+        handle: SharedMatricesHandle
+            Handle returned by publish
+        Raises
+        ------
+        ValueError
+            If handle was not published by this pool
+        """
+        segment = self._segments.pop(handle.name, None)
+        if segment is None:
+            raise ValueError(f"Unknown shared matrices: {handle.name}")
+        del self.handles[handle.name]
+        segment.close()
+        segment.unlink()
+
+    def close(self):
+        """
+        Release all published matrices
+        """
+        for handle in list(self.handles.values()):
+            self.release(handle)
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _SegmentViews:
+    """
+    Read-only arrays over shared memory segment, which is closed
+    in this process once all of them are dropped
+    """
+
+    def __init__(self, segment: shared_memory.SharedMemory):
+        self.segment = segment
+        self.alive = 0
+
+    def array(self, dtype: np.dtype, count: int, offset: int) -> np.ndarray:
+        array = np.frombuffer(self.segment.buf, dtype, count, offset)
+        array.flags.writeable = False
+        self.alive += 1
+        # array.base is its own export of segment, released before the callback
+        weakref.finalize(array.base, self._release).atexit = False
+        return array
+
+    def _release(self):
+        self.alive -= 1
+        if not self.alive:
+            self.segment.close()
+
+    @property
+    def closed(self) -> bool:
+        return not self.alive
+
+
+class AttachedMatrices:
+    """
+    BooleanMatrices attached to shared memory segment by handle.
+    CSR label matrices are read-only views of segment, other storages,
+    requested explicitly, are converted into private memory. Segment is closed in this process
+    when the last view is dropped, so matrices stay valid after detach
+    while they are referenced. Usable as context manager detaching on exit
+
+    Attributes
+    ----------
+    handle: SharedMatricesHandle
+        Handle of attached segment
+    matrices: BooleanMatrices
+        Attached matrices, None after detach
+    """
+
+    def __init__(self, handle: SharedMatricesHandle, backend: str = "csr"):
+        self.handle = handle
+        self._views = _SegmentViews(_open_segment(handle.name))
+        self.matrices = BooleanMatrices.from_csr_arrays(
+            handle.header, handle.arrays(self._views), backend
+        )
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether segment is closed in this process
+        """
+        return self._views.closed
+
+    def detach(self):
+        """
+        Drop attached matrices, segment is closed once views of it
+        held elsewhere are dropped too
+        """
+        self.matrices = None
+
+    def __enter__(self) -> BooleanMatrices:
+        return self.matrices
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.detach()
+
+
+def attach(handle: SharedMatricesHandle, backend: str = "csr") -> AttachedMatrices:
+    """
+    Attach BooleanMatrices published by SharedMatrixPool,
+    intended to be called in worker processes
+
+    Parameters
+    ----------
+    handle: SharedMatricesHandle
+        Handle returned by SharedMatrixPool.publish
+    backend: str
+        Storage format of label matrices. Default "csr" keeps them zero-copy
+        views of segment, other storages copy them into private memory
+    Returns
+    -------
+    attached: AttachedMatrices
+        Context manager yielding attached BooleanMatrices
+    """
+    return AttachedMatrices(handle, backend)
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
@@ -0,0 +1,65 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import (
+    breadth_first_order,
+    connected_components,
+    reverse_cuthill_mckee,
+)
+
+__all__ = ["VERTEX_ORDERS", "vertex_order"]
+
+VERTEX_ORDERS = ("rcm", "bfs", "degree")
+
+
+def _bfs_order(graph: sparse.csr_matrix) -> np.ndarray:
+    """
+    Concatenate breadth-first orders of connected components, every component
+    is started from its vertex of the smallest index and isolated vertices go last
+    """
+    count, components = connected_components(graph, directed=False)
+    sizes = np.bincount(components, minlength=count)
+    roots = np.unique(components, return_index=True)[1]
+    orders = [
+        breadth_first_order(graph, root, directed=False, return_predecessors=False)
+        for root in roots[sizes > 1]
+    ]
+    orders.append(np.flatnonzero(sizes[components] == 1))
+    return np.concatenate(orders).astype(np.int64)
+
+
+def vertex_order(adjacency: sparse.spmatrix, order: str) -> np.ndarray:
+    """
+    Computes order of vertices clustering nonzero cells of adjacency matrix
+    near its diagonal, so rows multiplied together touch close memory.
+    Direction of edges is ignored
+
+    Parameters
+    ----------
+    adjacency: spmatrix
+        Square boolean adjacency matrix
+    order: str
+        One of VERTEX_ORDERS.
+        "rcm" is reverse Cuthill-McKee order minimizing bandwidth,
+        "bfs" is breadth-first order of connected components,
+        "degree" sorts vertices by decreasing total degree
+    Returns
+    -------
+    permutation: np.ndarray
+        Old index of vertex placed at every new index
+    Raises
+    ------
+    ValueError
+        If order is unknown
+    """
+    if order not in VERTEX_ORDERS:
+        raise ValueError(
+            f"Unknown vertex order: {order}, expected one of {VERTEX_ORDERS}"
+        )
+    graph = sparse.csr_matrix(adjacency, dtype=bool)
+    graph = (graph + graph.T).tocsr()
+    if order == "rcm":
+        return reverse_cuthill_mckee(graph, symmetric_mode=True).astype(np.int64)
+    if order == "bfs":
+        return _bfs_order(graph)
+    degrees = np.diff(graph.indptr)
+    return np.argsort(-degrees, kind="stable").astype(np.int64)
@@ -0,0 +1,105 @@
+import argparse
+import sys
+import time
+
+import networkx as nx
+import numpy as np
+
+import shared
+
+sys.path.append(str(shared.ROOT))
+
+from pyformlang.cfg import CFG
+from pyformlang.regular_expression import Regex
+
+from project import (
+    VERTEX_ORDERS,
+    BooleanMatrices,
+    available_backends,
+    generate_two_cycles_graph,
+    graph_to_nfa,
+    matrix,
+    rpq,
+    tensor,
+)
+
+
+def measure(function, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def scrambled_grid(side: int) -> nx.MultiDiGraph:
+    """
+    Grid graph with "a" edges along rows and "b" edges along columns,
+    whose node ids are shuffled as in graphs loaded from datasets
+    """
+    ids = np.random.default_rng(0).permutation(side * side).tolist()
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(ids)
+    for x in range(side):
+        for y in range(side):
+            node = ids[x * side + y]
+            if x + 1 < side:
+                graph.add_edge(node, ids[(x + 1) * side + y], label="a")
+            if y + 1 < side:
+                graph.add_edge(node, ids[x * side + y + 1], label="b")
+    return graph
+
+
+def multiply_paths(bm: BooleanMatrices, steps: int):
+    ops = bm.matrix_backend
+    adjacency = bm.adjacency_matrix()
+    paths = adjacency
+    for _ in range(steps):
+        paths = ops.multiply(paths, adjacency)
+
+
+def compare_orders(side: int, steps: int):
+    graph_bm = BooleanMatrices.from_automaton(graph_to_nfa(scrambled_grid(side)), "csr")
+    print(f"{'order':>10} {'reorder':>10} {'spgemm':>10}")
+    for order in (None,) + VERTEX_ORDERS:
+        start = time.perf_counter()
+        bm = graph_bm if order is None else graph_bm.reordered(order)
+        reorder = time.perf_counter() - start
+        print(
+            f"{str(order):>10} {reorder:>10.4f} "
+            f"{measure(multiply_paths, bm, steps):>10.4f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare matrix backends on RPQ and CFPQ over two-cycles graphs"
+    )
+    parser.add_argument("--nodes", type=int, default=20)
+    parser.add_argument("--backends", nargs="*", default=available_backends())
+    parser.add_argument(
+        "--grid-side",
+        type=int,
+        default=0,
+        help="also compare vertex orders on scrambled grid with given side",
+    )
+    parser.add_argument("--steps", type=int, default=12)
+    args = parser.parse_args()
+
+    graph = generate_two_cycles_graph(args.nodes, args.nodes // 2, ("a", "b"))
+    regex = Regex("a* b | b* a")
+    cfg = CFG.from_text("S -> a S b | a b")
+
+    print(f"{'backend':>10} {'rpq':>10} {'matrix':>10} {'tensor':>10}")
+    for backend in args.backends:
+        timings = [
+            measure(rpq, graph, regex, backend=backend),
+            measure(matrix, graph, cfg, backend=backend),
+            measure(tensor, graph, cfg, backend=backend),
+        ]
+        print(f"{backend:>10} " + " ".join(f"{t:>10.4f}" for t in timings))
+
+    if args.grid_side:
+        compare_orders(args.grid_side, args.steps)
+
+
+if __name__ == "__main__":
+    main()
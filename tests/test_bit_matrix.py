@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from project import BitMatrix
+
+
+@pytest.fixture
+def random_matrices():
+    rng = np.random.default_rng(42)
+    lhs = sparse.random(70, 130, density=0.05, random_state=rng, format="csr")
+    rhs = sparse.random(130, 65, density=0.05, random_state=rng, format="csr")
+    return lhs.astype(bool), rhs.astype(bool)
+
+
+def test_coords_roundtrip():
+    rows, cols = [0, 0, 3, 4], [0, 63, 64, 129]
+    matrix = BitMatrix.from_coords(rows, cols, (5, 130))
+
+    assert matrix.nnz == 4
+    assert all(matrix[edge] for edge in zip(rows, cols))
+    assert not matrix[1, 1]
+    assert [list(c) for c in matrix.nonzero()] == [rows, cols]
+
+
+def test_setitem():
+    matrix = BitMatrix.zeros((2, 100))
+    matrix[1, 70] = True
+    assert matrix[1, 70] and matrix.nnz == 1
+    matrix[1, 70] = False
+    assert matrix.nnz == 0
+
+
+def test_matmul(random_matrices):
+    lhs, rhs = random_matrices
+    expected = lhs @ rhs
+    actual = BitMatrix.from_sparse(lhs) @ BitMatrix.from_sparse(rhs)
+
+    assert (actual.tocsr() != expected).nnz == 0
+
+
+def test_add_and_transpose(random_matrices):
+    lhs, _ = random_matrices
+    bits = BitMatrix.from_sparse(lhs)
+
+    assert (bits.T.tocsr() != lhs.T).nnz == 0
+    assert ((bits + bits.T.T).tocsr() != lhs).nnz == 0
+    assert ((bits + lhs).tocsr() != lhs).nnz == 0
+
+
+def test_identity():
+    assert (BitMatrix.identity(100).tocsr() != sparse.identity(100)).nnz == 0
+
+
+@pytest.mark.parametrize("shape", [(70, 130, 65), (5, 3, 200), (64, 64, 64)])
+@pytest.mark.parametrize("density", [0.05, 0.5])
+def test_four_russians(shape, density):
+    rng = np.random.default_rng(3)
+    n, m, p = shape
+    lhs, rhs = rng.random((n, m)) < density, rng.random((m, p)) < density
+
+    product = BitMatrix.from_dense(lhs).four_russians(BitMatrix.from_dense(rhs))
+
+    expected = (lhs.astype(int) @ rhs.astype(int)) > 0
+    assert (product.to_dense() == expected).all()
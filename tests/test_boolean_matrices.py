@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 from pyformlang.finite_automaton import (
     NondeterministicFiniteAutomaton,
@@ -5,7 +6,8 @@ from pyformlang.finite_automaton import (
     State,
 )
 
-from project import BooleanMatrices
+from project import BooleanMatrices, BitMatrix, available_backends
+from project.ecfg_utils import ECFG, ecfg_to_rsm
 
 
 @pytest.fixture
@@ -90,3 +92,305 @@ def test_intersection():
     actual_fa = bm1.intersect(bm2).to_automaton()
 
     assert actual_fa.is_equivalent_to(expected_fa)
+
+
+@pytest.mark.parametrize("backend", ["csr", "dok", "bitset"])
+def test_backend_format(default_fa, backend):
+    bm = BooleanMatrices.from_automaton(default_fa, backend=backend)
+    intersection = bm.intersect(bm)
+
+    assert all(m.format == backend for m in bm.bool_matrices.values())
+    assert all(m.format == backend for m in intersection.bool_matrices.values())
+    assert bm.transitive_closure().format == backend
+    assert intersection.transitive_closure().format == backend
+
+
+@pytest.mark.parametrize("backend", ["dok", "bitset"])
+def test_backends_equivalent(default_fa, backend):
+    csr_bm = BooleanMatrices.from_automaton(default_fa, backend="csr")
+    other_bm = BooleanMatrices.from_automaton(default_fa, backend=backend)
+    csr_tc = csr_bm.intersect(csr_bm).transitive_closure()
+    other_tc = other_bm.intersect(other_bm).transitive_closure()
+
+    assert (csr_tc != other_tc.asformat("csr")).nnz == 0
+    assert all(
+        (
+            csr_bm.bool_matrices[label] != other_bm.bool_matrices[label].asformat("csr")
+        ).nnz
+        == 0
+        for label in default_fa.symbols
+    )
+
+
+def test_auto_backend(default_fa):
+    small = BooleanMatrices.from_automaton(default_fa)
+    assert small.storage == "bitset"
+    assert isinstance(small.transitive_closure(), BitMatrix)
+
+    chain = NondeterministicFiniteAutomaton()
+    chain.add_transitions([(i, "a", i + 1) for i in range(20000)])
+    large = BooleanMatrices.from_automaton(chain)
+    assert large.storage == "csr"
+
+
+def test_unknown_backend(default_fa):
+    with pytest.raises(ValueError):
+        BooleanMatrices.from_automaton(default_fa, backend="coo")
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_semi_naive_closure(default_fa, backend):
+    bm = BooleanMatrices.from_automaton(default_fa, backend=backend)
+    ops = bm.matrix_backend
+    squaring = ops.convert(bm.transitive_closure("squaring"))
+    semi_naive = ops.convert(bm.transitive_closure("semi-naive"))
+
+    assert ops.nnz(semi_naive) == ops.nnz(squaring) == 16
+    assert ops.nnz(ops.subtract(squaring, semi_naive)) == 0
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_scc_closure(default_fa, backend):
+    default_fa.add_transitions([(3, "e", 4), (4, "e", 5), (5, "e", 5)])
+    bm = BooleanMatrices.from_automaton(default_fa, backend=backend)
+    ops = bm.matrix_backend
+    squaring = ops.convert(bm.transitive_closure("squaring"))
+    scc = bm.transitive_closure("scc")
+
+    assert ops.nnz(scc) == ops.nnz(squaring) == 26
+    assert ops.nnz(ops.subtract(squaring, scc.materialize())) == 0
+    assert scc.reach.shape == (3, 3)
+    assert scc[4, 5] and not scc[4, 4] and not scc[5, 0]
+
+
+def test_closure_iterations():
+    chain = NondeterministicFiniteAutomaton()
+    chain.add_transitions([(i, "a", i + 1) for i in range(32)])
+    bm = BooleanMatrices.from_automaton(chain, backend="csr")
+
+    tc = bm.transitive_closure("semi-naive")
+    assert tc.nnz == 33 * 32 // 2
+    assert bm.closure_iterations == 32
+
+    tc = bm.transitive_closure("squaring")
+    assert tc.nnz == 33 * 32 // 2
+    assert bm.closure_iterations == 6
+
+
+def test_unknown_closure_algorithm(default_fa):
+    with pytest.raises(ValueError):
+        BooleanMatrices.from_automaton(default_fa).transitive_closure("unknown")
+
+
+def test_intersection_masks(default_fa):
+    default_fa.add_start_state(State(0))
+    default_fa.add_final_state(State(1))
+    default_fa.add_final_state(State(3))
+    bm = BooleanMatrices.from_automaton(default_fa)
+    intersection = bm.intersect(bm)
+    n = bm.num_states
+
+    start = bm.state_indexes[State(0)]
+    finals = [bm.state_indexes[State(1)], bm.state_indexes[State(3)]]
+    assert intersection.start_mask().sum() == 1
+    assert intersection.start_mask()[start * n + start]
+    assert intersection.get_start_states() == {start * n + start}
+    assert intersection.final_states == {i * n + j for i in finals for j in finals}
+    assert len(intersection.state_indexes) == n * n
+    assert intersection.state_indexes[n + 2] == n + 2
+    assert n * n not in intersection.state_indexes
+
+
+def test_disjoint_union(default_fa):
+    default_fa.add_start_state(State(0))
+    default_fa.add_final_state(State(3))
+    bm = BooleanMatrices.from_automaton(default_fa)
+    union = BooleanMatrices.disjoint_union([bm, bm])
+    n = bm.num_states
+
+    assert union.num_states == 2 * n
+    assert np.flatnonzero(union.start_mask()).tolist() == [
+        bm.state_indexes[State(0)],
+        n + bm.state_indexes[State(0)],
+    ]
+    assert union.final_mask().sum() == 2
+    for label, matrix in bm.bool_matrices.items():
+        cells = set(zip(*bm.matrix_backend.nonzero(matrix)))
+        assert set(zip(*union.matrix_backend.nonzero(union.bool_matrices[label]))) == {
+            (i + offset, j + offset) for i, j in cells for offset in (0, n)
+        }
+
+
+def closure_cells(bm, tc):
+    return set(zip(*(indices.tolist() for indices in bm.matrix_backend.nonzero(tc))))
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_incremental_closure(default_fa, backend):
+    bm = BooleanMatrices.from_automaton(default_fa, backend=backend)
+    bm.closure()
+    changes = [
+        ("add", 3, "e", 4),
+        ("add", 4, "e", 5),
+        ("remove", 3, "d", 0),
+        ("add", 5, "a", 0),
+        ("remove", 4, "e", 5),
+        ("add", 3, "d", 0),
+        ("remove", 0, "a", 2),
+    ]
+    for action, s_from, label, s_to in changes:
+        if action == "add":
+            bm.add_edge(s_from, label, s_to)
+        else:
+            bm.remove_edge(s_from, label, s_to)
+        expected = closure_cells(bm, bm.transitive_closure())
+        assert closure_cells(bm, bm.closure()) == expected
+
+    assert bm.num_states == 6
+    assert bm.version == len(changes)
+
+
+def test_changed_labels(default_fa):
+    bm = BooleanMatrices.from_automaton(default_fa)
+    bm.add_edge(0, "a", 3)
+    version = bm.version
+    bm.remove_edge(1, "b", 2)
+    bm.add_edge(0, "a", 3)
+
+    assert bm.changed_labels(0) == {"a", "b"}
+    assert bm.changed_labels(version) == {"b"}
+    assert bm.version == 2
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_adjacency_lists(default_fa, backend):
+    bm = BooleanMatrices.from_automaton(default_fa, backend)
+    a, c = bm.state_indexes[State(0)], bm.state_indexes[State(3)]
+    indptr, indices = bm.adjacency_lists("d")
+    assert indices[indptr[c] : indptr[c + 1]].tolist() == [a]
+    assert bm.adjacency_lists("d") is bm.adjacency_lists("d")
+    indptr, indices = bm.adjacency_lists("d", transposed=True)
+    assert indices[indptr[a] : indptr[a + 1]].tolist() == [c]
+    bm.add_edge(0, "d", 0)
+    indptr, indices = bm.adjacency_lists("d")
+    assert sorted(indices[indptr[a] : indptr[a + 1]].tolist()) == [a]
+
+
+def test_remove_missing_edge(default_fa):
+    bm = BooleanMatrices.from_automaton(default_fa)
+    with pytest.raises(ValueError):
+        bm.remove_edge(0, "b", 1)
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_from_rsm(backend):
+    rsm = ecfg_to_rsm(ECFG.from_text("S -> a S b | c\nA -> a*"))
+    bm = BooleanMatrices.from_rsm(rsm, backend=backend)
+    ops = bm.matrix_backend
+
+    assert bm.num_states == sum(len(box.dfa.states) for box in rsm.boxes)
+    assert len(bm.state_indexes) == bm.num_states
+    for box in rsm.boxes:
+        start = bm.state_indexes[State(f"{box.dfa.start_state.value}#{box.variable}")]
+        assert bm.start_mask()[start]
+        for state in box.dfa.final_states:
+            final = bm.state_indexes[State(f"{state.value}#{box.variable}")]
+            assert bm.final_mask()[final]
+            assert bm.states_to_box_variable[(start, final)] == box.variable.value
+        for s_from, trans in box.dfa.to_dict().items():
+            for label, s_to in trans.items():
+                i = bm.state_indexes[State(f"{s_from.value}#{box.variable}")]
+                j = bm.state_indexes[State(f"{s_to.value}#{box.variable}")]
+                assert bm.bool_matrices[label][i, j]
+    assert sum(ops.nnz(m) for m in bm.bool_matrices.values()) == sum(
+        len(trans) for box in rsm.boxes for trans in box.dfa.to_dict().values()
+    )
+    assert bm.start_states == {
+        State(f"{box.dfa.start_state.value}#{box.variable}") for box in rsm.boxes
+    }
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_save_load(default_fa, tmp_path, backend):
+    default_fa.add_start_state(State(0))
+    default_fa.add_final_state(State(3))
+    bm = BooleanMatrices.from_automaton(default_fa, backend=backend)
+    bm.save(tmp_path / "fa")
+
+    loaded = BooleanMatrices.load(tmp_path / "fa", backend=backend)
+
+    assert loaded.storage == bm.storage
+    assert loaded.num_states == bm.num_states
+    assert loaded.state_indexes == bm.state_indexes
+    assert loaded.start_states == {State(0)}
+    assert loaded.final_states == {State(3)}
+    assert loaded.bool_matrices.keys() == bm.bool_matrices.keys()
+    for label, matrix in bm.bool_matrices.items():
+        assert closure_cells(loaded, loaded.bool_matrices[label]) == closure_cells(
+            bm, matrix
+        )
+    assert closure_cells(loaded, loaded.transitive_closure()) == closure_cells(
+        bm, bm.transitive_closure()
+    )
+
+
+def test_save_load_tuple_states(tmp_path):
+    fa = NondeterministicFiniteAutomaton()
+    fa.add_transitions([((0, "x"), "a", ((1, 2), None)), ("s", "b", (0, "x"))])
+    fa.add_start_state(State((0, "x")))
+    bm = BooleanMatrices.from_automaton(fa, backend="csr")
+    bm.save(tmp_path)
+
+    loaded = BooleanMatrices.load(tmp_path)
+
+    assert loaded.state_indexes == bm.state_indexes
+    assert loaded.start_states == {State((0, "x"))}
+    assert State(((1, 2), None)) in loaded.state_indexes
+
+
+def test_export_unsupported_states():
+    fa = NondeterministicFiniteAutomaton()
+    fa.add_transitions([(frozenset({0}), "a", 1)])
+    bm = BooleanMatrices.from_automaton(fa)
+
+    with pytest.raises(ValueError, match="frozenset"):
+        bm.export_csr()
+
+
+def test_load_defaults_to_memory_map(default_fa, tmp_path):
+    BooleanMatrices.from_automaton(default_fa, backend="bitset").save(tmp_path)
+    loaded = BooleanMatrices.load(tmp_path)
+
+    assert loaded.storage == "csr"
+    assert all(
+        not matrix.indices.flags.writeable for matrix in loaded.bool_matrices.values()
+    )
+    assert BooleanMatrices.load(tmp_path, backend="bitset").storage == "bitset"
+
+
+def test_load_memory_maps_csr(default_fa, tmp_path):
+    BooleanMatrices.from_automaton(default_fa).save(tmp_path)
+    loaded = BooleanMatrices.load(tmp_path, backend="csr")
+
+    assert all(
+        not matrix.indices.flags.writeable and not matrix.indptr.flags.writeable
+        for matrix in loaded.bool_matrices.values()
+    )
+    product = loaded.intersect(loaded)
+    expected = BooleanMatrices.from_automaton(default_fa, backend="csr")
+    expected = expected.intersect(expected)
+    assert closure_cells(product, product.transitive_closure()) == closure_cells(
+        expected, expected.transitive_closure()
+    )
+
+
+def test_save_load_rsm(tmp_path):
+    rsm = ecfg_to_rsm(ECFG.from_text("S -> a S b | c"))
+    bm = BooleanMatrices.from_rsm(rsm, backend="csr")
+    bm.save(tmp_path)
+
+    loaded = BooleanMatrices.load(tmp_path)
+
+    assert loaded.states_to_box_variable == bm.states_to_box_variable
+    assert loaded.start_states == bm.start_states
+    assert (loaded.final_mask() == bm.final_mask()).all()
@@ -0,0 +1,183 @@
+import networkx as nx
+import pytest
+from pyformlang.cfg import CFG
+from pyformlang.regular_expression import Regex
+
+from project import (
+    BooleanMatrices,
+    GRAPH_VERSION_KEY,
+    GraphException,
+    GraphIndexCache,
+    generate_two_cycles_graph,
+    get_graph_index_cache,
+    graph_fingerprint,
+    graph_matrices,
+    graph_to_nfa,
+    hellings,
+    matrix,
+    rpq,
+    tensor,
+)
+
+
+@pytest.fixture
+def graph():
+    return generate_two_cycles_graph(3, 2, ("a", "b"))
+
+
+@pytest.fixture
+def cache(graph):
+    cache = get_graph_index_cache()
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def test_hits_and_misses(graph):
+    cache = GraphIndexCache()
+    bm = cache.boolean_matrices(graph, "csr")
+    assert cache.boolean_matrices(graph, "csr") is bm
+    assert cache.boolean_matrices(graph, "sets") is not bm
+    info = cache.info()
+    assert (info.hits, info.misses, info.currsize) == (1, 2, 2)
+    assert info.nbytes > 0
+
+
+def test_fingerprint(graph):
+    cache = GraphIndexCache()
+    bm = cache.boolean_matrices(graph)
+    graph.add_edge(0, 5, label="a")
+    changed = cache.boolean_matrices(graph)
+    assert changed is not bm
+    assert changed.num_states == bm.num_states
+    graph.graph[GRAPH_VERSION_KEY] = 1
+    assert cache.boolean_matrices(graph) is not changed
+    assert len(cache) == 1
+
+
+def edges(bm, label):
+    states = bm.get_states_by_index()
+    rows, cols = bm.matrix_backend.nonzero(bm.bool_matrices[label])
+    return {(states[u], states[v]) for u, v in zip(rows.tolist(), cols.tolist())}
+
+
+def starting(triplets):
+    return {triplet for triplet in triplets if triplet[1] == "S"}
+
+
+def test_changes_keeping_counts():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    graph.add_edge(1, 2, label="b")
+    assert rpq(graph, Regex("a.b")) == {(0, 2)}
+    cfg = CFG.from_text("S -> a b")
+    assert starting(hellings(graph, cfg)) == {(0, "S", 2)}
+
+    graph[1][2][0]["label"] = "c"
+    assert rpq(graph, Regex("a.b")) == set()
+    assert rpq(graph, Regex("a.c")) == {(0, 2)}
+    for algorithm in (hellings, matrix, tensor):
+        assert starting(algorithm(graph, cfg)) == set()
+        assert starting(algorithm(graph, CFG.from_text("S -> a c"))) == {(0, "S", 2)}
+
+    graph.remove_edge(1, 2)
+    graph.add_edge(1, 0, label="a")
+    assert rpq(graph, Regex("a.a")) == {(0, 0), (1, 1)}
+
+
+def test_versioned_graph_skips_hashes(graph):
+    graph.graph[GRAPH_VERSION_KEY] = 1
+    fingerprint = graph_fingerprint(graph)
+    graph[0][1][0]["label"] = "b"
+    assert graph_fingerprint(graph) == fingerprint
+    graph.graph[GRAPH_VERSION_KEY] = 2
+    assert graph_fingerprint(graph) != fingerprint
+    del graph.graph[GRAPH_VERSION_KEY]
+    unversioned = graph_fingerprint(graph)
+    graph[0][1][0]["label"] = "a"
+    assert graph_fingerprint(graph) != unversioned
+
+
+def test_memory_budget(graph):
+    other = generate_two_cycles_graph(4, 3, ("a", "b"))
+    cache = GraphIndexCache()
+    cache.boolean_matrices(other, "csr")
+    cache.resize(cache.nbytes)
+    cache.clear()
+    cache.boolean_matrices(graph, "csr")
+    cache.boolean_matrices(other, "csr")
+    assert cache.info().evictions == 1
+    assert cache.info().currsize == 1
+    cache.boolean_matrices(other, "csr")
+    assert cache.info().hits == 1
+    cache.resize(0)
+    assert len(cache) == 0 and cache.nbytes == 0
+    cache.boolean_matrices(graph, "csr")
+    assert len(cache) == 0
+
+
+def test_converts_requested_labels(graph):
+    cache = GraphIndexCache()
+    full = BooleanMatrices.from_automaton(graph_to_nfa(graph), "csr")
+    only_a = cache.boolean_matrices(graph, "csr", labels={"a"})
+    assert only_a.bool_matrices.keys() == {"a"}
+    assert cache.boolean_matrices(graph, "csr", labels={"a"}) is only_a
+
+    both = cache.boolean_matrices(graph, "csr", labels={"b", "c"})
+    assert both.bool_matrices.keys() == {"a", "b"}
+    assert only_a.bool_matrices.keys() == {"a"}
+    assert cache.boolean_matrices(graph, "csr", labels={"a", "b", "c"}) is both
+    for label in ("a", "b"):
+        assert edges(both, label) == edges(full, label)
+    assert cache.info().misses == 2
+
+    assert cache.boolean_matrices(graph, "csr").bool_matrices.keys() == {"a", "b"}
+    assert cache.info().misses == 3
+
+
+def test_rpq_looks_up_graph_once(graph, cache):
+    rpq(graph, Regex("a*"), start_nodes={0})
+    rpq(graph, Regex("a*"))
+    info = cache.info()
+    assert (info.misses, info.hits) == (1, 1)
+    with pytest.raises(GraphException):
+        rpq(graph, Regex("a*"), final_nodes={10})
+
+
+def test_queries_convert_their_labels(graph, cache):
+    rpq(graph, Regex("a.c"))
+    assert set(cache.boolean_matrices(graph, labels={"a"}).bool_matrices) == {"a"}
+    tensor(graph, CFG.from_text("S -> a S b | a b"))
+    assert set(cache.boolean_matrices(graph, labels={"a"}).bool_matrices) == {
+        "a",
+        "b",
+    }
+    assert cache.info().misses == 2
+
+
+def test_invalidate(graph):
+    cache = GraphIndexCache()
+    bm = cache.boolean_matrices(graph)
+    cache.invalidate(graph)
+    assert cache.boolean_matrices(graph) is not bm
+
+
+def test_graph_matrices(graph, cache):
+    bm = graph_matrices(graph, start_nodes={0}, labels={"a"})
+    assert bm.bool_matrices.keys() == {"a"}
+    assert {state.value for state in bm.start_states} == {0}
+    assert set(cache.boolean_matrices(graph).bool_matrices) == {"a", "b"}
+    with pytest.raises(GraphException):
+        graph_matrices(graph, start_nodes={10})
+
+
+def test_queries_share_index(graph, cache):
+    cfg = CFG.from_text("S -> a S b | a b")
+    expected = hellings(graph, cfg)
+    assert matrix(graph, cfg) == expected
+    assert tensor(graph, cfg) == expected
+    rpq(graph, Regex("a*"))
+    rpq(graph, Regex("b"), start_nodes={0})
+    info = cache.info()
+    assert info.misses == 1
+    assert info.hits >= 4
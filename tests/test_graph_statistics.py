@@ -0,0 +1,70 @@
+import pytest
+
+from project import (
+    BooleanMatrices,
+    GraphStatistics,
+    generate_two_cycles_graph,
+    graph_statistics,
+    graph_to_nfa,
+)
+
+
+@pytest.fixture
+def graph():
+    return generate_two_cycles_graph(3, 2, ("a", "b"))
+
+
+def test_graph_statistics(graph):
+    statistics = graph_statistics(graph)
+    assert statistics.num_nodes == 6
+    assert statistics.num_edges == 7
+    assert statistics.label_edges == {"a": 4, "b": 3}
+    assert statistics.label_sources == {"a": 4, "b": 3}
+    assert statistics.label_targets == {"a": 4, "b": 3}
+    assert statistics.out_degree_histogram == [0, 5, 1]
+    assert statistics.in_degree_histogram == [0, 5, 1]
+    assert statistics.co_occurrence == {
+        ("a", "a"): 4,
+        ("a", "b"): 1,
+        ("b", "a"): 1,
+        ("b", "b"): 3,
+    }
+
+
+def test_statistics_of_matrices(graph):
+    bm = BooleanMatrices.from_automaton(graph_to_nfa(graph))
+    assert graph_statistics(bm).to_dict() == graph_statistics(graph).to_dict()
+    assert bm.statistics() is bm.statistics()
+
+
+def test_estimates(graph):
+    statistics = graph_statistics(graph)
+    assert statistics.selectivity("a") == 4 / 36
+    assert statistics.selectivity("c") == 0
+    assert statistics.estimate_path_count([]) == 6
+    assert statistics.estimate_path_count(["a", "b"]) == 1
+    assert statistics.estimate_path_count(["a", "a", "a"]) == 4
+    assert statistics.estimate_path_count(["c", "a"]) == 0
+
+
+def test_statistics_follow_edges(graph):
+    bm = BooleanMatrices.from_automaton(graph_to_nfa(graph))
+    assert bm.statistics().label_edges["a"] == 4
+    bm.add_edge(0, "a", 5)
+    assert bm.statistics().label_edges["a"] == 5
+
+
+def test_save_load(graph, tmp_path):
+    statistics = graph_statistics(graph)
+    statistics.save(tmp_path / "statistics.json")
+    loaded = GraphStatistics.load(tmp_path / "statistics.json")
+    assert loaded.to_dict() == statistics.to_dict()
+    assert loaded.co_occurrence == statistics.co_occurrence
+
+
+def test_saved_with_matrices(graph, tmp_path):
+    bm = BooleanMatrices.from_automaton(graph_to_nfa(graph))
+    bm.save(tmp_path)
+    loaded = BooleanMatrices.load(tmp_path)
+    assert loaded._statistics is not None
+    assert loaded.statistics().to_dict() == bm.statistics().to_dict()
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from pyformlang.finite_automaton import NondeterministicFiniteAutomaton, State
+from pyformlang.regular_expression import Regex
+
+from project import (
+    BooleanMatrices,
+    LazyIntersection,
+    available_backends,
+    generate_two_cycles_graph,
+    graph_to_nfa,
+    regex_to_min_dfa,
+    rpq,
+)
+
+
+@pytest.fixture
+def default_fa():
+    fa = NondeterministicFiniteAutomaton()
+    fa.add_transitions(
+        [(0, "a", 1), (0, "c", 1), (0, "c", 0), (1, "b", 1), (1, "c", 2), (2, "d", 0)]
+    )
+    fa.add_start_state(State(0))
+    fa.add_final_state(State(1))
+    return fa
+
+
+def coords(rows, cols):
+    return set(zip(np.asarray(rows).tolist(), np.asarray(cols).tolist()))
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_matches_materialized(default_fa, backend):
+    bm = BooleanMatrices.from_automaton(default_fa, backend=backend)
+    lazy = bm.intersect(bm, lazy=True)
+    eager = bm.intersect(bm)
+    ops = eager.matrix_backend
+
+    assert isinstance(lazy, LazyIntersection)
+    assert lazy.bool_matrices.keys() == eager.bool_matrices.keys()
+    assert lazy.start_states == eager.start_states
+    assert lazy.final_states == eager.final_states
+    for label, matrix in lazy.bool_matrices.items():
+        expected = coords(*ops.nonzero(eager.bool_matrices[label]))
+        assert coords(*matrix.nonzero()) == expected
+        assert matrix.nnz == len(expected)
+        assert all(matrix[cell] for cell in expected)
+
+
+def test_neighbours(default_fa):
+    bm = BooleanMatrices.from_automaton(default_fa, backend="csr")
+    matrix = bm.intersect(bm, lazy=True).bool_matrices["c"]
+    index = bm.state_indexes[State(0)] * bm.num_states + bm.state_indexes[State(0)]
+    eager_row = bm.intersect(bm).bool_matrices["c"].getrow(index)
+
+    assert matrix.neighbours(index).tolist() == sorted(eager_row.indices.tolist())
+
+
+def test_traversal_touches_reachable_states():
+    chain = NondeterministicFiniteAutomaton()
+    chain.add_transitions([(i, "a", i + 1) for i in range(3000)])
+    chain.add_start_state(State(0))
+    chain.add_final_state(State(3000))
+    bm = BooleanMatrices.from_automaton(chain, backend="csr")
+
+    lazy = bm.intersect(bm, lazy=True)
+    starts, reachable = lazy.reachable_from_starts()
+
+    assert lazy.num_states == 3001**2
+    assert starts.tolist() == [0]
+    assert reachable.nnz == 3000
+    assert lazy.closure_iterations == 3001
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_rpq_lazy_mode(backend):
+    graph = generate_two_cycles_graph(20, 15, ("a", "b"))
+    regex = Regex("a a* b | b b")
+
+    assert rpq(graph, regex, backend=backend, mode="lazy") == rpq(
+        graph, regex, mode="closure"
+    )
+    assert rpq(graph, regex, {0, 21}, {3, 5}, mode="lazy") == rpq(
+        graph, regex, {0, 21}, {3, 5}, mode="closure"
+    )
+
+
+def test_materialize():
+    graph_bm = BooleanMatrices.from_automaton(
+        graph_to_nfa(generate_two_cycles_graph(3, 2, ("a", "b")))
+    )
+    query_bm = BooleanMatrices.from_automaton(regex_to_min_dfa(Regex("a* b")))
+    lazy = graph_bm.intersect(query_bm, lazy=True)
+    eager = graph_bm.intersect(query_bm)
+
+    assert lazy.state_indexes == eager.state_indexes
+    assert lazy.materialize().to_automaton().is_equivalent_to(eager.to_automaton())
+    tc = lazy.transitive_closure()
+    assert lazy.matrix_backend.nnz(tc) == eager.matrix_backend.nnz(
+        eager.transitive_closure()
+    )
@@ -0,0 +1,172 @@
+import numpy as np
+import pytest
+
+from project import (
+    BooleanMatrices,
+    MatrixBackend,
+    ParallelScipyBackend,
+    ScipyBackend,
+    available_backends,
+    get_backend,
+    register_backend,
+    BACKEND_ENV_VAR,
+    WORKERS_ENV_VAR,
+)
+
+
+@pytest.fixture(params=available_backends())
+def backend(request):
+    return get_backend(request.param)
+
+
+@pytest.fixture
+def dense_pair():
+    rng = np.random.default_rng(7)
+    return rng.random((6, 9)) < 0.3, rng.random((9, 4)) < 0.3
+
+
+def to_dense(backend, matrix):
+    dense = np.zeros(matrix.shape, dtype=bool)
+    dense[backend.nonzero(matrix)] = True
+    return dense
+
+
+def from_dense(backend, dense):
+    return backend.from_coords(*np.nonzero(dense), dense.shape)
+
+
+def test_roundtrip(backend, dense_pair):
+    lhs, _ = dense_pair
+    matrix = from_dense(backend, lhs)
+
+    assert backend.nnz(matrix) == lhs.sum()
+    assert np.array_equal(to_dense(backend, matrix), lhs)
+
+
+def test_multiply_and_add(backend, dense_pair):
+    lhs, rhs = dense_pair
+    product = backend.multiply(from_dense(backend, lhs), from_dense(backend, rhs))
+    total = backend.add(from_dense(backend, lhs), from_dense(backend, lhs[::-1]))
+
+    assert np.array_equal(to_dense(backend, product), (lhs.astype(int) @ rhs) > 0)
+    assert np.array_equal(to_dense(backend, total), lhs | lhs[::-1])
+
+
+def test_kron_identity_transpose(backend, dense_pair):
+    lhs, rhs = dense_pair
+    kron = backend.kron(from_dense(backend, lhs), from_dense(backend, rhs))
+
+    assert np.array_equal(to_dense(backend, kron), np.kron(lhs, rhs))
+    assert np.array_equal(to_dense(backend, backend.identity(5)), np.eye(5, dtype=bool))
+    assert np.array_equal(
+        to_dense(backend, backend.transpose(from_dense(backend, lhs))), lhs.T
+    )
+
+
+def test_rows(backend, dense_pair):
+    lhs, _ = dense_pair
+    indices = [4, 0, 4]
+    rows = backend.rows(from_dense(backend, lhs), indices)
+
+    assert rows.shape == (3, lhs.shape[1])
+    assert np.array_equal(to_dense(backend, rows), lhs[indices])
+
+
+def test_convert(backend, dense_pair):
+    lhs, _ = dense_pair
+    for other in available_backends():
+        matrix = from_dense(get_backend(other), lhs)
+        assert np.array_equal(to_dense(backend, backend.convert(matrix)), lhs)
+
+
+def test_from_label_coords(backend):
+    transitions = {
+        "a": ([0, 2, 0, 1], [1, 3, 1, 0]),
+        "b": ([3], [3]),
+        "c": ([], []),
+    }
+    matrices = backend.from_label_coords(transitions, (4, 5))
+
+    assert matrices.keys() == transitions.keys()
+    assert all(backend.is_native(m) and m.shape == (4, 5) for m in matrices.values())
+    rows, cols = to_dense(backend, matrices["a"]).nonzero()
+    assert (rows.tolist(), cols.tolist()) == ([0, 1, 2], [1, 0, 3])
+    assert backend.nnz(matrices["b"]) == 1
+    assert backend.nnz(matrices["c"]) == 0
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_multiply(workers):
+    rng = np.random.default_rng(11)
+    lhs, rhs = rng.random((200, 150)) < 0.05, rng.random((150, 120)) < 0.05
+    backend = ParallelScipyBackend(workers=workers, min_nnz=0)
+
+    product = backend.multiply(from_dense(backend, lhs), from_dense(backend, rhs))
+    backend.close()
+
+    assert backend.is_native(product)
+    assert (to_dense(backend, product) == (lhs.astype(int) @ rhs.astype(int) > 0)).all()
+
+
+def test_parallel_multiply_empty_rows():
+    backend = ParallelScipyBackend(workers=3, min_nnz=0)
+    lhs = backend.from_coords([], [], (0, 4))
+    rhs = backend.from_coords([0, 1], [1, 2], (4, 3))
+
+    product = backend.multiply(lhs, rhs)
+    backend.close()
+
+    assert product.shape == (0, 3) and backend.nnz(product) == 0
+
+
+def test_parallel_workers_read_lazily(monkeypatch):
+    rng = np.random.default_rng(5)
+    lhs, rhs = rng.random((50, 40)) < 0.1, rng.random((40, 30)) < 0.1
+    backend = ParallelScipyBackend(min_nnz=0)
+    monkeypatch.setenv(WORKERS_ENV_VAR, "3")
+
+    assert get_backend("csr-parallel").workers == 3
+    product = backend.multiply(from_dense(backend, lhs), from_dense(backend, rhs))
+    assert backend._pool_workers == 3
+    backend.close()
+    assert (to_dense(backend, product) == (lhs.astype(int) @ rhs.astype(int) > 0)).all()
+    assert ParallelScipyBackend(workers=2).workers == 2
+
+
+def test_parallel_closure(monkeypatch):
+    monkeypatch.setenv(WORKERS_ENV_VAR, "4")
+    backend = ParallelScipyBackend(min_nnz=0, name="csr-parallel-test")
+    register_backend(backend)
+    rows = np.arange(99)
+    bm = BooleanMatrices.from_transitions(100, {"a": (rows, rows + 1)}, backend.name)
+
+    assert backend.workers == 4
+    assert bm.matrix_backend.nnz(bm.transitive_closure()) == 100 * 99 // 2
+    backend.close()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_backend("unknown")
+
+
+def test_env_backend(monkeypatch):
+    monkeypatch.setenv(BACKEND_ENV_VAR, "sets")
+    bm = BooleanMatrices()
+
+    assert bm.backend == "sets"
+    assert bm.matrix_backend is get_backend("sets")
+
+
+def test_register_backend():
+    class CscBackend(ScipyBackend):
+        def __init__(self):
+            super().__init__("csc")
+            self.name = "test-csc"
+
+    register_backend(CscBackend())
+
+    assert "test-csc" in available_backends()
+    assert isinstance(get_backend("test-csc"), MatrixBackend)
+    bm = BooleanMatrices.from_transitions(3, {"a": ([0, 1], [1, 2])}, "test-csc")
+    assert bm.transitive_closure().format == "csc"
@@ -0,0 +1,80 @@
+import networkx as nx
+import pytest
+from pyformlang.regular_expression import PythonRegex, Regex
+
+from project import (
+    QueryCache,
+    generate_two_cycles_graph,
+    get_query_cache,
+    regex_str_to_min_dfa,
+    regex_to_min_dfa,
+    rpq,
+)
+
+
+@pytest.fixture
+def cache():
+    return QueryCache(maxsize=2)
+
+
+def test_hits_and_misses(cache):
+    first = cache.get("a*|b")
+    assert cache.get(Regex("(a*)|b")) is first
+    assert cache.get(PythonRegex("a*|b")) is first
+    info = cache.info()
+    assert (info.hits, info.misses, info.evictions, info.currsize) == (2, 1, 0, 1)
+
+
+def test_evicts_least_recently_used(cache):
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")
+    cache.get("c")
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.info().evictions == 1
+    cache.resize(1)
+    assert len(cache) == 1 and "c" in cache
+    assert cache.info().evictions == 2
+
+
+def test_disabled_cache():
+    cache = QueryCache(maxsize=0)
+    assert cache.get("a") is not cache.get("a")
+    assert cache.info().misses == 2
+    with pytest.raises(ValueError):
+        QueryCache(maxsize=-1)
+
+
+def test_boolean_matrices_per_backend(cache):
+    csr = cache.boolean_matrices("a.b*", "csr")
+    assert cache.boolean_matrices("a.b*", "csr") is csr
+    assert cache.boolean_matrices("a.b*", "sets") is not csr
+    assert csr.num_states == len(cache.min_dfa("a.b*").states)
+
+
+def test_regex_functions_return_copies():
+    dfa = regex_str_to_min_dfa("a.b")
+    dfa.add_final_state(dfa.start_state)
+    assert not regex_to_min_dfa(Regex("a.b")).accepts([])
+    assert regex_str_to_min_dfa("a.b").is_equivalent_to(regex_to_min_dfa(Regex("a.b")))
+
+
+def test_rpq_uses_cache():
+    graph = generate_two_cycles_graph(3, 2, ("a", "b"))
+    cache = get_query_cache()
+    cache.clear()
+    expected = rpq(graph, Regex("a.a*"))
+    assert rpq(graph, Regex("a.(a*)")) == expected
+    info = cache.info()
+    assert info.misses == 1 and info.hits == 1
+
+
+def test_symbols_named_as_operators(cache):
+    assert cache.canonical("") != cache.canonical("Empty")
+    assert cache.canonical("$") != cache.canonical("Epsilon")
+    assert cache.get("") is not cache.get("Empty")
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="Empty")
+    get_query_cache().clear()
+    assert rpq(graph, Regex("")) == set()
+    assert rpq(graph, Regex("Empty")) == {(0, 1)}
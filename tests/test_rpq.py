@@ -1,9 +1,23 @@
+import sys
+
 import networkx as nx
 import pytest
 from itertools import product
 from pyformlang.regular_expression import PythonRegex, Regex
 
-from project import generate_two_cycles_graph, rpq
+from project import (
+    BooleanMatrices,
+    accepts_nonempty_word,
+    available_backends,
+    generate_two_cycles_graph,
+    get_reachable,
+    graph_to_nfa,
+    iter_reachable,
+    regex_to_min_dfa,
+    rpq,
+    rpq_batch,
+    rpq_iter,
+)
 
 
 @pytest.fixture
@@ -23,6 +37,22 @@ def test_all_nodes_start_and_final(default_graph, nodes_rpq):
     assert actual_rpq == nodes_rpq
 
 
+@pytest.mark.parametrize("backend", available_backends())
+def test_backends(default_graph, nodes_rpq, backend):
+    actual_rpq = rpq(default_graph, PythonRegex("a*|b"), backend=backend)
+
+    assert actual_rpq == nodes_rpq
+
+
+@pytest.mark.parametrize("closure_algorithm", ["semi-naive", "scc"])
+def test_closure_algorithms(default_graph, nodes_rpq, closure_algorithm):
+    actual_rpq = rpq(
+        default_graph, PythonRegex("a*|b"), closure_algorithm=closure_algorithm
+    )
+
+    assert actual_rpq == nodes_rpq
+
+
 @pytest.fixture
 def empty_graph():
     return nx.empty_graph(create_using=nx.MultiDiGraph)
@@ -47,9 +77,10 @@ def acyclic_graph():
         ("b*", {0}, {5, 4}, {(0, 5), (0, 4)}),
     ],
 )
-def test_query(default_graph, pattern, start_nodes, final_nodes, expected_rpq):
+@pytest.mark.parametrize("mode", ["closure", "bfs", "lazy"])
+def test_query(default_graph, pattern, start_nodes, final_nodes, expected_rpq, mode):
     regex = PythonRegex(pattern)
-    actual_rpq = rpq(default_graph, regex, start_nodes, final_nodes)
+    actual_rpq = rpq(default_graph, regex, start_nodes, final_nodes, mode=mode)
 
     assert actual_rpq == expected_rpq
 
@@ -78,3 +109,179 @@ def test_some_different_labels_query(default_graph):
 def test_empty_graph_empty_query(empty_graph):
     actual_rpq = rpq(empty_graph, PythonRegex(""))
     assert actual_rpq == set()
+
+
+@pytest.fixture
+def sparse_ids_graph():
+    graph = nx.MultiDiGraph()
+    graph.add_edges_from(
+        [
+            (10, 30, {"label": "a"}),
+            (30, 50, {"label": "b"}),
+            (50, 10, {"label": "a"}),
+            (50, 70, {"label": "b"}),
+        ]
+    )
+    return graph
+
+
+@pytest.mark.parametrize("mode", ["closure", "bfs", "lazy"])
+def test_node_ids(sparse_ids_graph, mode):
+    actual_rpq = rpq(sparse_ids_graph, Regex("a b"), mode=mode)
+    assert actual_rpq == {(10, 50)}
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_bfs_matches_closure(backend):
+    graph = generate_two_cycles_graph(20, 15, ("a", "b"))
+    regex = Regex("a a* b | b b")
+    start_nodes = {0, 5, 21}
+
+    expected = rpq(graph, regex, start_nodes, mode="closure")
+    actual = rpq(graph, regex, start_nodes, backend=backend, mode="bfs")
+
+    assert actual == expected
+    assert rpq(graph, regex, {0}) == rpq(graph, regex, {0}, mode="closure")
+
+
+def test_unknown_mode(default_graph):
+    with pytest.raises(ValueError):
+        rpq(default_graph, Regex("a"), mode="unknown")
+
+
+@pytest.mark.parametrize("mode", ["closure", "bfs"])
+def test_prepared_matrices(default_graph, tmp_path, mode):
+    BooleanMatrices.from_automaton(graph_to_nfa(default_graph)).save(tmp_path)
+    graph_bm = BooleanMatrices.load(tmp_path, backend="csr")
+    regex = Regex("a* b")
+
+    assert rpq(graph_bm, regex, mode=mode) == rpq(default_graph, regex, mode=mode)
+    assert rpq(graph_bm, regex, {0, 4}, {5}, mode=mode) == rpq(
+        default_graph, regex, {0, 4}, {5}, mode=mode
+    )
+    with pytest.raises(ValueError):
+        rpq(graph_bm, regex, {100}, mode=mode)
+
+
+def test_auto_mode_uses_statistics(default_graph, nodes_rpq, monkeypatch):
+    graph_bm = BooleanMatrices.from_automaton(graph_to_nfa(default_graph))
+    monkeypatch.setattr(sys.modules["project.rpq"], "LAZY_MIN_PRODUCT_EDGES", 0)
+    assert rpq(graph_bm, PythonRegex("a*|b")) == nodes_rpq
+    assert graph_bm._statistics is not None
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [("a.c", False), ("a|c", True), ("c*", False), ("a*.b", True)],
+)
+def test_accepts_nonempty_word(pattern, expected):
+    query_bm = BooleanMatrices.from_automaton(regex_to_min_dfa(Regex(pattern)))
+    assert accepts_nonempty_word(query_bm, {"a", "b"}) == expected
+
+
+def test_missing_required_label(default_graph):
+    assert rpq(default_graph, Regex("a.c")) == set()
+    graph_bm = BooleanMatrices.from_automaton(graph_to_nfa(default_graph))
+    assert rpq(graph_bm, Regex("a.c"), mode="closure") == set()
+    assert rpq(graph_bm, Regex("(a.c)|b"), mode="closure") == {
+        (0, 4),
+        (4, 5),
+        (5, 0),
+    }
+
+
+@pytest.mark.parametrize("mode", ["auto", "closure", "bfs", "lazy"])
+def test_max_length(default_graph, mode):
+    query = Regex("a*")
+    cycle = [(0, 1), (1, 2), (2, 3), (3, 0)]
+    assert rpq(default_graph, query, mode=mode, max_length=0) == set()
+    assert rpq(default_graph, query, mode=mode, max_length=1) == set(cycle)
+    assert rpq(default_graph, query, mode=mode, max_length=2) == set(cycle) | {
+        (0, 2),
+        (1, 3),
+        (2, 0),
+        (3, 1),
+    }
+    assert rpq(default_graph, query, mode=mode, max_length=10) == rpq(
+        default_graph, query
+    )
+    assert rpq(
+        default_graph, Regex("a.b"), start_nodes={3}, mode=mode, max_length=2
+    ) == {(3, 4)}
+
+
+def test_max_length_skips_closure(default_graph):
+    graph_bm = BooleanMatrices.from_automaton(graph_to_nfa(default_graph))
+    query_bm = BooleanMatrices.from_automaton(regex_to_min_dfa(Regex("a*")))
+    product = graph_bm.intersect(query_bm)
+    assert get_reachable(product, query_bm, max_length=1) == {
+        (0, 1),
+        (1, 2),
+        (2, 3),
+        (3, 0),
+    }
+    assert product.closure_iterations == 1
+    with pytest.raises(ValueError):
+        rpq(default_graph, Regex("a*"), max_length=-1)
+
+
+@pytest.mark.parametrize("mode", ["closure", "bfs", "lazy"])
+@pytest.mark.parametrize("backend", available_backends())
+def test_rpq_iter(default_graph, nodes_rpq, mode, backend):
+    pairs = list(
+        rpq_iter(
+            default_graph, PythonRegex("a*|b"), backend=backend, mode=mode, chunk_size=3
+        )
+    )
+    assert len(pairs) == len(nodes_rpq)
+    assert set(pairs) == nodes_rpq
+
+
+@pytest.mark.parametrize("mode", ["closure", "bfs", "lazy"])
+def test_rpq_iter_limit(default_graph, nodes_rpq, mode):
+    pairs = list(rpq_iter(default_graph, PythonRegex("a*|b"), mode=mode, limit=5))
+    assert len(pairs) == 5
+    assert set(pairs) <= nodes_rpq
+    assert list(rpq_iter(default_graph, PythonRegex("a*|b"), limit=0)) == []
+
+
+@pytest.mark.parametrize("closure_algorithm", ["squaring", "scc"])
+def test_iter_reachable_chunks(default_graph, closure_algorithm):
+    graph_bm = BooleanMatrices.from_automaton(graph_to_nfa(default_graph))
+    query_bm = BooleanMatrices.from_automaton(regex_to_min_dfa(Regex("a*")))
+    product = graph_bm.intersect(query_bm)
+    chunks = list(iter_reachable(product, query_bm, closure_algorithm, chunk_size=3))
+    assert all(chunk.shape[1] == 2 and 0 < chunk.shape[0] <= 3 for chunk in chunks)
+    pairs = [tuple(pair) for chunk in chunks for pair in chunk.tolist()]
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == get_reachable(product, query_bm, closure_algorithm)
+    with pytest.raises(ValueError):
+        next(iter_reachable(product, query_bm, chunk_size=0))
+
+
+@pytest.mark.parametrize("merge", [True, False])
+def test_rpq_batch(default_graph, merge):
+    queries = {
+        "star": Regex("a*"),
+        "same": Regex("(a)*"),
+        "python": PythonRegex("a*|b"),
+        "missing": Regex("a.c"),
+        "mixed": Regex("a.b*"),
+    }
+    results = rpq_batch(default_graph, queries, merge=merge)
+    assert results.keys() == queries.keys()
+    for query_id, query in queries.items():
+        assert results[query_id] == rpq(default_graph, query)
+
+
+@pytest.mark.parametrize("merge", [True, False])
+def test_rpq_batch_options(default_graph, merge):
+    queries = [Regex("a*"), Regex("b.a")]
+    results = rpq_batch(
+        default_graph, queries, start_nodes={0, 5}, max_length=2, merge=merge
+    )
+    assert results == {
+        0: rpq(default_graph, queries[0], start_nodes={0, 5}, max_length=2),
+        1: rpq(default_graph, queries[1], start_nodes={0, 5}, max_length=2),
+    }
+    assert rpq_batch(default_graph, [], merge=merge) == {}
@@ -0,0 +1,102 @@
+import networkx as nx
+import pytest
+from pyformlang.regular_expression import Regex
+
+from project import (
+    BooleanMatrices,
+    generate_two_cycles_graph,
+    graph_to_nfa,
+    regex_to_min_dfa,
+    rpq,
+    rpq_exists,
+    rpq_witnesses,
+)
+
+
+@pytest.fixture
+def default_graph():
+    return generate_two_cycles_graph(3, 2, ("a", "b"))
+
+
+def check_witness(graph, query, source, target, path):
+    assert path[0][0] == source and path[-1][2] == target
+    for (u, label, v), (next_u, _, _) in zip(path, path[1:] + [(target, None, None)]):
+        assert v == next_u
+        assert any(data["label"] == label for data in graph[u][v].values())
+    assert regex_to_min_dfa(query).accepts([label for _, label, _ in path])
+
+
+@pytest.mark.parametrize("query", ["a*", "a.b", "a.a*.b.b*", "b*.a", "(a|b).b"])
+def test_rpq_exists(default_graph, query):
+    query = Regex(query)
+    expected = rpq(default_graph, query)
+    for source in default_graph.nodes:
+        for target in default_graph.nodes:
+            assert rpq_exists(default_graph, query, source, target) == (
+                (source, target) in expected
+            )
+
+
+@pytest.mark.parametrize("query", ["a*", "a.a*.b.b*", "(a|b).b"])
+def test_witness(default_graph, query):
+    query = Regex(query)
+    expected = rpq(default_graph, query)
+    for source in default_graph.nodes:
+        for target in default_graph.nodes:
+            path = rpq_exists(default_graph, query, source, target, witness=True)
+            assert (path is not None) == ((source, target) in expected)
+            if path is not None:
+                check_witness(default_graph, query, source, target, path)
+                shorter = rpq(
+                    default_graph,
+                    query,
+                    start_nodes={source},
+                    max_length=len(path) - 1,
+                )
+                assert (source, target) not in shorter
+
+
+def test_nonempty_path():
+    graph = nx.MultiDiGraph()
+    graph.add_edge(0, 1, label="a")
+    assert not rpq_exists(graph, Regex("a*"), 0, 0)
+    graph.add_edge(1, 0, label="a")
+    assert rpq_exists(graph, Regex("a*"), 0, 0, witness=True) == [
+        (0, "a", 1),
+        (1, "a", 0),
+    ]
+
+
+def test_prepared_matrices(default_graph):
+    bm = BooleanMatrices.from_automaton(graph_to_nfa(default_graph), "csr")
+    assert rpq_exists(bm, Regex("a.b"), 3, 4)
+    assert not rpq_exists(bm, Regex("c"), 0, 1)
+    with pytest.raises(ValueError):
+        rpq_exists(bm, Regex("a"), 0, 10)
+
+
+@pytest.mark.parametrize("query", ["a*", "a.a*.b.b*", "b*.a", "(a|b).b"])
+def test_rpq_witnesses(default_graph, query):
+    query = Regex(query)
+    expected = rpq(default_graph, query)
+    pairs = [(u, v) for u in default_graph.nodes for v in default_graph.nodes]
+    witnesses = rpq_witnesses(default_graph, query, pairs)
+    assert witnesses.keys() == set(pairs)
+    for (source, target), path in witnesses.items():
+        assert (path is not None) == ((source, target) in expected)
+        if path is not None:
+            check_witness(default_graph, query, source, target, path)
+            assert len(path) == len(
+                rpq_exists(default_graph, query, source, target, witness=True)
+            )
+
+
+def test_rpq_witnesses_selected_pairs(default_graph):
+    witnesses = rpq_witnesses(default_graph, Regex("a*.b"), [(1, 4), (4, 1)])
+    assert witnesses == {
+        (1, 4): [(1, "a", 2), (2, "a", 3), (3, "a", 0), (0, "b", 4)],
+        (4, 1): None,
+    }
+    assert rpq_witnesses(default_graph, Regex("a"), []) == {}
+    with pytest.raises(ValueError):
+        rpq_witnesses(default_graph, Regex("a"), [(0, 10)])
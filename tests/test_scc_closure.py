@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from project import available_backends, condensed_closure, get_backend
+
+
+def closure_pairs(n, edges):
+    reachable = {(u, v) for u, v in edges}
+    while True:
+        extended = reachable | {
+            (u, w) for u, v in reachable for x, w in reachable if v == x
+        }
+        if extended == reachable:
+            return reachable
+        reachable = extended
+
+
+@pytest.fixture
+def edges():
+    # two cycles joined by a bridge, a chain and an isolated self-loop
+    return [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 3), (4, 5), (5, 6), (7, 7)]
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_matches_naive_closure(edges, backend):
+    ops = get_backend(backend)
+    rows, cols = zip(*edges)
+    tc = condensed_closure(ops.from_coords(rows, cols, (9, 9)), ops)
+
+    expected = closure_pairs(9, edges)
+    actual_rows, actual_cols = tc.nonzero()
+    assert set(zip(actual_rows.tolist(), actual_cols.tolist())) == expected
+    assert tc.nnz == len(expected)
+    assert all(tc[u, v] == ((u, v) in expected) for u in range(9) for v in range(9))
+
+
+def test_nonzero_between(edges):
+    ops = get_backend("csr")
+    rows, cols = zip(*edges)
+    tc = condensed_closure(ops.from_coords(rows, cols, (9, 9)), ops)
+    row_mask = np.isin(np.arange(9), [1, 5, 8])
+    col_mask = np.isin(np.arange(9), [0, 6])
+
+    actual_rows, actual_cols = tc.nonzero_between(row_mask, col_mask)
+
+    assert set(zip(actual_rows.tolist(), actual_cols.tolist())) == {
+        (1, 0),
+        (1, 6),
+        (5, 6),
+    }
+
+
+def test_long_chain_of_components():
+    ops = get_backend("csr")
+    n = 2000
+    rows = np.concatenate((np.arange(n - 1), np.arange(1, n, 2)))
+    cols = np.concatenate((np.arange(1, n), np.arange(0, n - 1, 2)))
+    tc = condensed_closure(ops.from_coords(rows, cols, (n, n)), ops)
+
+    assert tc.reach.shape == (n // 2, n // 2)
+    assert tc.nnz == sum(2 * (n - 2 * i) for i in range(n // 2))
@@ -0,0 +1,137 @@
+import networkx as nx
+import numpy as np
+import pytest
+from pyformlang.regular_expression import Regex
+from scipy import sparse
+
+from project import (
+    BooleanMatrices,
+    BoundedSemiring,
+    COUNT_LIMIT,
+    CountingSemiring,
+    MinPlusSemiring,
+    generate_two_cycles_graph,
+    get_semiring,
+    graph_to_nfa,
+    rpq,
+    rpq_values,
+)
+
+
+@pytest.fixture
+def diamond():
+    graph = nx.MultiDiGraph()
+    graph.add_edges_from(
+        [
+            (0, 1, {"label": "a"}),
+            (0, 2, {"label": "a"}),
+            (1, 3, {"label": "b"}),
+            (2, 3, {"label": "b"}),
+            (3, 4, {"label": "b"}),
+            (0, 3, {"label": "b"}),
+        ]
+    )
+    return graph
+
+
+def adjacency(semiring, edges, n):
+    rows, cols = zip(*edges)
+    return semiring.adjacency(
+        [sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), (n, n))]
+    )
+
+
+def test_counting_closure():
+    semiring = CountingSemiring()
+    closure = semiring.closure(
+        adjacency(semiring, [(0, 1), (0, 2), (1, 3), (2, 3), (3, 4)], 5)
+    ).toarray()
+    assert closure[0, 3] == 2
+    assert closure[0, 4] == 2
+    assert closure[1, 4] == 1
+    assert closure[4, 0] == 0
+
+
+def test_counting_saturates_on_cycles():
+    semiring = CountingSemiring()
+    closure = semiring.closure(adjacency(semiring, [(0, 1), (1, 2), (2, 1)], 4))
+    closure = closure.toarray()
+    assert closure[0, 1] == COUNT_LIMIT
+    assert closure[1, 1] == COUNT_LIMIT
+    assert closure[3].sum() == 0
+    limited = CountingSemiring(limit=3)
+    edges = [(0, 1), (0, 2), (0, 3), (1, 4), (2, 4), (3, 4)]
+    assert limited.closure(adjacency(limited, edges, 5))[0, 4] == 3
+
+
+def test_min_plus_closure():
+    semiring = MinPlusSemiring()
+    edges = [(0, 1), (1, 2), (2, 3), (0, 3), (3, 0)]
+    closure = semiring.closure(adjacency(semiring, edges, 4)).toarray()
+    assert closure[0, 3] == 1
+    assert closure[1, 3] == 2
+    assert closure[0, 0] == 2
+    assert closure[1, 0] == 3
+
+
+def test_bounded_closure():
+    semiring = BoundedSemiring(2)
+    closure = semiring.closure(adjacency(semiring, [(0, 1), (1, 2), (2, 3)], 4))
+    assert closure[0, 2] == 2
+    assert closure[0, 3] == 0
+    with pytest.raises(ValueError):
+        BoundedSemiring(0)
+
+
+def test_sources():
+    semiring = MinPlusSemiring()
+    matrix = adjacency(semiring, [(0, 1), (1, 2), (2, 0)], 3)
+    closure = semiring.closure(matrix, np.array([2]))
+    assert closure.shape == (1, 3)
+    assert closure.toarray().tolist() == [[1, 2, 3]]
+
+
+def test_get_semiring():
+    assert isinstance(get_semiring("shortest"), MinPlusSemiring)
+    semiring = BoundedSemiring(3)
+    assert get_semiring(semiring) is semiring
+    with pytest.raises(ValueError):
+        get_semiring("tropical")
+
+
+def test_weighted_closure_matches_transitive_closure():
+    bm = BooleanMatrices.from_automaton(
+        graph_to_nfa(generate_two_cycles_graph(3, 2, ("a", "b")))
+    )
+    expected = set(zip(*bm.matrix_backend.nonzero(bm.transitive_closure())))
+    for semiring in ("boolean", "count", "shortest"):
+        closure = bm.weighted_closure(semiring)
+        assert set(zip(*closure.nonzero())) == expected
+
+
+def test_rpq_values(diamond):
+    query = Regex("a.b*")
+    counts = rpq_values(diamond, query, "count")
+    lengths = rpq_values(diamond, query, "shortest")
+    assert counts.keys() == lengths.keys() == rpq(diamond, query)
+    assert counts[(0, 3)] == 2
+    assert counts[(0, 4)] == 2
+    assert lengths[(0, 1)] == 1
+    assert lengths[(0, 4)] == 3
+    assert rpq_values(diamond, query, BoundedSemiring(2)) == {
+        (0, 1): 1,
+        (0, 2): 1,
+        (0, 3): 2,
+    }
+
+
+def test_rpq_values_shortest_prefers_short_paths(diamond):
+    lengths = rpq_values(diamond, Regex("(a.b|b).b*"), "shortest")
+    assert lengths[(0, 3)] == 1
+    assert lengths[(0, 4)] == 2
+
+
+def test_rpq_values_start_nodes(diamond):
+    counts = rpq_values(diamond, Regex("b*"), "count", start_nodes={1})
+    assert counts == {(1, 3): 1, (1, 4): 1}
+    assert rpq_values(diamond, Regex("c"), "count") == {}
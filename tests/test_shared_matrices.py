@@ -0,0 +1,106 @@
+import multiprocessing
+
+import pytest
+from pyformlang.cfg import CFG
+from pyformlang.regular_expression import Regex
+
+from project import (
+    BooleanMatrices,
+    SharedMatrixPool,
+    attach,
+    available_backends,
+    generate_two_cycles_graph,
+    graph_to_nfa,
+    matrix_cfpq,
+    rpq,
+    tensor,
+    tensor_cfpq,
+)
+
+
+@pytest.fixture
+def graph():
+    return generate_two_cycles_graph(3, 2, ("a", "b"))
+
+
+@pytest.fixture
+def pool():
+    with SharedMatrixPool() as pool:
+        yield pool
+
+
+def shared_rpq(handle, regex):
+    with attach(handle, "csr") as bm:
+        return rpq(bm, Regex(regex))
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_attach(graph, pool, backend):
+    bm = BooleanMatrices.from_automaton(graph_to_nfa(graph))
+    handle = pool.publish(bm)
+    with attach(handle, backend) as attached:
+        assert attached.num_states == bm.num_states
+        assert attached.bool_matrices.keys() == bm.bool_matrices.keys()
+        for label, matrix in bm.bool_matrices.items():
+            assert sorted(zip(*attached.matrix_backend.nonzero(matrix))) == sorted(
+                zip(*bm.matrix_backend.nonzero(matrix))
+            )
+
+
+def test_attached_csr_is_read_only_view(graph, pool):
+    handle = pool.publish(BooleanMatrices.from_automaton(graph_to_nfa(graph)))
+    attached = attach(handle, "csr")
+    matrix = next(iter(attached.matrices.bool_matrices.values()))
+    assert not matrix.indices.flags.writeable
+    attached.detach()
+    assert attached.matrices is None
+    assert not attached.closed
+    del matrix
+    assert attached.closed
+
+
+def test_attach_defaults_to_zero_copy(pool):
+    ring = generate_two_cycles_graph(100, 99, ("a", "b"))
+    bm = BooleanMatrices.from_automaton(graph_to_nfa(ring), backend="csr")
+    attached = attach(pool.publish(bm))
+    assert attached.matrices.storage == "csr"
+    assert not attached.closed
+    attached.detach()
+    copied = attach(pool.publish(bm), "bitset")
+    assert copied.matrices.storage == "bitset"
+    assert copied.closed
+
+
+def test_queries_on_attached(graph, pool):
+    handle = pool.publish(BooleanMatrices.from_automaton(graph_to_nfa(graph)))
+    cfg = CFG.from_text("S -> a S b | a b")
+    with attach(handle) as bm:
+        assert rpq(bm, Regex("a*")) == rpq(graph, Regex("a*"))
+        assert matrix_cfpq(bm, cfg) == matrix_cfpq(graph, cfg)
+        assert tensor_cfpq(bm, cfg) == tensor_cfpq(graph, cfg)
+
+
+def test_tensor_keeps_shared_matrices(graph, pool):
+    handle = pool.publish(BooleanMatrices.from_automaton(graph_to_nfa(graph)))
+    with attach(handle) as bm:
+        tensor(bm, CFG.from_text("S -> a S b | a b"))
+        assert set(bm.bool_matrices) == {"a", "b"}
+
+
+def test_workers(graph, pool):
+    handle = pool.publish(BooleanMatrices.from_automaton(graph_to_nfa(graph)))
+    regexes = ["a*", "a.b", "b*", "a*.b*"]
+    with multiprocessing.get_context("fork").Pool(2) as workers:
+        results = workers.starmap(shared_rpq, [(handle, regex) for regex in regexes])
+    assert results == [rpq(graph, Regex(regex)) for regex in regexes]
+
+
+def test_release(graph, pool):
+    handle = pool.publish(BooleanMatrices.from_automaton(graph_to_nfa(graph)))
+    assert len(pool) == 1
+    pool.release(handle)
+    assert len(pool) == 0
+    with pytest.raises(ValueError):
+        pool.release(handle)
+    with pytest.raises(FileNotFoundError):
+        attach(handle)
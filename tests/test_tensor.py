@@ -2,7 +2,7 @@ import pytest
 from cfpq_data import labeled_cycle_graph
 from pyformlang.cfg import CFG
 
-from project import tensor, generate_two_cycles_graph
+from project import tensor, matrix, generate_two_cycles_graph, available_backends
 
 
 @pytest.mark.parametrize(
@@ -76,3 +76,22 @@ from project import tensor, generate_two_cycles_graph
 )
 def test_tensor(cfg, graph, exp_ans):
     assert tensor(graph, CFG.from_text(cfg)) == exp_ans
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_backends(backend):
+    cfg = CFG.from_text("S -> a S b | a b")
+    graph = generate_two_cycles_graph(3, 2, ("a", "b"))
+    expected = tensor(graph, cfg, backend="csr")
+
+    assert {t for t in matrix(graph, cfg, backend=backend) if t[1] == "S"} == {
+        t for t in expected if t[1] == "S"
+    }
+    assert tensor(graph, cfg, backend=backend) == expected
+
+
+def test_labels_missing_from_graph():
+    graph = generate_two_cycles_graph(3, 2, ("a", "b"))
+    assert tensor(graph, CFG.from_text("S -> c S c | c")) == set()
+    cfg = CFG.from_text("S -> a S c | b")
+    assert tensor(graph, cfg) == matrix(graph, cfg)
@@ -0,0 +1,78 @@
+import networkx as nx
+import numpy as np
+import pytest
+from pyformlang.cfg import CFG
+from pyformlang.regular_expression import Regex
+from scipy import sparse
+
+from project import (
+    VERTEX_ORDERS,
+    BooleanMatrices,
+    generate_two_cycles_graph,
+    graph_to_nfa,
+    rpq,
+    tensor,
+    vertex_order,
+)
+
+
+@pytest.fixture
+def scrambled_graph():
+    graph = generate_two_cycles_graph(20, 10, ("a", "b"))
+    nodes = np.random.default_rng(7).permutation(graph.number_of_nodes())
+    return nx.relabel_nodes(graph, dict(enumerate(nodes.tolist())))
+
+
+def bandwidth(matrix) -> int:
+    rows, cols = matrix.nonzero()
+    return int(np.abs(rows - cols).max())
+
+
+@pytest.mark.parametrize("order", VERTEX_ORDERS)
+def test_vertex_order_is_permutation(order):
+    path = sparse.csr_matrix(
+        (np.ones(5, dtype=bool), ([3, 0, 4, 1, 6], [0, 4, 1, 6, 2])), shape=(8, 8)
+    )
+    permutation = vertex_order(path, order)
+    assert sorted(permutation.tolist()) == list(range(8))
+
+
+def test_rcm_reduces_bandwidth(scrambled_graph):
+    bm = BooleanMatrices.from_automaton(graph_to_nfa(scrambled_graph), "csr")
+    reordered = bm.reordered("rcm")
+    assert bandwidth(reordered.adjacency_matrix()) < bandwidth(bm.adjacency_matrix())
+
+
+def test_unknown_order():
+    with pytest.raises(ValueError):
+        vertex_order(sparse.identity(3, format="csr"), "unknown")
+
+
+@pytest.mark.parametrize("order", VERTEX_ORDERS)
+def test_reordered_keeps_states(scrambled_graph, order):
+    bm = BooleanMatrices.from_automaton(graph_to_nfa(scrambled_graph, {0}, {1, 2}))
+    reordered = bm.reordered(order)
+    assert reordered.start_states == bm.start_states
+    assert reordered.final_states == bm.final_states
+    for label, matrix in bm.bool_matrices.items():
+        moved = reordered.bool_matrices[label]
+        for i, j in zip(*matrix.nonzero()):
+            assert moved[
+                reordered.permutation.tolist().index(i),
+                reordered.permutation.tolist().index(j),
+            ]
+        assert moved.nnz == matrix.nnz
+
+
+@pytest.mark.parametrize("order", VERTEX_ORDERS)
+def test_queries_translate_back(scrambled_graph, order):
+    regex = Regex("a* b")
+    assert rpq(scrambled_graph, regex, order=order) == rpq(scrambled_graph, regex)
+    graph_bm = BooleanMatrices.from_automaton(graph_to_nfa(scrambled_graph))
+    assert rpq(graph_bm, regex, {3, 5}, order=order) == rpq(
+        scrambled_graph, regex, {3, 5}
+    )
+
+    graph = generate_two_cycles_graph(3, 2, ("a", "b"))
+    cfg = CFG.from_text("S -> a S b | a b")
+    assert tensor(graph, cfg, order=order) == tensor(graph, cfg)